@@ -1,13 +1,17 @@
 #top=pipe::test_adder
 
 import cocotb
+import random
 from spade import *
 from cocotb.clock import Clock
 from cocotb.triggers import *
+from cocotb.regression import TestFactory
 
-@cocotb.test()
-async def simple_add(dut):
+ADDERS = ["AdderArch::Inferred", "AdderArch::CarrySelect", "AdderArch::Prefix"]
+
+async def simple_add(dut, arch):
     s = SpadeExt(dut)
+    s.i.arch = arch
     clk = dut.clk_i
 
     await cocotb.start(Clock(clk, 10, units='ns').start())
@@ -34,9 +38,9 @@ async def simple_add(dut):
     await FallingEdge(clk)
     s.o.assert_eq("0x0")
 
-@cocotb.test()
-async def simple_sub(dut):
+async def simple_sub(dut, arch):
     s = SpadeExt(dut)
+    s.i.arch = arch
     clk = dut.clk_i
 
     await cocotb.start(Clock(clk, 10, units='ns').start())
@@ -48,9 +52,9 @@ async def simple_sub(dut):
     await FallingEdge(clk)
     s.o.assert_eq("0xffff_ffff_ffff_ffff")
 
-@cocotb.test()
-async def setl(dut):
+async def setl(dut, arch):
     s = SpadeExt(dut)
+    s.i.arch = arch
     clk = dut.clk_i
 
     await cocotb.start(Clock(clk, 10, units='ns').start())
@@ -92,9 +96,9 @@ async def setl(dut):
     await FallingEdge(clk)
     s.o.assert_eq("0")
 
-@cocotb.test()
-async def setlu(dut):
+async def setlu(dut, arch):
     s = SpadeExt(dut)
+    s.i.arch = arch
     clk = dut.clk_i
 
     await cocotb.start(Clock(clk, 10, units='ns').start())
@@ -120,3 +124,39 @@ async def setlu(dut):
     s.i.y = "0x1"
     await FallingEdge(clk)
     s.o.assert_eq("0")
+
+async def random_add(dut, arch):
+    """Compare against python for random operands, with extra weight on the carry boundaries"""
+    s = SpadeExt(dut)
+    s.i.arch = arch
+    clk = dut.clk_i
+
+    await cocotb.start(Clock(clk, 10, units='ns').start())
+    await FallingEdge(clk)
+
+    mask = 0xffff_ffff_ffff_ffff
+    interesting = [0, 1, 0xffff_ffff, 0x1_0000_0000, 0x7fff_ffff_ffff_ffff, 0x8000_0000_0000_0000, mask]
+    rng = random.Random(0x4300)
+
+    s.i.mode = "ExMode::Add64"
+    for _ in range(200):
+        x = rng.choice(interesting + [rng.getrandbits(64)] * 4)
+        y = rng.choice(interesting + [rng.getrandbits(64)] * 4)
+        s.i.x = hex(x)
+        s.i.y = hex(y)
+        await FallingEdge(clk)
+        s.o.assert_eq(hex((x + y) & mask))
+
+    s.i.mode = "ExMode::Sub64"
+    for _ in range(200):
+        x = rng.choice(interesting + [rng.getrandbits(64)] * 4)
+        y = rng.choice(interesting + [rng.getrandbits(64)] * 4)
+        s.i.x = hex(x)
+        s.i.y = hex(y)
+        await FallingEdge(clk)
+        s.o.assert_eq(hex((x - y) & mask))
+
+for test in [simple_add, simple_sub, setl, setlu, random_add]:
+    factory = TestFactory(test)
+    factory.add_option("arch", ADDERS)
+    factory.generate_tests()
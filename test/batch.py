@@ -0,0 +1,39 @@
+#top=batch::batch
+
+import cocotb
+from spade import *
+from cocotb.triggers import *
+
+from tb.asm import assemble
+from tb.batch import Batch, Program
+
+
+def store_program(k):
+    program = assemble(f'''
+        lui   $2, 0xa000
+        lui   $7, {k}
+        ori   $7, $7, {0x1000 + k}
+        sw    $7, {0x40 + 4 * k}($2)
+    ''' + "nop\n" * 5)
+
+    # each program gets a different amount of dcache to preload, so they
+    # finish at different times
+    image = program.image(data=[(0x00010000, bytes(16 * (k + 1)))])
+
+    return Program(f"store{k}", image.icache, image.dcache, cycles=50, until=lambda writes: True)
+
+@cocotb.test()
+async def batch_stores(dut):
+    """More programs than cpus, each has to end up with its own write"""
+    b = Batch(dut)
+    assert len(b.lanes) > 1, "batch top has a single cpu"
+
+    programs = [store_program(k) for k in range(3 * len(b.lanes) + 1)]
+    results = await b.run(programs)
+
+    for k, result in enumerate(results):
+        dut._log.info(f"{result}")
+        assert result.name == f"store{k}"
+        assert result.writes == [(0x40 + 4 * k, (k << 16) | (0x1000 + k))], f"{result}"
+
+    assert len({result.lane for result in results}) == len(b.lanes)
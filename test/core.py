@@ -1,10 +1,21 @@
-#top=cpu
+#top=test_cpu
+
+import os
+import struct
 
 import cocotb
 from spade import *
 from cocotb.clock import Clock
 from cocotb.triggers import *
 
+from tb import ROOT, activity, checkpoint, coverage
+from tb.asm import assemble
+from tb.clock import CLOCKS, two_phase
+from tb.lockstep import Lockstep, Mismatch, write_trace
+from tb.mmio import BASE_HI, Host, external_data
+from tb.profiler import Profiler
+from tb.ringlog import log, logged
+
 class Core:
     def __init__(self, dut):
         self.dut = dut
@@ -14,6 +25,7 @@ class Core:
 
         self.phase1 = dut.phase1_i
         self.phase2 = dut.phase2_i
+        self.clock_running = False
 
     def next_pc(self):
         try:
@@ -29,31 +41,36 @@ class Core:
             return None
         addr = int(self.o.external.addr.value())
         size = 1 + int(self.o.external.size.value())
-        mask = (1 << size * 8) - 1
         data = int(self.o.external.data.value())
-        return (addr, data & mask)
-
-    async def start(self, icache, dcache):
-        phase1 = self.phase1
-        phase2 = self.phase2
-        async def custom_clock():
-            # pre-construct triggers for performance
-            time = Timer(10, units="ps")
-            await Timer(5, units="ps")
-            while True:
-                phase1.value = 1
-                phase2.value = 0
-                await time
-                phase1.value = 0
-                phase2.value = 1
-                await time
-
-        await cocotb.start(custom_clock())
+        return (addr, external_data(addr, size, data))
+
+    async def start(self, icache, dcache, warm=True):
+        # start can be called again to reset the cpu within a test
+        if not self.clock_running:
+            await cocotb.start(two_phase(self.phase1, self.phase2))
+            self.clock_running = True
+
+        # Reset and preloading take a cycle per cache line, so the state after
+        # them is saved and restored next time the same program is loaded.
+        # Not with coverage on, as restoring would reset the counters
+        path = None
+        if warm and checkpoint.ENABLED and not coverage.ENABLED:
+            path = checkpoint.path_for("test_cpu", icache, dcache)
+            if os.path.exists(path):
+                await self.clock()
+                try:
+                    await checkpoint.restore(self.dut, path, skip=CLOCKS)
+                    self.i.rst = "false"
+                    return
+                except checkpoint.StaleCheckpoint as e:
+                    self.dut._log.warning(f"{e}, doing a full reset")
 
         # reset
         self.i.rst = True
         self.i.icache_write = "None"
         self.i.dcache_write = "None"
+        self.i.coverage_bin = "None"
+        self.i.activity_bin = "None"
 
         for _ in range(3):
             await self.clock()
@@ -63,7 +80,7 @@ class Core:
         for addr, data in icache:
             index = (addr >> 3) & 0x7ff
             tag = (addr >> 12) & 0xfffff
-            self.dut._log.info(f"writing {hex(addr)} to icache")
+            log("writing {:x} to icache", addr)
 
             self.i.icache_write = f"Some(({index}, {tag}, {data}))"
             await self.clock()
@@ -82,6 +99,9 @@ class Core:
         for _ in range(5):
             await self.clock()
 
+        if path is not None:
+            await checkpoint.save(self.dut, path, skip=CLOCKS)
+
         self.i.rst = "false"
 
     async def halfclock(self):
@@ -90,72 +110,445 @@ class Core:
     async def clock(self):
         await RisingEdge(self.phase2)
 
-def rtype(op, rs, rt, rd, sh, func):
-    assert func <= 0x3f
-    return (op << 26) | (rs << 21) | (rt << 16) | (rd << 11) | (sh << 6) | func
+@cocotb.test()
+@logged
+async def core_external_write(dut):
+    c = Core(dut)
 
-def itype(op, rs, rt, imm):
-    assert imm <= 0xffff
-    return (op << 26) | (rs << 21) | (rt << 16) | (imm)
+    image = assemble('''
+        lui   $2, 0xa000
+        lui   $7, 0xdead
+        ori   $7, $7, 0xbeef
+        sw    $7, 0x44($2)
+        nop
+        nop
+        nop
+        nop
+        nop
+    ''').image(data=[(0x00010000, bytes(0x100))])
 
-def jtype(op, addr):
-    return (op << 26) | addr
+    await c.start(image.icache, image.dcache)
 
-def balways(pc, offset):
-    offset = (offset >> 2) & 0xffff
-    return itype(1, 0, 1, offset)
+    for _ in range(20):
+        await c.clock()
+        log("pc: {:x}, {}", c.next_pc(), c.o.external.value())
+        write = c.external_write()
+        if write is not None:
+            addr, data = write
+            assert addr == 0x00000044, f"addr: {hex(addr)}"
+            assert data == 0xdeadbeef, f"data: {hex(data)}"
+            return
 
-def nop(num=0):
-    # addi $zero, $zero, num
-    return itype(9, 0, 0, num)
+    assert False, "no write"
 
-def lui(rt, imm):
-    assert imm < 0x10000
-    return itype(0b001111, 0, rt, imm)
+@cocotb.test()
+@logged
+async def core_data_shared_line(dut):
+    """Two data ranges in the same dcache line both get loaded"""
+    c = Core(dut)
+
+    image = assemble('''
+            lui   $2, 0xa000
+            lui   $5, 0x0001
+            lw    $7, 0($5)
+            lw    $8, 4($5)
+            nop
+            sw    $7, 0x40($2)
+            sw    $8, 0x44($2)
+        end:
+            b     end
+            nop
+    ''').image(data=[(0x00010000, b"\x11" * 4), (0x00010004, b"\x22" * 4)])
+
+    await c.start(image.icache, image.dcache)
+
+    expected = [(0x40, 0x11111111), (0x44, 0x22222222)]
+    writes = []
+    for _ in range(40):
+        await c.clock()
+        log("pc: {:x}, {}", c.next_pc(), c.status())
+        write = c.external_write()
+        if write is not None:
+            writes.append(write)
+            if len(writes) == len(expected):
+                break
 
-def ori(rt, rs, imm):
-    assert imm < 0x10000
-    return itype(0b001101, rs, rt, imm)
+    assert writes == expected, [(hex(addr), hex(data)) for addr, data in writes]
 
-def li(rt, imm):
-    return ori(rt, 0, imm)
+@cocotb.test()
+@logged
+async def core_mmio(dut):
+    """Console output and reports are collected, and the test ends on the exit store"""
+    c = Core(dut)
 
-def lwi(rd, imm):
-    return [lui(rd, imm >> 16), ori(rd, rd, imm & 0xffff)]
+    image = assemble(f'''
+            lui   $30, {BASE_HI:#x}
+            li    $1, 10
+            li    $2, 0
+        loop:
+            addu  $2, $2, $1
+            addiu $1, $1, -1
+            bne   $1, $zero, loop
+            nop
+            sd    $2, 0x10($30)
+            li    $3, 0x6f6b        # "ok"
+            srl   $4, $3, 8
+            sb    $4, 8($30)
+            sb    $3, 8($30)
+            li    $5, 7
+            sw    $5, 0($30)
+        end:
+            b     end
+            nop
+    ''').image()
+
+    await c.start(image.icache, image.dcache)
+
+    host = Host(c.o)
+    code = await host.run(c.clock, cycles=200)
+    log("exit after {} cycles", host.cycles)
+
+    assert code == 7, f"exit code: {code}"
+    assert host.console == "ok", f"console: {host.console!r}"
+    assert host.reports == [55], f"reports: {host.reports}"
 
 @cocotb.test()
-async def core_external_write(dut):
+@logged
+async def core_float(dut):
+    """FPU results written back through the regfile, and the instructions waiting on them"""
     c = Core(dut)
 
-    prog = [
-        lui(2, 0xa000),
-        lui(7, 0xdead),
-        ori(7, 7, 0xbeef),
-        itype(0b101011, 2, 7, 0x0044), # sw $r7, 0x44($r2)
-        nop(),
-        nop(),
-        nop(),
-        nop(),
-        nop(),
+    image = assemble('''
+            lui    $2, 0xa000
+            lui    $3, 0x3ff8
+            dsll32 $3, $3, 0
+            dmtc1  $3, $f0          # 1.5
+            lui    $4, 0x4004
+            dsll32 $4, $4, 0
+            dmtc1  $4, $f1          # 2.5
+            mul.d  $f2, $f0, $f1    # 3.75
+            add.d  $f3, $f2, $f0    # 5.25, has to wait for the multiply
+            sdc1   $f3, 0x40($2)    # and this for the add
+            cvt.s.d $f4, $f3
+            swc1   $f4, 0x4c($2)
+            lui    $5, 0x0001
+            ldc1   $f5, 0($5)       # 0.5, from the dcache
+            nop
+            add.d  $f6, $f5, $f5
+            sdc1   $f6, 0x50($2)
+            c.lt.d $f0, $f1
+            bc1t   less
+            nop
+            sw     $0, 0x5c($2)
+        less:
+            li     $7, 1
+            sw     $7, 0x5c($2)
+        end:
+            b      end
+            nop
+    ''').image(data=[(0x00010000, struct.pack(">d", 0.5) + bytes(0xf8))])
+
+    await c.start(image.icache, image.dcache)
+
+    expected = [
+        (0x40, 0x4015000000000000),
+        (0x4c, 0x40a80000),
+        (0x50, 0x3ff0000000000000),
+        (0x5c, 1),
     ]
+    writes = []
+    for _ in range(100):
+        await c.clock()
+        log("pc: {:x}, {}", c.next_pc(), c.status())
+        write = c.external_write()
+        if write is not None:
+            writes.append(write)
+            if len(writes) == len(expected):
+                break
 
-    if len(prog) % 2:
-        prog.append(nop())
+    assert writes == expected, [(hex(addr), hex(data)) for addr, data in writes]
 
-    # pack into 64-bit words
-    icache = [(0xbfc00000 + i * 4, prog[i] << 32 | (prog[i+1])) for i in range(0, len(prog), 2)]
-    dcache = [(0x00010000 + i, 0) for i in range(0, 0x100, 16)]
+@cocotb.test()
+@logged
+async def core_float_convert(dut):
+    """A conversion doesn't read ft, so it doesn't wait for a pending $f0"""
+    c = Core(dut)
 
-    await c.start(icache, dcache)
+    image = assemble('''
+            lui    $3, 0x3ff8
+            dsll32 $3, $3, 0
+            dmtc1  $3, $f1
+            mul.d  $f0, $f1, $f1
+            cvt.s.d $f4, $f1
+            nop
+        end:
+            b      end
+            nop
+    ''').image()
+
+    await c.start(image.icache, image.dcache)
+
+    statuses = []
+    for _ in range(30):
+        await c.clock()
+        log("pc: {:x}, {}", c.next_pc(), c.status())
+        statuses.append(c.status())
 
-    for _ in range(20):
+    assert "Stall(MultiCycleInterlock())" not in statuses, statuses
+
+@cocotb.test()
+@logged
+async def core_float_overtake(dut):
+    """The cvt is done while add.d stalls on it, ahead of the mtc1 still in DC,
+    and has to win over it both as add.d's operand and in $f2"""
+    c = Core(dut)
+
+    image = assemble('''
+            lui    $2, 0xa000
+            lui    $3, 0x3fe0
+            dsll32 $3, $3, 0
+            dmtc1  $3, $f6          # 0.5
+            li     $8, 3
+            mtc1   $8, $f2
+            cvt.d.w $f2, $f2        # 3.0
+            add.d  $f4, $f2, $f6    # 3.5
+            sdc1   $f4, 0x40($2)
+            sdc1   $f2, 0x48($2)
+        end:
+            b      end
+            nop
+    ''').image()
+
+    await c.start(image.icache, image.dcache)
+
+    expected = [
+        (0x40, 0x400c000000000000),
+        (0x48, 0x4008000000000000),
+    ]
+    writes = []
+    for _ in range(60):
         await c.clock()
-        dut._log.info(f"pc: {hex(c.next_pc())}, {c.o.external.value()}")
+        log("pc: {:x}, {}", c.next_pc(), c.status())
         write = c.external_write()
         if write is not None:
-            addr, data = write
-            assert addr == 0x00000044, f"addr: {hex(addr)}"
-            assert data == 0xdeadbeef, f"data: {hex(data)}"
-            return
+            writes.append(write)
+            if len(writes) == len(expected):
+                break
+
+    assert writes == expected, [(hex(addr), hex(data)) for addr, data in writes]
+
+@cocotb.test(skip=not checkpoint.ENABLED or coverage.ENABLED)
+async def core_checkpoint(dut):
+    """A restored checkpoint has to run exactly like a cold reset"""
+    image = assemble('''
+        lui   $2, 0xa000
+        lui   $7, 0x1234
+        ori   $7, $7, 0x5678
+        sw    $7, 0x48($2)
+        lw    $8, 0x48($2)
+        nop
+        sw    $8, 0x4c($2)
+        nop
+        nop
+        nop
+    ''').image(data=[(0x00010000, bytes(0x100))])
 
-    assert False, "no write"
+    c = Core(dut)
+
+    async def run(warm):
+        await c.start(image.icache, image.dcache, warm=warm)
+        trace = []
+        for _ in range(20):
+            await c.clock()
+            trace.append((c.next_pc(), c.status(), c.external_write()))
+        return trace
+
+    cold = await run(False)
+    # The first warm start saves a checkpoint (unless an earlier run did), the second restores it
+    await run(True)
+    restored = await run(True)
+
+    assert any(write is not None for _, _, write in cold), "no write"
+    for cycle, (a, b) in enumerate(zip(cold, restored)):
+        assert a == b, f"cycle {cycle}: {a} after reset, {b} after restore"
+
+@cocotb.test()
+async def profile_loop(dut):
+    """Nearly every cycle of a counting loop belongs to its three instructions"""
+    c = Core(dut)
+
+    program = assemble('''
+            li    $1, 20
+        loop:
+            addiu $1, $1, -1
+            bne   $1, $zero, loop
+            nop
+        end:
+            b     end
+            nop
+            nop
+            nop
+    ''')
+    image = program.image()
+
+    await c.start(image.icache, image.dcache)
+
+    symbols = {0xffffffff_00000000 | addr: name for name, addr in program.labels.items()}
+    profile = Profiler(symbols={0xffffffff_bfc00000: "start", **symbols})
+    for _ in range(100):
+        await c.clock()
+        profile.sample(c.next_pc(), c.status())
+
+    dut._log.info("\n" + profile.report(top=10))
+    profile.write(os.path.join(ROOT, "build", "profile", "core_loop"))
+
+    cycles = {pc: n for pc, n, _ in profile.histogram()}
+    for pc in [0xffffffffbfc00004, 0xffffffffbfc00008, 0xffffffffbfc0000c]:
+        assert cycles.get(pc, 0) >= 20, f"{pc:x} only got {cycles.get(pc, 0)} cycles"
+
+@cocotb.test()
+async def activity_loop(dut):
+    """The fetch buffer and the regfile port enables have to save accesses on a counting loop"""
+    c = Core(dut)
+
+    image = assemble('''
+            li    $1, 20
+        loop:
+            addiu $1, $1, -1
+            bne   $1, $zero, loop
+            nop
+        end:
+            b     end
+            nop
+            nop
+            nop
+    ''').image()
+
+    await c.start(image.icache, image.dcache)
+    for _ in range(100):
+        await c.clock()
+
+    counts = await activity.collect(c.s, c.clock, "core_loop")
+    dut._log.info("\n" + activity.report(counts))
+
+    bank_reads = sum(counts[f"icache_bank{b}_read"] for b in range(4))
+    # counted from the end of reset, which may or may not include the cycle rst went low
+    assert counts["cycles"] in (100, 101), f"{counts['cycles']} cycles"
+    # The loop body is three instructions over two 64-bit words, so two reads per iteration
+    assert 0 < bank_reads < counts["icache_fetch"], f"{bank_reads} reads for {counts['icache_fetch']} fetches"
+    assert counts["icache_bank0_write"] == 0, "preloading counted"
+    # bne gets $1 bypassed from addiu, and $zero is never read
+    port_reads = counts["regfile_rs_read"] + counts["regfile_rt_read"]
+    assert port_reads < counts["regfile_operand_cycles"], f"{port_reads} port reads"
+    assert counts["regfile_write"] > 0
+    assert counts["dcache_tag_read"] == 0 and counts["dcache_tag_write"] == 0
+    assert counts["dcache_dirty_write"] == 0
+
+@cocotb.test()
+async def activity_stores(dut):
+    """Cached stores with a load right behind each, none of which wait for the dcache"""
+    c = Core(dut)
+
+    image = assemble('''
+            lui   $2, 0xa000
+            lui   $5, 0x0001
+            li    $1, 16
+            li    $9, 0
+        loop:
+            sw    $1, 0($5)
+            lw    $6, 0($5)
+            sb    $1, 8($5)
+            lbu   $7, 8($5)
+            addu  $9, $9, $6
+            addu  $9, $9, $7
+            addiu $1, $1, -1
+            bne   $1, $zero, loop
+            addiu $5, $5, 16        # a line per iteration
+            sw    $9, 0x40($2)
+        end:
+            b     end
+            nop
+    ''').image(data=[(0x00010000, bytes(0x100))])
+
+    await c.start(image.icache, image.dcache)
+
+    statuses = []
+    write = None
+    for cycle in range(300):
+        await c.clock()
+        statuses.append(c.status())
+        write = c.external_write()
+        if write is not None:
+            break
+
+    counts = await activity.collect(c.s, c.clock, "core_stores")
+    dut._log.info(f"sum written after {cycle + 1} cycles\n" + activity.report(counts))
+
+    # 2 * (16 + 15 + ... + 1), read back from the lines just stored to
+    assert write == (0x40, 272), write
+    assert "Stall(DataCacheBusy())" not in statuses, statuses
+    # Two stores per iteration, all to lines in bank 0
+    assert counts["dcache_bank0_write"] == 32, counts["dcache_bank0_write"]
+    assert counts["dcache_bank1_write"] == 0
+
+@cocotb.test()
+async def lockstep_trace(dut):
+    """Runs against a hand written trace, then against one with a wrong value in it"""
+    image = assemble('''
+        lui   $2, 0xa000
+        lui   $7, 0xdead
+        ori   $7, $7, 0xbeef
+        sw    $7, 0x44($2)
+        nop
+        b     .
+        nop
+        nop
+    ''').image(data=[(0x00010000, bytes(0x100))])
+
+    base = 0xffffffff_bfc00000
+    records = [
+        (base + 0x00, 2, 0xffffffff_a0000000),
+        (base + 0x04, 7, 0xffffffff_dead0000),
+        (base + 0x08, 7, 0xffffffff_deadbeef),
+        (base + 0x0c, 0, 0),
+        (base + 0x10, 0, 0),
+    ]
+    # then round the branch and its delay slot
+    records += [(base + 0x14 + 4 * (i % 2), 0, 0) for i in range(8)]
+
+    directory = os.path.join(ROOT, "build", "lockstep")
+    os.makedirs(directory, exist_ok=True)
+    good = os.path.join(directory, "core_good.bin")
+    bad = os.path.join(directory, "core_bad.bin")
+    write_trace(good, records)
+    write_trace(bad, records[:2] + [(base + 0x08, 7, 0xffffffff_deadbeee)] + records[3:])
+
+    c = Core(dut)
+
+    async def run(path):
+        await c.start(image.icache, image.dcache)
+        lockstep = Lockstep(path)
+        for _ in range(50):
+            await c.clock()
+            lockstep.sample(c.o.probe)
+            if lockstep.done():
+                return lockstep
+        assert False, f"only got to record {lockstep.index} of {len(lockstep)}"
+
+    await run(good)
+
+    try:
+        await run(bad)
+    except Mismatch as e:
+        dut._log.info(f"{e}")
+        assert "mismatch at record 2" in str(e)
+    else:
+        assert False, "the bad trace passed"
+
+@cocotb.test(skip=not coverage.ENABLED)
+async def collect_coverage(dut):
+    """Reads back the coverage counters from all the tests above, so this has to stay last"""
+    c = Core(dut)
+    await c.start([], [])
+
+    await coverage.collect(c.s, c.clock, "cpu")
@@ -47,8 +47,11 @@ class DCache:
         await FallingEdge(self.clk)
         self.i.read_en = False
 
-    async def write(self, data):
-        self.i.write = some(data)
+    def store(self, index, data, bytes=0xff):
+        return some(f"DWrite$(index: {index}, data: {data}, bytes: {bytes})")
+
+    async def write(self, index, data, bytes=0xff):
+        self.i.write = self.store(index, data, bytes)
         await FallingEdge(self.clk)
         self.i.write = none()
 
@@ -89,7 +92,7 @@ async def dcache_write(dut):
     # overwrite it
     await s.read(0x18)
     s.o.busy.assert_eq("false")
-    await s.write("0xaa00aa00bb00cc")
+    await s.write(0x18, "0xaa00aa00bb00cc")
     s.o.busy.assert_eq("true")
 
     await FallingEdge(clk)
@@ -104,3 +107,57 @@ async def dcache_write(dut):
 
     await s.read(0x19)
     s.o.assert_eq("DResult$(data: 0xdead8888beefcafe, tag: DTag$(tag: 0xcab77, valid: true, dirty: true), busy: false)")
+
+@cocotb.test()
+async def dcache_write_bytes(dut):
+    """Stores only write their own bytes, and a read of the same line in the same cycle sees them"""
+    s = DCache(dut)
+    clk = await s.start()
+
+    await s.fill(0x18 >> 1, 0xcab77, "0xcafefeeddead8888beefcafe")
+    await FallingEdge(clk)
+
+    # the bottom two bytes, without reading the line first
+    await s.write(0x19, "0x1234", bytes=0b00000011)
+    await FallingEdge(clk)
+
+    await s.read(0x19)
+    s.o.assert_eq("DResult$(data: 0xdead8888beef1234, tag: DTag$(tag: 0xcab77, valid: true, dirty: true), busy: false)")
+    await s.read(0x18)
+    s.o.data.assert_eq("0xcafefeed")
+
+    # The top four bytes, while reading them back
+    s.i.write = s.store(0x19, "0x11223344_00000000", bytes=0b11110000)
+    s.i.index = 0x19
+    s.i.read_en = True
+    await FallingEdge(clk)
+    s.i.write = none()
+    s.i.read_en = False
+    s.o.data.assert_eq("0x11223344beef1234")
+    s.o.tag.dirty.assert_eq("true")
+
+    # and a store to the other bank doesn't touch this one
+    await s.write(0x119, "0xffffffff_ffffffff")
+    await s.read(0x19)
+    s.o.data.assert_eq("0x11223344beef1234")
+
+@cocotb.test()
+async def dcache_tag_rows(dut):
+    """Four lines share a tag row, filling or storing to one leaves the others alone"""
+    s = DCache(dut)
+    clk = await s.start()
+
+    # lines 0x1c-0x1f of bank 0 are one row, 0x11c is in the other bank
+    for line in range(0x1c, 0x20):
+        await s.fill(line, 0xa0000 + line, line)
+    await s.fill(0x11c, 0xbbbbb, 0)
+    await FallingEdge(clk)
+
+    await s.write(0x3d, "0x77")
+    await FallingEdge(clk)
+
+    for line in range(0x1c, 0x20):
+        await s.read(line << 1 | 1)
+        dirty = "true" if line == 0x1e else "false"
+        data = 0x77 if line == 0x1e else line
+        s.o.assert_eq(f"DResult$(data: {data}, tag: DTag$(tag: {0xa0000 + line}, valid: true, dirty: {dirty}), busy: false)")
@@ -0,0 +1,248 @@
+#top=fpu::fpu_test
+
+import cocotb
+from spade import *
+from cocotb.clock import Clock
+from cocotb.triggers import *
+
+import numpy as np
+
+# fmt -> (numpy float, bits, default NaN)
+FLOATS = {
+    "FloatFormat::Single": (np.float32, np.uint32, 0x7fbfffff),
+    "FloatFormat::Double": (np.float64, np.uint64, 0x7ff7ffff_ffffffff),
+}
+INTEGERS = {"FloatFormat::Word": (np.int32, np.uint32), "FloatFormat::Long": (np.int64, np.uint64)}
+ROUND_MODES = ["RoundMode::Nearest", "RoundMode::Zero", "RoundMode::Up", "RoundMode::Down"]
+ROUND = [np.rint, np.trunc, np.ceil, np.floor]
+
+
+# numpy model of the FPU: IEEE with denormals flushed to zero and default NaNs
+
+def flush(fmt, bits):
+    ftype, utype, nan = FLOATS[fmt]
+    values = bits.astype(utype).view(ftype)
+    tiny = (values != 0) & (np.abs(values) < np.finfo(ftype).tiny)
+    values = np.where(tiny, np.copysign(ftype(0), values), values)
+    return np.where(np.isnan(values), np.uint64(nan), values.view(utype).astype(np.uint64))
+
+def floats(fmt, bits):
+    ftype, utype, _ = FLOATS[fmt]
+    return flush(fmt, bits).astype(utype).view(ftype)
+
+def integers(fmt, bits):
+    itype, utype = INTEGERS[fmt]
+    return bits.astype(utype).view(itype)
+
+def arith(op, fmt, a, b):
+    with np.errstate(all="ignore"):
+        result = op(floats(fmt, a), floats(fmt, b))
+    return flush(fmt, result.view(FLOATS[fmt][1]).astype(np.uint64))
+
+def to_float(to, fmt, a):
+    ftype, utype, _ = FLOATS[to]
+    source = floats(fmt, a) if fmt in FLOATS else integers(fmt, a)
+    with np.errstate(all="ignore"):
+        result = source.astype(ftype)
+    return flush(to, result.view(utype).astype(np.uint64))
+
+def to_integer(to, rm, fmt, a):
+    itype, utype = INTEGERS[to]
+    low = float(np.iinfo(itype).min)
+    with np.errstate(all="ignore"):
+        rounded = ROUND[rm](floats(fmt, a).astype(np.float64))
+        valid = ~np.isnan(rounded) & (rounded >= low) & (rounded < -low)
+        result = np.where(valid, rounded, 0).astype(itype).view(utype).astype(np.uint64)
+    # Invalid conversions give the largest positive integer
+    return np.where(valid, result, np.uint64(np.iinfo(itype).max))
+
+def compare(fmt, cond, a, b):
+    x, y = floats(fmt, a), floats(fmt, b)
+    unordered = np.isnan(x) | np.isnan(y)
+    return (((cond & 1) != 0) & unordered) | (((cond & 2) != 0) & (x == y)) | (((cond & 4) != 0) & (x < y))
+
+
+def random_floats(rng, fmt, n):
+    """Mostly exponents close to 1.0, so operations interact, and some from the whole range"""
+    if fmt == "FloatFormat::Single":
+        frac_bits, exp_max, bias = 23, 0xff, 127
+    else:
+        frac_bits, exp_max, bias = 52, 0x7ff, 1023
+    sign = rng.integers(0, 2, n, dtype=np.uint64)
+    exp = np.where(rng.random(n) < 0.8,
+                   rng.integers(bias - 28, bias + 28, n, dtype=np.uint64),
+                   rng.integers(0, exp_max + 1, n, dtype=np.uint64))
+    frac = rng.integers(0, 1 << frac_bits, n, dtype=np.uint64)
+    return (sign << np.uint64(frac_bits + (exp_max.bit_length()))) | (exp << np.uint64(frac_bits)) | frac
+
+def random_integers(rng, fmt, n):
+    # All magnitudes, not just huge ones
+    values = rng.integers(0, 1 << 63, n, dtype=np.uint64) >> rng.integers(0, 63, n, dtype=np.uint64)
+    values = np.where(rng.random(n) < 0.5, ~values + np.uint64(1), values)
+    return values & np.uint64(0xffffffff) if fmt == "FloatFormat::Word" else values
+
+
+async def run(dut, op, fmt, a, b, fcsr=0x01000000):
+    """Streams a and b through the fpu, returns the results"""
+    s = SpadeExt(dut)
+    clk = dut.clk_i
+
+    s.i.op = op
+    s.i.fmt = fmt
+    s.i.fcsr = hex(fcsr)
+    a_strs = [hex(v) for v in a.tolist()]
+    b_strs = [hex(v) for v in b.tolist()]
+    results = [0] * len(a_strs)
+    for i in range(len(a_strs)):
+        s.i.a = a_strs[i]
+        s.i.b = b_strs[i]
+        await FallingEdge(clk)
+        results[i] = int(s.o.value())
+    return np.array(results, dtype=np.uint64)
+
+def check(failures, name, a, b, got, expected):
+    for i in np.nonzero(got != expected)[0][:10]:
+        failures.append(f"{name} a: {int(a[i]):#x} b: {int(b[i]):#x} "
+                        f"result: {int(got[i]):#x}, expected: {int(expected[i]):#x}")
+
+
+@cocotb.test()
+async def fpu_arith(dut):
+    """Add, sub and mul, bit exact against numpy"""
+    await cocotb.start(Clock(dut.clk_i, 10, units='ns').start())
+
+    n = 1000
+    rng = np.random.default_rng(0x4300)
+    failures = []
+    for fmt in FLOATS:
+        sign = np.uint64(0x80000000 if fmt == "FloatFormat::Single" else 0x80000000_00000000)
+        a = random_floats(rng, fmt, n)
+        b = random_floats(rng, fmt, n)
+        # plenty of x - x and x + -x, which cancel completely
+        b = np.where(rng.random(n) < 0.1, a ^ sign, b)
+
+        for op, model in [("FloatOp::Add", np.add), ("FloatOp::Sub", np.subtract), ("FloatOp::Mul", np.multiply)]:
+            got = await run(dut, op, fmt, a, b)
+            check(failures, f"{op} {fmt}", a, b, got, arith(model, fmt, a, b))
+
+    for failure in failures:
+        dut._log.error(failure)
+    assert not failures
+
+@cocotb.test()
+async def fpu_special(dut):
+    s = SpadeExt(dut)
+    clk = dut.clk_i
+    await cocotb.start(Clock(clk, 10, units='ns').start())
+
+    s.i.fcsr = "0x01000000"
+    s.i.fmt = "FloatFormat::Double"
+    for op, a, b, expected in [
+        # inf - inf and 0 * inf are invalid
+        ("FloatOp::Sub", 0x7ff00000_00000000, 0x7ff00000_00000000, 0x7ff7ffff_ffffffff),
+        ("FloatOp::Mul", 0x00000000_00000000, 0xfff00000_00000000, 0x7ff7ffff_ffffffff),
+        # -0 + -0 is -0, but 1 - 1 is +0
+        ("FloatOp::Add", 0x80000000_00000000, 0x80000000_00000000, 0x80000000_00000000),
+        ("FloatOp::Sub", 0x3ff00000_00000000, 0x3ff00000_00000000, 0x00000000_00000000),
+        # A denormal input is zero
+        ("FloatOp::Add", 0x00000000_00000001, 0x80000000_00000000, 0x00000000_00000000),
+        # Overflow
+        ("FloatOp::Mul", 0x7fe00000_00000000, 0x40000000_00000000, 0x7ff00000_00000000),
+    ]:
+        s.i.op = op
+        s.i.a = hex(a)
+        s.i.b = hex(b)
+        await FallingEdge(clk)
+        assert int(s.o.value()) == expected, f"{op} {a:#x} {b:#x}: {int(s.o.value()):#x}"
+
+    # Round towards zero doesn't overflow to infinity
+    s.i.fcsr = "0x01000001"
+    s.i.op = "FloatOp::Mul"
+    s.i.a = hex(0x7fe00000_00000000)
+    s.i.b = hex(0x40000000_00000000)
+    await FallingEdge(clk)
+    s.o.assert_eq("0x7fefffff_ffffffff")
+
+@cocotb.test()
+async def fpu_convert(dut):
+    await cocotb.start(Clock(dut.clk_i, 10, units='ns').start())
+
+    n = 500
+    rng = np.random.default_rng(0x4301)
+    failures = []
+    zeros = np.zeros(n, dtype=np.uint64)
+
+    for fmt in FLOATS:
+        a = random_floats(rng, fmt, n)
+        # Around the integer limits, and lots of halves for the rounding modes
+        a = np.where(rng.random(n) < 0.3, flush(fmt, np.array(
+            rng.choice([0.5, 1.5, 2.5, -0.5, -1.5, 2.0**31 - 0.5, -2.0**31, 2.0**31, 2.0**63, -2.0**63], n),
+            dtype=FLOATS[fmt][0]).view(FLOATS[fmt][1]).astype(np.uint64)), a)
+
+        for to in FLOATS:
+            if to != fmt:
+                got = await run(dut, f"FloatOp::Convert({to}, None)", fmt, a, zeros)
+                check(failures, f"cvt {to} {fmt}", a, zeros, got, to_float(to, fmt, a))
+
+        for to in INTEGERS:
+            for rm, mode in enumerate(ROUND_MODES):
+                got = await run(dut, f"FloatOp::Convert({to}, Some({mode}))", fmt, a, zeros)
+                check(failures, f"{mode} {to} {fmt}", a, zeros, got, to_integer(to, rm, fmt, a))
+            # CVT.W/CVT.L use the rounding mode in FCR31
+            got = await run(dut, f"FloatOp::Convert({to}, None)", fmt, a, zeros, fcsr=0x01000003)
+            check(failures, f"cvt {to} {fmt}", a, zeros, got, to_integer(to, 3, fmt, a))
+
+    for fmt in INTEGERS:
+        a = random_integers(rng, fmt, n)
+        for to in FLOATS:
+            got = await run(dut, f"FloatOp::Convert({to}, None)", fmt, a, zeros)
+            check(failures, f"cvt {to} {fmt}", a, zeros, got, to_float(to, fmt, a))
+
+    for failure in failures:
+        dut._log.error(failure)
+    assert not failures
+
+@cocotb.test()
+async def fpu_compare(dut):
+    await cocotb.start(Clock(dut.clk_i, 10, units='ns').start())
+
+    n = 200
+    rng = np.random.default_rng(0x4302)
+    failures = []
+    for fmt in FLOATS:
+        a = random_floats(rng, fmt, n)
+        b = np.where(rng.random(n) < 0.2, a, random_floats(rng, fmt, n))
+        for cond in range(16):
+            got = await run(dut, f"FloatOp::Compare({cond})", fmt, a, b)
+            check(failures, f"c.{cond} {fmt}", a, b, got, compare(fmt, cond, a, b).astype(np.uint64))
+
+    for failure in failures:
+        dut._log.error(failure)
+    assert not failures
+
+@cocotb.test()
+async def fpu_moves(dut):
+    s = SpadeExt(dut)
+    clk = dut.clk_i
+    await cocotb.start(Clock(clk, 10, units='ns').start())
+
+    s.i.fcsr = "0x01800002"
+    s.i.a = "0xffffffff_bf800000"
+    s.i.b = "0x12345678_9abcdef0"
+    for op, fmt, expected in [
+        ("FloatOp::Mov", "FloatFormat::Single", "0xbf800000"),
+        ("FloatOp::Abs", "FloatFormat::Single", "0x3f800000"),
+        ("FloatOp::Neg", "FloatFormat::Single", "0x3f800000"),
+        ("FloatOp::Abs", "FloatFormat::Double", "0x7fffffff_bf800000"),
+        ("FloatOp::Neg", "FloatFormat::Double", "0x7fffffff_bf800000"),
+        ("FloatOp::MoveTo", "FloatFormat::Long", "0x9abcdef0"),
+        ("FloatOp::MoveTo64", "FloatFormat::Long", "0x12345678_9abcdef0"),
+        ("FloatOp::MoveFrom", "FloatFormat::Long", "0xffffffff_bf800000"),
+        ("FloatOp::MoveFrom64", "FloatFormat::Long", "0xffffffff_bf800000"),
+        # fpu_test reads FCR31
+        ("FloatOp::ControlFrom", "FloatFormat::Long", "0x01800002"),
+    ]:
+        s.i.op = op
+        s.i.fmt = fmt
+        await FallingEdge(clk)
+        assert int(s.o.value()) == int(expected.replace("_", ""), 16), f"{op} {fmt}: {int(s.o.value()):#x}"
@@ -5,6 +5,10 @@ from spade import *
 from cocotb.clock import Clock
 from cocotb.triggers import *
 
+import numpy as np
+from tb.memmask import MemMasks, random_u64
+from tb.ringlog import log, logged
+
 def bitmask(size, align = None):
     mask = ((1 << (size + 1) * 8) - 1)
 
@@ -13,6 +17,7 @@ def bitmask(size, align = None):
     return mask
 
 @cocotb.test()
+@logged
 async def mask_masking(dut):
     s = SpadeExt(dut)
     clk = dut.clk_i
@@ -22,7 +27,7 @@ async def mask_masking(dut):
     # iterate though all possible sizes and alignments
     for size in range(8):
         for align in range(8 - size):
-            dut._log.info(f"size: {size+1}, align: {align}")
+            log("size: {}, align: {}", size + 1, align)
             s.i.mask = f"MemMask({size}, {align})"
             s.i.mode = "MaskTestMode::Size"
 
@@ -33,15 +38,16 @@ async def mask_masking(dut):
             expected_byte_mask = ((1 << (size + 1)) - 1) << (align)
             await FallingEdge(clk)
             assert bin(int(s.o.value())) == bin(expected_byte_mask)
-            dut._log.info(f"byte_mask: {int(s.o.value()):08b}, expected: {expected_byte_mask:08b}")
+            log("byte_mask: {:08b}, expected: {:08b}", int(s.o.value()), expected_byte_mask)
 
             s.i.mode = "MaskTestMode::BitMask"
             expected_bit_mask = bitmask(size, align)
             await FallingEdge(clk)
-            dut._log.info(f"bit_mask: {int(s.o.value()):016x}, expected: {expected_bit_mask:016x}")
+            log("bit_mask: {:016x}, expected: {:016x}", int(s.o.value()), expected_bit_mask)
             assert hex(int(s.o.value())) == hex(expected_bit_mask)
 
 @cocotb.test()
+@logged
 async def mask_clear(dut):
     s = SpadeExt(dut)
     clk = dut.clk_i
@@ -52,7 +58,7 @@ async def mask_clear(dut):
     # iterate though all possible sizes and alignments
     for size in range(8):
         for align in range(8 - size):
-            dut._log.info(f"size: {size+1}, align: {align}")
+            log("size: {}, align: {}", size + 1, align)
 
             s.i.mask = f"MemMask({size}, {align})"
             s.i.mode = "MaskTestMode::Clear"
@@ -60,10 +66,11 @@ async def mask_clear(dut):
             expected = 0x1122334455667788 & ~(mask)
 
             await FallingEdge(clk)
-            dut._log.info(f"result: {int(s.o.value()):016x}, expected: {expected:016x}, mask: {mask:016x}")
+            log("result: {:016x}, expected: {:016x}, mask: {:016x}", int(s.o.value()), expected, mask)
             assert hex(int(s.o.value())) == hex(expected)
 
 @cocotb.test()
+@logged
 async def mask_extract(dut):
     s = SpadeExt(dut)
     clk = dut.clk_i
@@ -75,7 +82,7 @@ async def mask_extract(dut):
     # iterate though all possible sizes and alignments
     for size in range(8):
         for align in range(8 - size):
-            dut._log.info(f"size: {size+1}, align: {align}")
+            log("size: {}, align: {}", size + 1, align)
             s.i.mask = f"MemMask({size}, {align})"
             mask = bitmask(size)
             shift = ((7 - (align + size)) * 8)
@@ -83,7 +90,7 @@ async def mask_extract(dut):
 
             await FallingEdge(clk)
             assert hex(int(s.o.value())) == hex(expected)
-            dut._log.info(f"result: {int(s.o.value()):016x}, expected: {expected:016x}, shift: {shift}")
+            log("result: {:016x}, expected: {:016x}, shift: {}", int(s.o.value()), expected, shift)
 
 @cocotb.test()
 async def mask_extract_signed(dut):
@@ -114,6 +121,7 @@ async def mask_extract_signed(dut):
 
 
 @cocotb.test()
+@logged
 async def mask_insert(dut):
     s = SpadeExt(dut)
     clk = dut.clk_i
@@ -132,19 +140,20 @@ async def mask_insert(dut):
             expected = (0x1122334455667788 & ~mask) | ((0x0099aabbccddeeff << shift) & mask)
 
             await FallingEdge(clk)
-            dut._log.info(f"size: {size+1}, align: {align}, mask: {mask:016x}, shift: {shift}")
-            dut._log.info(f"result: {int(s.o.value()):016x}, expected: {expected:016x}")
+            log("size: {}, align: {}, mask: {:016x}, shift: {}", size + 1, align, mask, shift)
+            log("result: {:016x}, expected: {:016x}", int(s.o.value()), expected)
             assert hex(int(s.o.value())) == hex(expected)
 
             s.i.mode = "MaskTestMode::InsertAligned"
             expected = (0x1122334455667788 & ~mask) | (0x0099aabbccddeeff & mask)
 
             await FallingEdge(clk)
-            dut._log.info(f"aligned result: {int(s.o.value()):016x}, expected: {expected:016x}")
+            log("aligned result: {:016x}, expected: {:016x}", int(s.o.value()), expected)
             assert hex(int(s.o.value())) == hex(expected)
 
 
 @cocotb.test()
+@logged
 async def mask_bytemux(dut):
     s = SpadeExt(dut)
     clk = dut.clk_i
@@ -162,11 +171,12 @@ async def mask_bytemux(dut):
             expected = (0x1122334455667788 & ~mask) | (0x0099aabbccddeeff & mask)
 
             await FallingEdge(clk)
-            dut._log.info(f"size: {size+1}, align: {align}, mask: {mask:016x}")
-            dut._log.info(f"aligned result: {int(s.o.value()):016x}, expected: {expected:016x}")
+            log("size: {}, align: {}, mask: {:016x}", size + 1, align, mask)
+            log("aligned result: {:016x}, expected: {:016x}", int(s.o.value()), expected)
             assert hex(int(s.o.value())) == hex(expected)
 
 @cocotb.test()
+@logged
 async def mask_bytemux2(dut):
     s = SpadeExt(dut)
     clk = dut.clk_i
@@ -184,6 +194,64 @@ async def mask_bytemux2(dut):
             expected = (0x1122334455667788 & ~mask) | (0x0099aabbccddeeff & mask)
 
             await FallingEdge(clk)
-            dut._log.info(f"size: {size+1}, align: {align}, mask: {mask:016x}")
-            dut._log.info(f"aligned result: {int(s.o.value()):016x}, expected: {expected:016x}")
+            log("size: {}, align: {}, mask: {:016x}", size + 1, align, mask)
+            log("aligned result: {:016x}, expected: {:016x}", int(s.o.value()), expected)
             assert hex(int(s.o.value())) == hex(expected)
+
+# mode -> numpy model of what mask_test outputs
+MODES = {
+    "MaskTestMode::BitMask": lambda m, a, b: m.bit_mask(),
+    "MaskTestMode::ByteMask": lambda m, a, b: m.mask(),
+    "MaskTestMode::Size": lambda m, a, b: m.size_bytes(),
+    "MaskTestMode::Clear": lambda m, a, b: m.clear(a),
+    "MaskTestMode::Insert": lambda m, a, b: m.insert(a, b),
+    "MaskTestMode::InsertAligned": lambda m, a, b: m.insert_aligned(a, b),
+    "MaskTestMode::Extract": lambda m, a, b: m.extract(a, False),
+    "MaskTestMode::ExtractSigned": lambda m, a, b: m.extract(a, True),
+    "MaskTestMode::ByteMux": lambda m, a, b: m.byte_mux(b, a),
+    "MaskTestMode::ByteMux2": lambda m, a, b: m.byte_mux(b, a),
+    "MaskTestMode::Align": lambda m, a, b: m.align_data(b),
+    "MaskTestMode::AlignBytes": lambda m, a, b: m.align_data(b),
+    "MaskTestMode::ByteEnables": lambda m, a, b: m.byte_enables(),
+}
+
+@cocotb.test()
+async def mask_random(dut):
+    """Streams random operands and masks through every mode, then checks them all at once against tb.memmask"""
+    s = SpadeExt(dut)
+    clk = dut.clk_i
+
+    await cocotb.start(Clock(clk, 10, units='ns').start())
+
+    n = 2000
+    rng = np.random.default_rng(0x4300)
+    failures = []
+
+    for mode, model in MODES.items():
+        masks = MemMasks.random(rng, n)
+        a = random_u64(rng, n)
+        b = random_u64(rng, n)
+
+        # Pre-format everything, so the loop only has to drive the simulator
+        mask_strs = [f"MemMask({size}, {align})" for size, align in zip(masks.size.tolist(), masks.align.tolist())]
+        a_strs = [hex(v) for v in a.tolist()]
+        b_strs = [hex(v) for v in b.tolist()]
+        results = [0] * n
+
+        s.i.mode = mode
+        for i in range(n):
+            s.i.mask = mask_strs[i]
+            s.i.a = a_strs[i]
+            s.i.b = b_strs[i]
+            await FallingEdge(clk)
+            results[i] = int(s.o.value())
+
+        got = np.array(results, dtype=np.uint64)
+        expected = model(masks, a, b)
+        for i in np.nonzero(got != expected)[0][:10]:
+            failures.append(f"{mode} {mask_strs[i]} a: {a_strs[i]} b: {b_strs[i]} "
+                            f"result: {int(got[i]):016x}, expected: {int(expected[i]):016x}")
+
+    for failure in failures:
+        dut._log.error(failure)
+    assert not failures
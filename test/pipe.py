@@ -1,10 +1,18 @@
 #top=pipe::test_pipeline
 
+import os
+
 import cocotb
 from spade import *
 from cocotb.clock import Clock
 from cocotb.triggers import *
 
+from tb import ROOT, checkpoint, coverage
+from tb.asm import addiu, balways, branch, ins, itype, li, lui, lwi, nop, ori
+from tb.clock import CLOCKS, two_phase
+from tb.ringlog import log, logged
+from tb.timeline import Timeline
+
 class Pipeline:
     def __init__(self, dut):
         self.dut = dut
@@ -14,6 +22,7 @@ class Pipeline:
 
         self.phase1 = dut.phase1_i
         self.phase2 = dut.phase2_i
+        self.clock_running = False
 
     def set_inst(self, inst, tag=None, valid=True):
         if tag is None:
@@ -44,6 +53,12 @@ class Pipeline:
         except:
             return 0
 
+    def write_index(self):
+        return int(self.o.write_index.value(), 10)
+
+    def write_bytes(self):
+        return int(self.o.write_bytes.value(), 10)
+
     def index(self):
         try:
             return int(self.o.index.value(), 10)
@@ -57,21 +72,24 @@ class Pipeline:
         return self.o.fetch_en.value() == "true"
 
     async def start(self):
-        phase1 = self.phase1
-        phase2 = self.phase2
-        async def custom_clock():
-            # pre-construct triggers for performance
-            time = Timer(10, units="ps")
-            await Timer(5, units="ps")
-            while True:
-                phase1.value = 1
-                phase2.value = 0
-                await time
-                phase1.value = 0
-                phase2.value = 1
-                await time
-
-        await cocotb.start(custom_clock())
+        # start can be called again to reset the pipeline within a test
+        if not self.clock_running:
+            await cocotb.start(two_phase(self.phase1, self.phase2))
+            self.clock_running = True
+
+        # Every test starts from the same state after reset, so after the first
+        # one it is restored instead. Not with coverage on, as restoring would
+        # reset the counters
+        path = None
+        if checkpoint.ENABLED and not coverage.ENABLED:
+            path = checkpoint.path_for("test_pipeline")
+            if os.path.exists(path):
+                await self.clock()
+                try:
+                    await checkpoint.restore(self.dut, path, skip=CLOCKS)
+                    return
+                except checkpoint.StaleCheckpoint as e:
+                    self.dut._log.warning(f"{e}, doing a full reset")
 
         # reset
         self.i.rst = "true"
@@ -81,6 +99,7 @@ class Pipeline:
         self.i.data = "0"
         self.i.d_tag = "0"
         self.i.d_valid = "false"
+        self.i.coverage_bin = "None"
         self.set_inst(0)
 
         for _ in range(10):
@@ -89,6 +108,9 @@ class Pipeline:
         self.i.rst = "false"
         await self.clock()
 
+        if path is not None:
+            await checkpoint.save(self.dut, path, skip=CLOCKS)
+
     async def halfclock(self):
         await RisingEdge(self.phase1)
 
@@ -96,42 +118,8 @@ class Pipeline:
         await RisingEdge(self.phase2)
 
 
-def rtype(op, rs, rt, rd, sh, func):
-    assert func <= 0x3f
-    return (op << 26) | (rs << 21) | (rt << 16) | (rd << 11) | (sh << 6) | func
-
-def itype(op, rs, rt, imm):
-    assert imm <= 0xffff
-    return (op << 26) | (rs << 21) | (rt << 16) | (imm)
-
-def jtype(op, addr):
-    return (op << 26) | addr
-
-def balways(pc, offset):
-    offset = (offset >> 2) & 0xffff
-    return itype(1, 0, 1, offset)
-
-def nop(num=0):
-    # addi $zero, $zero, num
-    return itype(9, 0, 0, num)
-
-def lui(rt, imm):
-    assert imm < 0x10000
-    return itype(0b001111, 0, rt, imm)
-
-def ori(rt, rs, imm):
-    assert imm < 0x10000
-    return itype(0b001101, rs, rt, imm)
-
-def li(rt, imm):
-    return ori(rt, 0, imm)
-
-def lwi(rd, imm):
-    return [lui(rd, imm >> 16), ori(rd, rd, imm & 0xffff)]
-
-
-
 @cocotb.test()
+@logged
 async def test_pc(dut):
     """Tests that the pipeline comes out of reset and increments pc"""
     p = Pipeline(dut)
@@ -139,7 +127,7 @@ async def test_pc(dut):
 
     # reset vector
     pc = 0xffffffffbfc00000
-    dut._log.info(f"pc: {p.next_pc():x} index: {p.index()}")
+    log("pc: {:x} index: {}", p.next_pc(), p.index())
 
     assert p.next_pc() == pc
     p.set_inst(0)
@@ -149,10 +137,11 @@ async def test_pc(dut):
         p.set_inst(nop(i))
         pc = p.next_pc() + 4
         await p.clock()
-        dut._log.info(f"pc: {p.next_pc():x} index: {p.index()}")
+        log("pc: {:x} index: {}", p.next_pc(), p.index())
         assert p.next_pc() == pc
 
 @cocotb.test()
+@logged
 async def loop(dut):
     p = Pipeline(dut)
     await p.start()
@@ -170,36 +159,46 @@ async def loop(dut):
         inst = prog[p.index() % len(prog)]
         p.set_inst(inst)
         await p.clock()
-        dut._log.info(f"pc: {p.next_pc():x} index: {p.index():04x}, inst: {inst:08x}")
+        log("pc: {:x} index: {:04x}, inst: {:08x}", p.next_pc(), p.index(), inst)
         assert p.index() < 3
 
 @cocotb.test()
+@logged
 async def long_jump(dut):
     p = Pipeline(dut)
     await p.start()
 
     prog = [
-        itype(0b001111, 0, 15, 0x00cc), # lui $r15, 0x00cc
-        itype(0b001101, 15, 15, 0xbba0), # ori $r15, $r15, 0xbba0
-        rtype(0, 15, 0, 0, 0, 0b001000), # jr $r15
+        ins("lui $r15, 0x00cc"),
+        ins("ori $r15, $r15, 0xbba0"),
+        ins("jr $r15"),
         nop(10),
     ]
 
     for inst in prog:
         p.set_inst(inst)
         await p.clock()
-        dut._log.info(f"pc: {p.next_pc():x} index: {p.index():04x}, inst: {inst:08x}")
+        log("pc: {:x} index: {:04x}, inst: {:08x}", p.next_pc(), p.index(), inst)
 
     if p.next_pc() != 0x00ccbba0:
         raise Exception(f"Expected pc: 0x00ccbba0, found: 0x{p.next_pc():08x}")
 
-async def do_stores(p, prog, dut, loads=dict()):
-    open_row = None
+def merge_bytes(old, data, bytes):
+    """What a store with these byte enables leaves in the octbyte"""
+    mask = sum(0xff << (8 * i) for i in range(8) if bytes >> i & 1)
+    return old & ~mask | data & mask
+
+async def do_stores(p, prog, dut, loads=dict(), timeline=None):
     writes = []
+    p.external_writes = []
+    p.statuses = []
+    # what each octbyte holds after the stores so far
+    contents = {}
 
     timeout = 1000
 
-    for _ in range(1000):
+    for cycle in range(1000):
+        p.cycles = cycle
         # simulate icache reads as completing halfway though the cycle
         if p.phase1.value == 0:
             p.i.ins = 0
@@ -207,41 +206,51 @@ async def do_stores(p, prog, dut, loads=dict()):
 
         pc_index = p.index()
         if pc_index >= len(prog):
-            dut._log.info(f"index: {pc_index:04x}, inst: [end], status: {p.status()}")
+            log("index: {:04x}, inst: [end], status: {}", pc_index, p.status())
             return writes
         inst = prog[pc_index]
 
         p.set_inst(inst)
         await p.clock()
 
-        dut._log.info(f"index: {pc_index:04x}, inst: {inst:08x}, status: {p.status()}")
+        if timeline is not None:
+            timeline.sample(p.next_pc(), p.status(), p.o.probe.value())
 
-        assert p.status() in ["Ok()", "Stall(LoadInterlock())", "Stall(DataCacheBusy())", "ExceptionWB(Reset())"]
+        status = p.status()
+        log("index: {:04x}, inst: {:08x}, status: {}", pc_index, inst, status)
+        p.statuses.append(status)
 
-        if p.is_write():
-            if p.open_row is None:
-                dut._log.info(f"writing: {p.write():x} after row closed")
-            else:
-                dut._log.info(f"writing: {p.write():x} to {p.open_row << 3:x}")
-                writes.append((p.open_row, p.write()))
-                p.open_row = None
-            continue
+        assert status in ["Ok()", "Stall(LoadInterlock())", "Stall(DataCacheBusy())", "ExceptionWB(Reset())"]
 
+        if p.o.external.write == True:
+            p.external_writes.append(int(p.o.external.addr.value()))
+
+        # Stores only send the bytes they write, so merge them into what
+        # the fake dcache holds there, including earlier stores
+        if p.is_write():
+            row = p.write_index()
+            old = contents.get(row, loads.get(row << 3, 0x1122334455667788))
+            data = merge_bytes(old, p.write(), p.write_bytes())
+            contents[row] = data
+            log("writing: {:x} to {:x}", data, row << 3)
+            writes.append((row, data))
+
+        # The read for the next instruction can happen in the same cycle
         index = p.d_index()
 
         if index is not None:
-            dut._log.info(f"opening row {index:x} (addr: {index << 3:x})")
+            log("opening row {:x} (addr: {:x})", index, index << 3)
             try:
                 p.i.data = hex(loads[index << 3])
             except:
                 p.i.data = "0x1122334455667788"
             p.i.d_tag = "0"
             p.i.d_valid = "true"
-            p.open_row = p.d_index()
 
     raise Exception("Timeout")
 
 @cocotb.test()
+@logged
 async def store_word(dut):
     p = Pipeline(dut)
     await p.start()
@@ -249,9 +258,9 @@ async def store_word(dut):
     prog = [
         lui(7, 0xdead),
         ori(7, 7, 0xbeef),
-        itype(0b101011, 0, 7, 0x0044), # sw $r7, 0x44($zero)
+        ins("sw $r7, 0x44($zero)"),
         nop(),
-        itype(0b101011, 0, 7, 0x0268), # sw $r7, 0x268($zero)
+        ins("sw $r7, 0x268($zero)"),
         nop(),
         nop(),
         nop(),
@@ -275,6 +284,7 @@ async def store_word(dut):
     assert data == 0xdeadbeef55667788
 
 @cocotb.test()
+@logged
 async def store_byte(dut):
     p = Pipeline(dut)
     await p.start()
@@ -282,14 +292,14 @@ async def store_byte(dut):
     prog = [
         lui(7, 0xdead),
         ori(7, 7, 0xbeef),
-        itype(0b101000, 0, 7, 0x50), # sb $r7, 0x50($zero)
-        itype(0b101000, 0, 7, 0x51), # sb $r7, 0x51($zero)
-        itype(0b101000, 0, 7, 0x52), # sb $r7, 0x52($zero)
-        itype(0b101000, 0, 7, 0x53), # sb $r7, 0x53($zero)
-        itype(0b101000, 0, 7, 0x54), # sb $r7, 0x54($zero)
-        itype(0b101000, 0, 7, 0x55), # sb $r7, 0x55($zero)
-        itype(0b101000, 0, 7, 0x56), # sb $r7, 0x56($zero)
-        itype(0b101000, 0, 7, 0x57), # sb $r7, 0x57($zero)
+        ins("sb $r7, 0x50($zero)"),
+        ins("sb $r7, 0x51($zero)"),
+        ins("sb $r7, 0x52($zero)"),
+        ins("sb $r7, 0x53($zero)"),
+        ins("sb $r7, 0x54($zero)"),
+        ins("sb $r7, 0x55($zero)"),
+        ins("sb $r7, 0x56($zero)"),
+        ins("sb $r7, 0x57($zero)"),
         nop(),
         nop(),
         nop(),
@@ -299,27 +309,30 @@ async def store_byte(dut):
 
     assert writes, "No write found"
 
+    # each byte lands on top of the ones before it
+    expected = 0x1122334455667788
     for i in range(8):
         row, data = writes[i]
         dut._log.info(f"byte: {i}, data: {data:x}")
 
         mask = 0xff000000_00000000 >> (i * 8)
-        expected = 0x1122334455667788 & ~mask | (0xef000000_00000000 >> (i * 8))
+        expected = expected & ~mask | (0xef000000_00000000 >> (i * 8))
 
         assert row << 3 == 0x50
         assert data == expected
 
 @cocotb.test()
+@logged
 async def load_word(dut):
     p = Pipeline(dut)
     await p.start()
 
     prog = [
         # load a word
-        itype(0b100011, 0, 3, 0x0030), # lw $r3, 0x30($zero)
+        ins("lw $r3, 0x30($zero)"),
         nop(),
         # and store it back
-        itype(0b101011, 0, 3, 0x0074), # sw $r3, 0x74($zero)
+        ins("sw $r3, 0x74($zero)"),
         nop(1),
         nop(2),
         nop(3),
@@ -338,16 +351,17 @@ async def load_word(dut):
 
 
 @cocotb.test()
+@logged
 async def load_word_upper(dut):
     p = Pipeline(dut)
     await p.start()
 
     prog = [
         # load a word
-        itype(0b100011, 0, 3, 0x0034), # lw $r3, 0x34($zero)
+        ins("lw $r3, 0x34($zero)"),
         nop(),
         # and store it back
-        itype(0b101011, 0, 3, 0x0074), # sw $r3, 0x74($zero)
+        ins("sw $r3, 0x74($zero)"),
         nop(1),
         nop(2),
         nop(3),
@@ -365,6 +379,7 @@ async def load_word_upper(dut):
     assert data == 0x11223344fccffccf
 
 @cocotb.test()
+@logged
 async def load_interlock(dut):
     """Same as load_word, but without the nop"""
     p = Pipeline(dut)
@@ -372,9 +387,9 @@ async def load_interlock(dut):
 
     prog = [
         # load a word
-        itype(0b100011, 0, 3, 0x0034), # lw $r3, 0x30($zero)
+        ins("lw $r3, 0x34($zero)"),
         # and store it back
-        itype(0b101011, 0, 3, 0x0074), # sw $r3, 0x74($zero)
+        ins("sw $r3, 0x74($zero)"),
         nop(1),
         nop(2),
         nop(3),
@@ -391,38 +406,32 @@ async def load_interlock(dut):
     assert data & 0xffffffff == 0xfccffccf
 
 @cocotb.test()
-async def dcache_busy(dut):
-    """A load following a store should stall for one cycle"""
+@logged
+async def store_then_load(dut):
+    """Back to back stores and a load right behind them, none of which stall"""
     p = Pipeline(dut)
     await p.start()
 
     prog = [
         # store
         *lwi(3, 0xdeadbeef),
-        itype(0b101011, 0, 3, 0x0074), # sw $r3, 0x74($zero)
+        ins("sw $r3, 0x74($zero)"),
         # back to back stores
-        itype(0b101000, 0, 3, 0x0076), # sb $r3, 0x78($zero)
+        ins("sb $r3, 0x76($zero)"),
         # then a load
-        itype(0b100011, 0, 3, 0x0034), # lw $r3, 0x30($zero)
+        ins("lw $r3, 0x34($zero)"),
         nop(1),
+        nop(2),
+        nop(3),
     ]
 
-    writes = await do_stores(p, prog[:-2], dut)
-    assert writes == []
-    assert p.status() == "Stall(DataCacheBusy())"
-
-    writes = await do_stores(p, prog[:-1], dut)
-    assert writes == [(0x70 >> 3, 0x11223344deadbeef)]
-    assert p.status() == "Stall(DataCacheBusy())"
-
-    # make sure it clears
     writes = await do_stores(p, prog, dut)
-    assert writes == [(0x70 >> 3, 0x112233445566ef88)]
-
-
+    assert writes == [(0x70 >> 3, 0x11223344deadbeef), (0x70 >> 3, 0x11223344deadefef)]
+    assert "Stall(DataCacheBusy())" not in p.statuses, p.statuses
     assert p.status() == "Ok()"
 
 @cocotb.test()
+@logged
 async def store_interlock(dut):
     """Same as store_word, but without the nop"""
 
@@ -432,8 +441,8 @@ async def store_interlock(dut):
     prog = [
         lui(7, 0xdead),
         ori(7, 7, 0xbeef),
-        itype(0b101011, 0, 7, 0x0044), # sw $r7, 0x44($zero)
-        itype(0b101011, 0, 7, 0x0268), # sw $r7, 0x268($zero)
+        ins("sw $r7, 0x44($zero)"),
+        ins("sw $r7, 0x268($zero)"),
         nop(),
         nop(),
         nop(),
@@ -457,6 +466,7 @@ async def store_interlock(dut):
     assert data == 0xdeadbeef55667788
 
 @cocotb.test()
+@logged
 async def bypassing(dut):
     """This test is worth it's weight in gold"""
     p = Pipeline(dut)
@@ -471,20 +481,20 @@ async def bypassing(dut):
         ori(3, 7, 0), # same-cycle regfile write and read
         ori(4, 7, 0), # normal, RS from regfile
         # these stores should all read from regfile
-        itype(0b101011, 0, 1, 0x54), # sw $r1, 0x54($zero)
-        itype(0b101011, 0, 2, 0x64), # sw $r2, 0x64($zero)
-        itype(0b101011, 0, 3, 0x74), # sw $r3, 0x74($zero)
-        itype(0b101011, 0, 4, 0x84), # sw $r4, 0x84($zero)
+        ins("sw $r1, 0x54($zero)"),
+        ins("sw $r2, 0x64($zero)"),
+        ins("sw $r3, 0x74($zero)"),
+        ins("sw $r4, 0x84($zero)"),
         ori(9, 8, 0xbeef),
         # and these stores are bypassing on RT from the ori above
         # bypass RT from EX
-        itype(0b101011, 0, 9, 0x54), # sw $r7, 0x54($zero)
+        ins("sw $r9, 0x54($zero)"),
         # bypass RT from DC
-        itype(0b101011, 0, 9, 0x64), # sw $r7, 0x64($zero)
+        ins("sw $r9, 0x64($zero)"),
         # same-cycle regfile write and read
-        itype(0b101011, 0, 9, 0x74), # sw $r7, 0x74($zero)
+        ins("sw $r9, 0x74($zero)"),
         # normal, RT from regfile
-        itype(0b101011, 0, 9, 0x84), # sw $r7, 0x84($zero)
+        ins("sw $r9, 0x84($zero)"),
         nop(),
         nop(),
         nop(),
@@ -497,14 +507,15 @@ async def bypassing(dut):
         assert data & 0xffffffff == 0xdeadbeef, f"for write {i} Expected 0xdeadbeef, found: {data:x}"
 
 @cocotb.test()
+@logged
 async def icache(dut):
     p = Pipeline(dut)
     await p.start()
 
     jump = [
-        itype(0b001111, 0, 15, 0x2222), # lui $r15, 0x2222
-        itype(0b001101, 15, 15, 0x2220), # ori $r15, $r15, 0x2220
-        rtype(0, 15, 0, 0, 0, 0b001000), # jr $r15
+        ins("lui $r15, 0x2222"),
+        ins("ori $r15, $r15, 0x2220"),
+        ins("jr $r15"),
         nop(10),
     ]
     await do_stores(p, jump, dut)
@@ -513,19 +524,19 @@ async def icache(dut):
     # should stall if invalid
     p.set_inst(nop(0xeee), valid=False)
     await p.clock()
-    dut._log.info(f"pc: {p.next_pc():x}, status: {p.status()}")
+    log("pc: {:x}, status: {}", p.next_pc(), p.status())
     assert p.status() == "Stall(InstructionCacheBusy())"
 
     # valid with correct tag... shouldn't stall
     p.set_inst(nop(0xddd), tag=0x22222, valid=True)
     await p.clock()
-    dut._log.info(f"pc: {p.next_pc():x}, status: {p.status()}")
+    log("pc: {:x}, status: {}", p.next_pc(), p.status())
     assert p.status() == "Ok()"
 
     # valid with incorrect tag... should stall
     p.set_inst(nop(0xccc), tag=0x33333, valid=True)
     await p.clock()
-    dut._log.info(f"pc: {p.next_pc():x}, status: {p.status()}")
+    log("pc: {:x}, status: {}", p.next_pc(), p.status())
     assert p.status() == "Stall(InstructionCacheBusy())"
 
 @cocotb.test()
@@ -543,7 +554,7 @@ async def dcache_miss(dut):
 
     assert p.fetch_en() and p.index() == 0
 
-    p.set_inst(itype(0b101011, 0, 0, 0x54)) # sw $zero, 0x54($zero)
+    p.set_inst(ins("sw $zero, 0x54($zero)"))
 
     await p.clock()
     await p.halfclock()
@@ -575,6 +586,7 @@ async def dcache_miss(dut):
     assert p.status() == "Ok()"
 
 @cocotb.test()
+@logged
 async def external_write(dut):
     p = Pipeline(dut)
     await p.start()
@@ -583,7 +595,7 @@ async def external_write(dut):
         lui(2, 0xa000),
         lui(7, 0xdead),
         ori(7, 7, 0xbeef),
-        itype(0b101011, 2, 7, 0x0044), # sw $r7, 0x44($r2)
+        ins("sw $r7, 0x44($r2)"),
         nop(),
         nop(),
         nop(),
@@ -592,6 +604,295 @@ async def external_write(dut):
     for inst in prog:
         p.set_inst(inst)
         await p.clock()
-        dut._log.info(f"{p.status()} {int(p.o.external.addr.value()):x} {int(p.o.external.data.value()):x}")
+        log("{} {:x} {:x}", p.status(), int(p.o.external.addr.value()), int(p.o.external.data.value()))
 
     p.o.external.assert_eq("ExternalRequest$(addr: 0x44, data: 0xffffffffdeadbeef, size: 3, write: true)")
+
+@cocotb.test()
+@logged
+async def branch_likely_not_taken(dut):
+    """The delay slot of a not taken branch likely must not write anything"""
+    p = Pipeline(dut)
+    await p.start()
+
+    prog = [
+        lui(7, 0xdead),
+        ori(7, 7, 0xbeef),
+        lui(2, 0xa000),
+        branch(0b010101, 0, 0, 16), # bnel $zero, $zero, +16
+        ins("sw $r7, 0x44($zero)"),
+        branch(0b010100, 7, 0, 16), # beql $r7, $zero, +16
+        ins("sw $r7, 0x44($r2)"),
+        branch(0b010111, 7, 0, 16), # bgtzl $r7, +16
+        addiu(7, 7, 1), # addiu $r7, $r7, 1
+        ins("sw $r7, 0x48($zero)"),
+        nop(),
+        nop(),
+        nop(),
+        nop(),
+    ]
+
+    writes = await do_stores(p, prog, dut)
+
+    assert [row << 3 for row, _ in writes] == [0x48], f"writes: {writes}"
+    assert writes[0][1] == 0xdeadbeef55667788
+    assert p.external_writes == [], f"external writes: {p.external_writes}"
+
+@cocotb.test()
+@logged
+async def branch_likely_taken(dut):
+    """A taken branch likely runs its delay slot like any other branch"""
+    p = Pipeline(dut)
+    await p.start()
+
+    prog = [
+        lui(7, 0xdead),
+        ori(7, 7, 0xbeef),
+        branch(0b010110, 7, 0, 8), # blezl $r7, +8
+        ins("sw $r7, 0x44($zero)"),
+        ins("sw $r7, 0x50($zero)"),
+        ins("sw $r7, 0x48($zero)"),
+        nop(),
+        nop(),
+        nop(),
+        nop(),
+    ]
+
+    writes = await do_stores(p, prog, dut)
+
+    assert [row << 3 for row, _ in writes] == [0x40, 0x48], f"writes: {writes}"
+
+@cocotb.test()
+@logged
+async def branch_likely_loop(dut):
+    """With branch likely, the delay slot can be filled from the loop body
+    instead of being a nop, and the loop runs in fewer cycles"""
+    p = Pipeline(dut)
+    await p.start()
+
+    plain = [
+        li(1, 4),
+        li(2, 0),
+        addiu(2, 2, 1), # loop: addiu $r2, $r2, 1
+        addiu(1, 1, -1), # addiu $r1, $r1, -1
+        branch(0b000101, 1, 0, -12), # bne $r1, $zero, loop
+        nop(),
+        ins("sw $r2, 0x44($zero)"),
+        nop(),
+        nop(),
+        nop(),
+        nop(),
+    ]
+
+    filled = [
+        li(1, 4),
+        li(2, 0),
+        addiu(2, 2, 1), # addiu $r2, $r2, 1
+        addiu(1, 1, -1), # loop: addiu $r1, $r1, -1
+        branch(0b010101, 1, 0, -8), # bnel $r1, $zero, loop
+        addiu(2, 2, 1), # addiu $r2, $r2, 1
+        ins("sw $r2, 0x44($zero)"),
+        nop(),
+        nop(),
+        nop(),
+        nop(),
+    ]
+
+    writes = await do_stores(p, plain, dut)
+    assert writes == [(0x44 >> 3, 0x1122334400000004)], f"writes: {writes}"
+    plain_cycles = p.cycles
+
+    await p.start()
+    writes = await do_stores(p, filled, dut)
+    assert writes == [(0x44 >> 3, 0x1122334400000004)], f"writes: {writes}"
+    filled_cycles = p.cycles
+
+    dut._log.info(f"loop with nop: {plain_cycles} cycles, with branch likely: {filled_cycles} cycles")
+    assert filled_cycles < plain_cycles
+
+@cocotb.test()
+@logged
+async def timeline_load_interlock(dut):
+    """The store after a load shows up as stalled in EX, with rt bypassed"""
+    p = Pipeline(dut)
+    await p.start()
+
+    prog = [
+        ins("lw $r3, 0x34($zero)"),
+        ins("sw $r3, 0x74($zero)"),
+        nop(1),
+        nop(2),
+        nop(3),
+        nop(4),
+    ]
+
+    timeline = Timeline()
+    await do_stores(p, prog, dut, {0x30: 0x00000000fccffccf}, timeline=timeline)
+
+    out = os.path.join(ROOT, "build", "timeline", "load_interlock")
+    timeline.write_text(out + ".txt")
+    timeline.write_kanata(out + ".kanata")
+
+    store = None
+    for cycle, stages, advance, reason in timeline.replay():
+        ex = stages[2]
+        if ex is not None and ex.pc == 0xffffffffbfc00004:
+            store = ex
+
+    assert store is not None, "the store never reached EX"
+    assert store.rt_bypass == "ExResult", f"rt bypass: {store.rt_bypass}"
+    assert "LoadInterlock" in [reason for _, reason in store.stalls], f"stalls: {store.stalls}"
+
+# opcode: (word size, left)
+UNALIGNED_LOADS = {
+    0b100010: (4, True), # LWL
+    0b100110: (4, False), # LWR
+    0b011010: (8, True), # LDL
+    0b011011: (8, False), # LDR
+}
+
+UNALIGNED_STORES = {
+    0b101010: (4, True), # SWL
+    0b101110: (4, False), # SWR
+    0b101100: (8, True), # SDL
+    0b101101: (8, False), # SDR
+}
+
+def sext32(value):
+    value &= 0xffffffff
+    return value | 0xffffffff_00000000 if value & 0x80000000 else value
+
+def unaligned_bytes(width, left, offset):
+    """The range of bytes within the octbyte touched by an unaligned access"""
+    start = offset & ~(width - 1)
+    if left:
+        return offset, start + width
+    return start, offset + 1
+
+def unaligned_load(reg, mem, width, left, offset):
+    lo, hi = unaligned_bytes(width, left, offset)
+    loaded = mem.to_bytes(8, "big")[lo:hi]
+    word = (reg & ((1 << width * 8) - 1)).to_bytes(width, "big")
+
+    if left:
+        merged = loaded + word[len(loaded):]
+    else:
+        merged = word[:width - len(loaded)] + loaded
+    value = int.from_bytes(merged, "big")
+
+    if width == 8:
+        return value
+    if left or len(loaded) == 4:
+        return sext32(value)
+    return reg & ~0xffffffff | value
+
+def unaligned_store(reg, mem, width, left, offset):
+    lo, hi = unaligned_bytes(width, left, offset)
+    word = (reg & ((1 << width * 8) - 1)).to_bytes(width, "big")
+    stored = word[:hi - lo] if left else word[width - (hi - lo):]
+
+    mem = bytearray(mem.to_bytes(8, "big"))
+    mem[lo:hi] = stored
+    return int.from_bytes(mem, "big")
+
+@cocotb.test()
+@logged
+async def unaligned_loads(dut):
+    """LWL/LWR/LDL/LDR at every byte offset, merging into a full 64 bit register"""
+    p = Pipeline(dut)
+
+    reg = 0x01234567_89abcdef
+    mem = 0x8899aabb_ccddeeff
+    loads = {0x100: reg, 0x200: mem}
+
+    for op, (width, left) in UNALIGNED_LOADS.items():
+        await p.start()
+
+        prog = []
+        for offset in range(8):
+            prog += [
+                ins("ld $r3, 0x100($zero)"),
+                itype(op, 0, 3, 0x200 + offset), # l?? $r3, 0x200+offset($zero)
+                ins(f"sd $r3, {0x300 + offset * 8}($zero)"),
+                nop(),
+            ]
+        prog += [nop(), nop(), nop(), nop()]
+
+        writes = await do_stores(p, prog, dut, loads)
+        assert len(writes) == 8, f"op {op:06b}: writes: {writes}"
+
+        for offset, (row, data) in enumerate(writes):
+            expected = unaligned_load(reg, mem, width, left, offset)
+            assert row << 3 == 0x300 + offset * 8
+            assert data == expected, f"op {op:06b} offset {offset}: expected {expected:016x}, found {data:016x}"
+
+@cocotb.test()
+@logged
+async def unaligned_stores(dut):
+    """SWL/SWR/SDL/SDR at every byte offset"""
+    p = Pipeline(dut)
+
+    reg = 0x01234567_89abcdef
+    start = 0x11223344_55667788 # what do_stores returns for every row
+
+    for op, (width, left) in UNALIGNED_STORES.items():
+        await p.start()
+
+        prog = [
+            ins("ld $r3, 0x100($zero)"),
+            nop(),
+        ]
+        for offset in range(8):
+            prog += [
+                itype(op, 0, 3, 0x200 + offset), # s?? $r3, 0x200+offset($zero)
+                nop(),
+            ]
+        prog += [nop(), nop(), nop(), nop()]
+
+        writes = await do_stores(p, prog, dut, {0x100: reg})
+        assert len(writes) == 8, f"op {op:06b}: writes: {writes}"
+
+        # each store lands on top of the ones before it
+        mem = start
+        for offset, (row, data) in enumerate(writes):
+            expected = unaligned_store(reg, mem, width, left, offset)
+            mem = expected
+            assert row << 3 == 0x200
+            assert data == expected, f"op {op:06b} offset {offset}: expected {expected:016x}, found {data:016x}"
+
+@cocotb.test()
+@logged
+async def unaligned_copy(dut):
+    """The usual LWL/LWR pair followed by SWL/SWR copies an unaligned word in four instructions"""
+    p = Pipeline(dut)
+    await p.start()
+
+    mem = 0x8899aabb_ccddeeff
+
+    prog = [
+        ins("lwl $r3, 0x201($zero)"),
+        ins("lwr $r3, 0x204($zero)"),
+        ins("swl $r3, 0x302($zero)"),
+        nop(),
+        ins("swr $r3, 0x305($zero)"),
+        nop(),
+        nop(),
+        nop(),
+        nop(),
+    ]
+
+    writes = await do_stores(p, prog, dut, {0x200: mem})
+
+    assert [row << 3 for row, _ in writes] == [0x300, 0x300], f"writes: {writes}"
+    # 99aabbcc goes to bytes 2..5, half in each write
+    assert writes[0][1] == 0x112299aa_55667788
+    assert writes[1][1] == 0x112299aa_bbcc7788
+
+@cocotb.test(skip=not coverage.ENABLED)
+async def collect_coverage(dut):
+    """Reads back the coverage counters from all the tests above, so this has to stay last"""
+    p = Pipeline(dut)
+    await p.start()
+
+    # the counters are read through the same 5 stages as everything else
+    await coverage.collect(p.s, p.clock, "test_pipeline", latency=5)
@@ -0,0 +1,198 @@
+#top=cpu
+"""The simulator side of tools/reduce.py.
+
+Does nothing unless tools/reduce.py starts it with R4300_REDUCE_WORKER set
+to a directory. The worker then stays up for the whole reduction, taking
+jobs of candidate programs from that directory and answering with the
+failure signature of each, see signature() and timeout():
+
+  setup.json       the original program and its data, written before the start
+  ready            written once the original is preloaded
+  job-<n>.json     {"cycles": N, "cold": false, "programs": [[word, ...], ...]}
+  result-<n>.json  {"signatures": [...], "cycles": [...]}
+  stop             ends the worker
+
+The original is reset and preloaded once, and kept as a checkpoint. Every
+candidate is no longer than the original, so it starts from that checkpoint
+with only the icache words that differ written again, instead of a full
+reset and preload. Cold jobs do the full reset and preload, which is how
+the reduced program is checked at the end.
+"""
+
+import json
+import os
+import time
+
+import cocotb
+from spade import *
+from cocotb.triggers import *
+
+from tb import checkpoint, loader
+from tb.clock import CLOCKS, two_phase
+from tb.mmio import Host
+from tb.profiler import parse_status
+
+WORKER = os.environ.get("R4300_REDUCE_WORKER")
+
+# Without a job for this long the reducer is assumed to be gone
+IDLE_SECONDS = 600
+
+# A run that doesn't end and has been at one pc this long is a hang
+STUCK_CYCLES = 64
+
+
+def signature(host, status):
+    """What a run ended with, or None while it's still going"""
+    if host.exited:
+        return "pass" if host.exit_code == 0 else f"exit {host.exit_code}"
+    if status.startswith("ExceptionWB("):
+        return f"exception {parse_status(status)[0]}"
+    return None
+
+
+def timeout(pc, status, still):
+    """A run that didn't end. Any program that loses its exit doesn't end
+    either, so only a cpu stuck at one pc is worth keeping"""
+    if still < STUCK_CYCLES:
+        return "timeout"
+    try:
+        pc = f"{int(pc, 10):#x}"
+    except ValueError:
+        pass
+    return f"hang at {pc}, {status}"
+
+
+def write_json(path, value):
+    # the reducer polls for the file, so it has to appear complete
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(value, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def wait_for_job(n):
+    """Blocks the simulator until job n or stop shows up"""
+    path = os.path.join(WORKER, f"job-{n}.json")
+    deadline = time.time() + IDLE_SECONDS
+    while time.time() < deadline:
+        if os.path.exists(os.path.join(WORKER, "stop")):
+            return None
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        time.sleep(0.01)
+    return None
+
+
+class Worker:
+    def __init__(self, dut, setup):
+        self.dut = dut
+        self.s = SpadeExt(dut)
+        self.i = self.s.i
+        self.o = self.s.o
+        self.phase2 = dut.phase2_i
+
+        self.base = setup["base"]
+        self.data = [(addr, bytes.fromhex(contents)) for addr, contents in setup["data"]]
+        self.original = self.image(setup["program"])
+        self.path = checkpoint.path_for("reduce", self.original.icache, self.original.dcache)
+
+    def image(self, words):
+        return loader.from_words(words, self.base, self.data)
+
+    async def clock(self):
+        await RisingEdge(self.phase2)
+
+    async def write_icache(self, icache):
+        for addr, data in icache:
+            index = (addr >> 3) & 0x7ff
+            tag = (addr >> 12) & 0xfffff
+            self.i.icache_write = f"Some(({index}, {tag}, {data}))"
+            await self.clock()
+        self.i.icache_write = "None"
+
+    async def preload(self, image):
+        """Reset and preload, like Core.start in test/core.py. Leaves rst high"""
+        self.i.rst = True
+        self.i.icache_write = "None"
+        self.i.dcache_write = "None"
+        for _ in range(3):
+            await self.clock()
+
+        await self.write_icache(image.icache)
+
+        for addr, data in image.dcache:
+            index = (addr >> 4) & 0xff
+            tag = (addr >> 12) & 0xfffff
+            self.i.dcache_write = f"Some(({index}, {tag}, {data}))"
+            await self.clock()
+        self.i.dcache_write = "None"
+
+        for _ in range(5):
+            await self.clock()
+
+    async def warm_up(self):
+        """Gets the checkpoint of the preloaded original, from an earlier
+        worker or by making it"""
+        await self.clock()
+        if checkpoint.ENABLED and os.path.exists(self.path):
+            try:
+                await checkpoint.restore(self.dut, self.path, skip=CLOCKS)
+                return
+            except checkpoint.StaleCheckpoint as e:
+                self.dut._log.warning(f"{e}, doing a full reset")
+        await self.preload(self.original)
+        await checkpoint.save(self.dut, self.path, skip=CLOCKS)
+
+    async def run(self, cycles):
+        self.i.rst = "false"
+        host = Host(self.o)
+        pc = None
+        still = 0
+        for cycle in range(1, cycles + 1):
+            await self.clock()
+            host.sample()
+            status = self.o.status.value()
+            result = signature(host, status)
+            if result is not None:
+                return result, cycle
+            last, pc = pc, self.o.pc.value()
+            still = still + 1 if pc == last else 0
+        return timeout(pc, status, still), cycles
+
+    async def attempt(self, words, cycles, cold=False):
+        image = self.image(words)
+        new = dict(image.icache)
+        if cold or not new.keys() <= dict(self.original.icache).keys():
+            await self.preload(image)
+            return await self.run(cycles)
+
+        await checkpoint.restore(self.dut, self.path, skip=CLOCKS)
+        # Whatever is past the end of a shorter program becomes nops
+        changed = [(addr, new.get(addr, 0)) for addr, data in self.original.icache if new.get(addr, 0) != data]
+        if changed:
+            await self.write_icache(changed)
+            for _ in range(5):
+                await self.clock()
+        return await self.run(cycles)
+
+
+@cocotb.test(skip=WORKER is None)
+async def reduce_worker(dut):
+    """Runs the jobs of tools/reduce.py until it says stop"""
+    await cocotb.start(two_phase(dut.phase1_i, dut.phase2_i))
+
+    with open(os.path.join(WORKER, "setup.json")) as f:
+        w = Worker(dut, json.load(f))
+    await w.warm_up()
+    write_json(os.path.join(WORKER, "ready"), os.getpid())
+
+    n = 0
+    while (job := wait_for_job(n)) is not None:
+        signatures = []
+        cycles = []
+        for words in job["programs"]:
+            result, taken = await w.attempt(words, job["cycles"], job.get("cold", False))
+            signatures.append(result)
+            cycles.append(taken)
+        write_json(os.path.join(WORKER, f"result-{n}.json"), {"signatures": signatures, "cycles": cycles})
+        n += 1
@@ -5,6 +5,8 @@ from spade import *
 from cocotb.clock import Clock
 from cocotb.triggers import *
 
+from tb.clock import two_phase
+
 def RegId(id) -> str:
     if id < 32:
         return f"RegId::Integer({id})"
@@ -25,19 +27,7 @@ async def start(dut):
 
     phase1 = dut.phase1_i
     phase2 = dut.phase2_i
-    async def custom_clock():
-        # pre-construct triggers for performance
-        time = Timer(10, units="ps")
-        await Timer(5, units="ps")
-        while True:
-            phase1.value = 1
-            phase2.value = 0
-            await time
-            phase1.value = 0
-            phase2.value = 1
-            await time
-
-    await cocotb.start(custom_clock())
+    await cocotb.start(two_phase(phase1, phase2))
     s.i.write = t(RegId(0), 0)
     s.i.rs = RegId(0)
     s.i.rt = RegId(0)
@@ -0,0 +1,43 @@
+#top=selfcheck::selfcheck
+
+import cocotb
+from spade import *
+from cocotb.triggers import *
+
+from tb.clock import two_phase
+from tb.signature import signature
+
+# What the built-in program of tools/gen_selfcheck.py writes to the register file
+DEFAULT_WRITES = [
+    (1, 0x00000000_12340000),
+    (1, 0x00000000_12345678),
+    (2, 0x00000000_12345679),
+    (5, 0x00000000_00010000),
+    (4, 0xffffffff_a5a5a5a5),
+    (3, 0xffffffff_afff0000),
+]
+
+@cocotb.test()
+async def selfcheck(dut):
+    s = SpadeExt(dut)
+    phase1 = dut.phase1_i
+    phase2 = dut.phase2_i
+
+    await cocotb.start(two_phase(phase1, phase2))
+
+    s.i.rst = "true"
+    await ClockCycles(phase2, 3)
+    s.i.rst = "false"
+
+    # The harness boots and checks itself, so only look every so often
+    for _ in range(20):
+        await ClockCycles(phase2, 50)
+        if s.o.done.value() == "true":
+            break
+    else:
+        assert False, "never finished"
+
+    dut._log.info(f"{s.o.value()}")
+    s.o.fail.assert_eq("false")
+    s.o.writes.assert_eq(f"{len(DEFAULT_WRITES)}")
+    s.o.signature.assert_eq(f"{signature(DEFAULT_WRITES)}")
@@ -4,9 +4,13 @@ import cocotb
 from spade import *
 from cocotb.clock import Clock
 from cocotb.triggers import *
+from cocotb.regression import TestFactory
 
-async def start(dut):
+SHIFTERS = ["ShifterArch::Inferred", "ShifterArch::Barrel"]
+
+async def start(dut, arch):
     s = SpadeExt(dut)
+    s.i.arch = arch
     clk = dut.clk_i
     await cocotb.start(Clock(clk, 10, units='ns').start())
     await FallingEdge(clk)
@@ -20,9 +24,8 @@ async def do_shift(s, clk, val, shift, expected):
     s.o.assert_eq(hex(expected))
 
 
-@cocotb.test()
-async def shift_left(dut):
-    s, clk = await start(dut)
+async def shift_left(dut, arch):
+    s, clk = await start(dut, arch)
 
     s.i.mode = "ExMode::Shift(Shift::LeftLogic, ShiftSrc::Reg5)"
     # s.i.add_result = "3"
@@ -49,9 +52,8 @@ async def shift_left(dut):
     s.i.mode = "ExMode::Shift(Shift::LeftLogic, ShiftSrc::Reg6)"
     await do_shift(s, clk, 1, 33, 0x200000000)
 
-@cocotb.test()
-async def shift_right(dut):
-    s, clk = await start(dut)
+async def shift_right(dut, arch):
+    s, clk = await start(dut, arch)
 
     s.i.mode = "ExMode::Shift(Shift::RightLogic, ShiftSrc::Reg5)"
     await do_shift(s, clk, 8, 3, 1)
@@ -66,9 +68,8 @@ async def shift_right(dut):
     s.i.mode = "ExMode::Shift(Shift::RightLogic, ShiftSrc::Reg6)"
     await do_shift(s, clk, 0x200000002, 33, 1)
 
-@cocotb.test()
-async def shift_right_arith(dut):
-    s, clk = await start(dut)
+async def shift_right_arith(dut, arch):
+    s, clk = await start(dut, arch)
 
     s.i.mode = "ExMode::Shift(Shift::RightArith, ShiftSrc::Reg5)"
     await do_shift(s, clk, 8, 3, 1)
@@ -89,3 +90,36 @@ async def shift_right_arith(dut):
     # and with a 32bit shift
     s.i.mode = "ExMode::Shift(Shift::RightArith, ShiftSrc::Reg5)"
     await do_shift(s, clk, 0x8000_0000_0000_0000, 32 + 9, 0xffc0_0000_0000_0000)
+
+async def memory_align(dut, arch):
+    """Stores are aligned by the shifter (or the separate byte aligner)"""
+    s, clk = await start(dut, arch)
+
+    s.i.rs_val = "0"
+    s.i.shift_mux = "0x1122334455667788"
+
+    for size in (1, 2, 4, 8):
+        s.i.mode = f"ExMode::Memory({size})"
+        for offset in range(0, 8, size):
+            s.i.ins = str(offset)
+            await FallingEdge(clk)
+            shift = (8 - size - offset) * 8
+            s.o.assert_eq(hex((0x1122334455667788 << shift) & 0xffff_ffff_ffff_ffff))
+
+async def all_amounts(dut, arch):
+    s, clk = await start(dut, arch)
+    val = 0x8123_4567_89ab_cdef
+
+    for mode, shift in [
+        ("LeftLogic", lambda v, n: (v << n) & 0xffff_ffff_ffff_ffff),
+        ("RightLogic", lambda v, n: v >> n),
+        ("RightArith", lambda v, n: (v >> n) | ((0xffff_ffff_ffff_ffff << (64 - n)) & 0xffff_ffff_ffff_ffff)),
+    ]:
+        s.i.mode = f"ExMode::Shift(Shift::{mode}, ShiftSrc::Reg6)"
+        for n in range(64):
+            await do_shift(s, clk, val, n, shift(val, n))
+
+for test in [shift_left, shift_right, shift_right_arith, memory_align, all_amounts]:
+    factory = TestFactory(test)
+    factory.add_option("arch", SHIFTERS)
+    factory.generate_tests()
@@ -0,0 +1,12 @@
+# Shared testbench helpers. Test files in test/ import these as tb.<module>
+
+import os
+
+# The repository root, for paths under build/ and src/
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+from tb import overhead  # noqa: E402
+
+# R4300_OVERHEAD=1 profiles every test of the files using tb, see tb/overhead.py
+if overhead.ENABLED:
+    overhead.install()
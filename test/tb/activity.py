@@ -0,0 +1,134 @@
+"""SRAM activity reports, for power estimates.
+
+test_cpu counts the reads and writes of every sram (src/activity.spade):
+each icache bank and the icache tags, the dcache banks, tags and dirty
+bits, and the register file ports. The counters are cleared by reset, so
+reading them back after a workload gives the accesses of that workload
+alone:
+
+    await c.start(image.icache, image.dcache)
+    ... run the workload ...
+    counts = await activity.collect(c.s, c.clock, "loop")
+    dut._log.info("\\n" + activity.report(counts))
+
+Every workload is written to build/activity/<name>.json, and running this
+file prints the report of each of them, along with the toggle counts from
+tools/toggles.py when there is a <name>.toggles.json next to it:
+
+    python test/tb/activity.py [build/activity]
+"""
+
+import glob
+import json
+import os
+import sys
+
+DIR = os.environ.get(
+    "R4300_ACTIVITY_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "build", "activity"),
+)
+
+# Must match the counter layout in activity_counters
+EVENTS = [
+    "cycles",
+    "icache_bank0_read", "icache_bank1_read", "icache_bank2_read", "icache_bank3_read",
+    "icache_bank0_write", "icache_bank1_write", "icache_bank2_write", "icache_bank3_write",
+    "icache_tag_read", "icache_tag_write",
+    "icache_fetch",
+    "dcache_bank0_read", "dcache_bank1_read",
+    "dcache_bank0_write", "dcache_bank1_write",
+    "dcache_tag_read", "dcache_tag_write",
+    "regfile_rs_read", "regfile_rt_read",
+    "regfile_write",
+    "regfile_operand_cycles",
+    "dcache_dirty_write",
+]
+
+# sram -> (read event, write event) for the per sram table
+SRAMS = [(f"icache bank {b}", f"icache_bank{b}_read", f"icache_bank{b}_write") for b in range(4)]
+SRAMS += [("icache tag", "icache_tag_read", "icache_tag_write")]
+SRAMS += [(f"dcache bank {b}", f"dcache_bank{b}_read", f"dcache_bank{b}_write") for b in range(2)]
+SRAMS += [("dcache tag", "dcache_tag_read", "dcache_tag_write")]
+# read along with the tags
+SRAMS += [("dcache dirty bits", "dcache_tag_read", "dcache_dirty_write")]
+SRAMS += [("regfile rs port", "regfile_rs_read", None), ("regfile rt port", "regfile_rt_read", None)]
+SRAMS += [("regfile write port", None, "regfile_write")]
+
+
+async def collect(s, clock, workload, latency=1):
+    """Read every counter back, and write them to build/activity/<workload>.json.
+
+    `clock` advances the simulation by one cycle, and `latency` is the number
+    of cycles between setting activity_bin and seeing the count on the output.
+    Counting is paused while the read is in progress.
+    """
+    counts = {}
+    for i in range(len(EVENTS) + latency - 1):
+        if i < len(EVENTS):
+            s.i.activity_bin = f"Some({i})"
+        await clock()
+
+        j = i - (latency - 1)
+        if j >= 0:
+            counts[EVENTS[j]] = int(s.o.activity.value())
+
+    s.i.activity_bin = "None"
+
+    os.makedirs(DIR, exist_ok=True)
+    with open(os.path.join(DIR, f"{workload}.json"), "w") as f:
+        json.dump({"workload": workload, "counts": counts}, f, indent=1)
+
+    return counts
+
+
+def ratio(a, b):
+    return a / b if b else 0.0
+
+
+def report(counts, toggles=None):
+    cycles = counts["cycles"]
+    lines = [f"{cycles} cycles", "", f"{'sram':<20}{'reads':>10}{'writes':>10}{'per cycle':>11}"]
+    for name, read, write in SRAMS:
+        # runs from before a counter was added don't have it
+        reads = counts.get(read, 0) if read else 0
+        writes = counts.get(write, 0) if write else 0
+        lines.append(f"{name:<20}{reads if read else '-':>10}{writes if write else '-':>10}"
+                     f"{ratio(reads + writes, cycles):>11.3f}")
+
+    # What the power saving features bought
+    fetches = counts["icache_fetch"]
+    bank_reads = sum(counts[f"icache_bank{b}_read"] for b in range(4))
+    port_reads = counts["regfile_rs_read"] + counts["regfile_rt_read"]
+    operand_reads = 2 * counts["regfile_operand_cycles"]
+    lines += [
+        "",
+        f"fetch buffer: {fetches} fetches, {bank_reads} bank reads, "
+        f"{100.0 * (1 - ratio(bank_reads, fetches)):.1f}% served from the buffer",
+        f"icache banking: {bank_reads} reads powering 1 of 4 banks, {3 * bank_reads} bank activations saved",
+        f"regfile: {port_reads} of {operand_reads} possible port reads, "
+        f"{100.0 * (1 - ratio(port_reads, operand_reads)):.1f}% disabled for bypasses and $zero",
+    ]
+
+    if toggles:
+        lines += ["", f"{'module':<40}{'toggles':>12}{'per cycle':>11}"]
+        for module, count in sorted(toggles.items(), key=lambda item: -item[1]):
+            lines.append(f"{module:<40}{count:>12}{ratio(count, cycles):>11.1f}")
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else DIR
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        if path.endswith(".toggles.json"):
+            continue
+        with open(path) as f:
+            run = json.load(f)
+        toggles = None
+        toggles_path = path[:-len(".json")] + ".toggles.json"
+        if os.path.exists(toggles_path):
+            with open(toggles_path) as f:
+                toggles = json.load(f)["modules"]
+        print(f"== {run['workload']}")
+        print(report(run["counts"], toggles))
+        print()
@@ -0,0 +1,479 @@
+"""A small MIPS assembler for the testbenches.
+
+    program = asm.assemble('''
+            lui   $2, 0xa000
+            li    $1, 20
+        loop:
+            addiu $1, $1, -1
+            bne   $1, $zero, loop
+            nop
+            sw    $1, 0x44($2)
+        end:
+            b     end
+            nop
+    ''')
+    image = program.image(data=[(0x10000, bytes(0x100))])
+    await c.start(image.icache, image.dcache)
+
+    ins("sw $r7, 0x44($r2)")  # a single instruction, for the tests which feed the pipeline by hand
+
+Every instruction decode() knows about is here, plus the pseudo instructions
+nop, b, move, li and la. Registers are $0-$31, $r0-$r31 or the usual ABI
+names, and $f0-$f31 for coprocessor 1. FCR0 and FCR31 in cfc1/ctc1 are $0
+and $31. Branch targets are labels, absolute addresses or `.`, the branch's own
+address. Directives are .word (values or labels) and .space (bytes, zero
+filled).
+
+A branch or jump in the delay slot of another, or as the last instruction,
+is an error, and so is anything taking more than one word in a delay slot,
+like li of a 32-bit value. Parsing and encoding is memoised per line of
+source, so big generated programs, which repeat a lot of lines, assemble
+quickly.
+"""
+
+import re
+from functools import lru_cache
+
+RESET_VECTOR = 0xbfc00000
+
+
+class AsmError(ValueError):
+    pass
+
+
+# The encoders the tests were written with
+
+def rtype(op, rs, rt, rd, sh, func):
+    assert func <= 0x3f
+    return (op << 26) | (rs << 21) | (rt << 16) | (rd << 11) | (sh << 6) | func
+
+def itype(op, rs, rt, imm):
+    assert imm <= 0xffff
+    return (op << 26) | (rs << 21) | (rt << 16) | (imm)
+
+def jtype(op, addr):
+    return (op << 26) | addr
+
+def balways(pc, offset):
+    offset = (offset >> 2) & 0xffff
+    return itype(1, 0, 1, offset)
+
+def branch(op, rs, rt, offset):
+    # offset in bytes, relative to the delay slot
+    return itype(op, rs, rt, (offset >> 2) & 0xffff)
+
+def addiu(rt, rs, imm):
+    return itype(0b001001, rs, rt, imm & 0xffff)
+
+def nop(num=0):
+    # addi $zero, $zero, num
+    return itype(9, 0, 0, num)
+
+def lui(rt, imm):
+    assert imm < 0x10000
+    return itype(0b001111, 0, rt, imm)
+
+def ori(rt, rs, imm):
+    assert imm < 0x10000
+    return itype(0b001101, rs, rt, imm)
+
+def li(rt, imm):
+    return ori(rt, 0, imm)
+
+def lwi(rd, imm):
+    return [lui(rd, imm >> 16), ori(rd, rd, imm & 0xffff)]
+
+
+ABI_NAMES = [
+    "zero", "at", "v0", "v1", "a0", "a1", "a2", "a3",
+    "t0", "t1", "t2", "t3", "t4", "t5", "t6", "t7",
+    "s0", "s1", "s2", "s3", "s4", "s5", "s6", "s7",
+    "t8", "t9", "k0", "k1", "gp", "sp", "fp", "ra",
+]
+REGISTERS = {f"${name}": i for i, name in enumerate(ABI_NAMES)}
+REGISTERS["$s8"] = 30
+for i in range(32):
+    REGISTERS[f"${i}"] = i
+    REGISTERS[f"$r{i}"] = i
+FLOAT_REGISTERS = {f"$f{i}": i for i in range(32)}
+
+# SPECIAL funct codes, by operand order
+ARITH = {
+    "add": 0b100000, "addu": 0b100001, "sub": 0b100010, "subu": 0b100011,
+    "and": 0b100100, "or": 0b100101, "xor": 0b100110, "nor": 0b100111,
+    "slt": 0b101010, "sltu": 0b101011,
+    "dadd": 0b101100, "daddu": 0b101101, "dsub": 0b101110, "dsubu": 0b101111,
+}
+SHIFT_IMM = {
+    "sll": 0b000000, "srl": 0b000010, "sra": 0b000011,
+    "dsll": 0b111000, "dsrl": 0b111010, "dsra": 0b111011,
+    "dsll32": 0b111100, "dsrl32": 0b111110, "dsra32": 0b111111,
+}
+SHIFT_REG = {
+    "sllv": 0b000100, "srlv": 0b000110, "srav": 0b000111,
+    "dsllv": 0b010100, "dsrlv": 0b010110, "dsrav": 0b010111,
+}
+MULDIV = {
+    "mult": 0b011000, "multu": 0b011001, "div": 0b011010, "divu": 0b011011,
+    "dmult": 0b011100, "dmultu": 0b011101, "ddiv": 0b011110, "ddivu": 0b011111,
+}
+TRAP = {
+    "tge": 0b110000, "tgeu": 0b110001, "tlt": 0b110010, "tltu": 0b110011,
+    "teq": 0b110100, "tne": 0b110110,
+}
+MOVE_FROM = {"mfhi": 0b010000, "mflo": 0b010010}
+MOVE_TO = {"mthi": 0b010001, "mtlo": 0b010011}
+NO_OPERANDS = {"syscall": 0b001100, "break": 0b001101, "sync": 0b001111}
+
+# opcodes
+IMM_ARITH = {
+    "addi": 0b001000, "addiu": 0b001001, "slti": 0b001010, "sltiu": 0b001011,
+    "daddi": 0b011000, "daddiu": 0b011001,
+}
+IMM_LOGIC = {"andi": 0b001100, "ori": 0b001101, "xori": 0b001110}
+MEMORY = {
+    "ldl": 0b011010, "ldr": 0b011011,
+    "lb": 0b100000, "lh": 0b100001, "lwl": 0b100010, "lw": 0b100011,
+    "lbu": 0b100100, "lhu": 0b100101, "lwr": 0b100110, "lwu": 0b100111,
+    "sb": 0b101000, "sh": 0b101001, "swl": 0b101010, "sw": 0b101011,
+    "sdl": 0b101100, "sdr": 0b101101, "swr": 0b101110, "cache": 0b101111,
+    "ll": 0b110000, "lld": 0b110100, "ld": 0b110111,
+    "sc": 0b111000, "scd": 0b111100, "sd": 0b111111,
+}
+BRANCH_TWO = {"beq": 0b000100, "bne": 0b000101, "beql": 0b010100, "bnel": 0b010101}
+BRANCH_ONE = {"blez": 0b000110, "bgtz": 0b000111, "blezl": 0b010110, "bgtzl": 0b010111}
+REGIMM_BRANCH = {
+    "bltz": 0b00000, "bgez": 0b00001, "bltzl": 0b00010, "bgezl": 0b00011,
+    "bltzal": 0b10000, "bgezal": 0b10001, "bltzall": 0b10010, "bgezall": 0b10011,
+}
+REGIMM_TRAP = {
+    "tgei": 0b01000, "tgeiu": 0b01001, "tlti": 0b01010, "tltiu": 0b01011,
+    "teqi": 0b01100, "tnei": 0b01110,
+}
+JUMP = {"j": 0b000010, "jal": 0b000011}
+
+# Coprocessor 1
+COP1 = 0b010001
+FLOAT_MEMORY = {"lwc1": 0b110001, "ldc1": 0b110101, "swc1": 0b111001, "sdc1": 0b111101}
+# rs field, by whether the integer register is read or written
+FLOAT_MOVE = {"mfc1": 0b00000, "dmfc1": 0b00001, "cfc1": 0b00010, "mtc1": 0b00100, "dmtc1": 0b00101, "ctc1": 0b00110}
+FLOAT_BRANCH = {"bc1f": 0b00000, "bc1t": 0b00001, "bc1fl": 0b00010, "bc1tl": 0b00011}
+FORMATS = {"s": 0b10000, "d": 0b10001, "w": 0b10100, "l": 0b10101}
+# funct codes of op.fmt fd, fs, ft and op.fmt fd, fs
+FLOAT_THREE = {"add": 0b000000, "sub": 0b000001, "mul": 0b000010, "div": 0b000011}
+FLOAT_TWO = {
+    "sqrt": 0b000100, "abs": 0b000101, "mov": 0b000110, "neg": 0b000111,
+    "round.l": 0b001000, "trunc.l": 0b001001, "ceil.l": 0b001010, "floor.l": 0b001011,
+    "round.w": 0b001100, "trunc.w": 0b001101, "ceil.w": 0b001110, "floor.w": 0b001111,
+    "cvt.s": 0b100000, "cvt.d": 0b100001, "cvt.w": 0b100100, "cvt.l": 0b100101,
+}
+FLOAT_COMPARE = {
+    f"c.{cond}": i for i, cond in enumerate(
+        ["f", "un", "eq", "ueq", "olt", "ult", "ole", "ule",
+         "sf", "ngle", "seq", "ngl", "lt", "nge", "le", "ngt"])
+}
+
+# Everything that has a delay slot
+CONTROL = set(BRANCH_TWO) | set(BRANCH_ONE) | set(REGIMM_BRANCH) | set(JUMP) | set(FLOAT_BRANCH) | {"jr", "jalr", "b"}
+# and everything that can refer to a label, which can't be encoded on its own
+NEEDS_LABELS = CONTROL - {"jr", "jalr"} | {"la", ".word"}
+
+LABEL = re.compile(r"^[A-Za-z_.$][\w.$]*$")
+MEMORY_OPERAND = re.compile(r"^(.*)\(\s*\$?(\w+)\s*\)$")
+TARGET = re.compile(r"^([A-Za-z_.$][\w.$]*|\.)\s*(?:([+-])\s*(\w+))?$")
+
+
+def reg(text):
+    try:
+        return REGISTERS[text]
+    except KeyError:
+        raise AsmError(f"bad register {text!r}") from None
+
+
+def freg(text):
+    try:
+        return FLOAT_REGISTERS[text]
+    except KeyError:
+        raise AsmError(f"bad float register {text!r}") from None
+
+
+def float_op(mnemonic):
+    """'cvt.s.w' -> ('cvt.s', FORMATS['w']), or None if it isn't one"""
+    op, _, fmt = mnemonic.rpartition(".")
+    if fmt not in FORMATS or op not in FLOAT_THREE and op not in FLOAT_TWO and op not in FLOAT_COMPARE:
+        return None
+    return op, FORMATS[fmt]
+
+
+def number(text):
+    try:
+        return int(text.strip(), 0)
+    except ValueError:
+        raise AsmError(f"bad number {text!r}") from None
+
+
+def signed16(text):
+    value = number(text)
+    if not -0x8000 <= value <= 0xffff:
+        raise AsmError(f"{text} doesn't fit in 16 bits")
+    return value & 0xffff
+
+
+def unsigned16(text):
+    value = number(text)
+    if not 0 <= value <= 0xffff:
+        raise AsmError(f"{text} doesn't fit in 16 unsigned bits")
+    return value
+
+
+def memory_operand(text):
+    match = MEMORY_OPERAND.match(text.strip())
+    if match is None:
+        raise AsmError(f"bad memory operand {text!r}")
+    offset = match.group(1).strip() or "0"
+    return signed16(offset), reg("$" + match.group(2))
+
+
+def is_number(text):
+    try:
+        int(text, 0)
+        return True
+    except ValueError:
+        return False
+
+
+@lru_cache(maxsize=1 << 16)
+def parse(line):
+    """'loop: addiu $1, $1, -1 # comment' -> ('loop', 'addiu', ('$1', '$1', '-1'))"""
+    line = line.split("#", 1)[0].split("//", 1)[0].strip()
+    label = None
+    if ":" in line:
+        label, line = line.split(":", 1)
+        label = label.strip()
+        line = line.strip()
+        if LABEL.match(label) is None:
+            raise AsmError(f"bad label {label!r}")
+    if not line:
+        return label, None, ()
+    fields = line.split(None, 1)
+    operands = tuple(op.strip() for op in fields[1].split(",")) if len(fields) > 1 else ()
+    return label, fields[0].lower(), operands
+
+
+def size(mnemonic, operands):
+    """Number of words a line takes up"""
+    if mnemonic == ".word":
+        return len(operands)
+    if mnemonic == ".space":
+        return -(-number(operands[0]) // 4)
+    if mnemonic == "la":
+        return 2
+    if mnemonic == "li":
+        value = number(operands[1])
+        return 1 if -0x8000 <= value <= 0xffff else 2
+    return 1
+
+
+@lru_cache(maxsize=1 << 16)
+def encode(mnemonic, operands):
+    """Encodes a line which doesn't refer to any labels, as a tuple of words"""
+    ops = operands
+    try:
+        if mnemonic in ARITH:
+            return (rtype(0, reg(ops[1]), reg(ops[2]), reg(ops[0]), 0, ARITH[mnemonic]),)
+        if mnemonic in SHIFT_IMM:
+            sa = number(ops[2])
+            if not 0 <= sa < 32:
+                raise AsmError(f"shift amount {sa} out of range")
+            return (rtype(0, 0, reg(ops[1]), reg(ops[0]), sa, SHIFT_IMM[mnemonic]),)
+        if mnemonic in SHIFT_REG:
+            return (rtype(0, reg(ops[2]), reg(ops[1]), reg(ops[0]), 0, SHIFT_REG[mnemonic]),)
+        if mnemonic in MULDIV:
+            return (rtype(0, reg(ops[0]), reg(ops[1]), 0, 0, MULDIV[mnemonic]),)
+        if mnemonic in TRAP:
+            return (rtype(0, reg(ops[0]), reg(ops[1]), 0, 0, TRAP[mnemonic]),)
+        if mnemonic in MOVE_FROM:
+            return (rtype(0, 0, 0, reg(ops[0]), 0, MOVE_FROM[mnemonic]),)
+        if mnemonic in MOVE_TO:
+            return (rtype(0, reg(ops[0]), 0, 0, 0, MOVE_TO[mnemonic]),)
+        if mnemonic in NO_OPERANDS:
+            return (rtype(0, 0, 0, 0, 0, NO_OPERANDS[mnemonic]),)
+        if mnemonic == "jr":
+            return (rtype(0, reg(ops[0]), 0, 0, 0, 0b001000),)
+        if mnemonic == "jalr":
+            rd, rs = (ops[0], ops[1]) if len(ops) == 2 else ("$31", ops[0])
+            return (rtype(0, reg(rs), 0, reg(rd), 0, 0b001001),)
+        if mnemonic in IMM_ARITH:
+            return (itype(IMM_ARITH[mnemonic], reg(ops[1]), reg(ops[0]), signed16(ops[2])),)
+        if mnemonic in IMM_LOGIC:
+            return (itype(IMM_LOGIC[mnemonic], reg(ops[1]), reg(ops[0]), unsigned16(ops[2])),)
+        if mnemonic == "lui":
+            return (itype(0b001111, 0, reg(ops[0]), unsigned16(ops[1])),)
+        if mnemonic in MEMORY:
+            rt = number(ops[0]) if mnemonic == "cache" else reg(ops[0])
+            offset, base = memory_operand(ops[1])
+            return (itype(MEMORY[mnemonic], base, rt, offset),)
+        if mnemonic in REGIMM_TRAP:
+            return (itype(1, reg(ops[0]), REGIMM_TRAP[mnemonic], signed16(ops[1])),)
+        if mnemonic in FLOAT_MEMORY:
+            offset, base = memory_operand(ops[1])
+            return (itype(FLOAT_MEMORY[mnemonic], base, freg(ops[0]), offset),)
+        if mnemonic in FLOAT_MOVE:
+            fs = reg(ops[1]) if mnemonic in ("cfc1", "ctc1") else freg(ops[1])
+            return (rtype(COP1, FLOAT_MOVE[mnemonic], reg(ops[0]), fs, 0, 0),)
+        if float_op(mnemonic) is not None:
+            op, fmt = float_op(mnemonic)
+            if op in FLOAT_THREE:
+                return (rtype(COP1, fmt, freg(ops[2]), freg(ops[1]), freg(ops[0]), FLOAT_THREE[op]),)
+            if op in FLOAT_TWO:
+                return (rtype(COP1, fmt, 0, freg(ops[1]), freg(ops[0]), FLOAT_TWO[op]),)
+            return (rtype(COP1, fmt, freg(ops[1]), freg(ops[0]), 0, 0b110000 | FLOAT_COMPARE[op]),)
+        if mnemonic == "nop":
+            return (0,)
+        if mnemonic == "move":
+            return (rtype(0, reg(ops[1]), 0, reg(ops[0]), 0, ARITH["daddu"]),)
+        if mnemonic == "li":
+            rt = reg(ops[0])
+            value = number(ops[1])
+            if 0 <= value <= 0xffff:
+                return (itype(0b001101, 0, rt, value),)
+            if -0x8000 <= value < 0:
+                return (itype(0b001001, 0, rt, value & 0xffff),)
+            if not -0x8000_0000 <= value <= 0xffff_ffff:
+                raise AsmError(f"{value:#x} doesn't fit in 32 bits")
+            value &= 0xffff_ffff
+            return (lui(rt, value >> 16), ori(rt, rt, value & 0xffff))
+        if mnemonic == ".space":
+            return (0,) * size(mnemonic, ops)
+    except IndexError:
+        raise AsmError(f"not enough operands for {mnemonic}") from None
+    raise AsmError(f"unknown instruction {mnemonic}")
+
+
+@lru_cache(maxsize=1 << 16)
+def parse_line(line):
+    """(label, mnemonic, operands, size, words), words being None when the
+    line needs the labels to encode"""
+    label, mnemonic, operands = parse(line)
+    if mnemonic is None:
+        return label, None, operands, 0, ()
+    words = None if mnemonic in NEEDS_LABELS else encode(mnemonic, operands)
+    return label, mnemonic, operands, size(mnemonic, operands), words
+
+
+def ins(text):
+    """Assembles a single instruction that doesn't refer to labels"""
+    _, mnemonic, operands = parse(text)
+    if mnemonic is None:
+        raise AsmError(f"no instruction in {text!r}")
+    words = encode(mnemonic, operands)
+    if len(words) != 1:
+        raise AsmError(f"{text!r} is {len(words)} instructions")
+    return words[0]
+
+
+class Program:
+    def __init__(self, base, words, labels):
+        self.base = base
+        self.words = words
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, label):
+        return self.labels[label]
+
+    def image(self, data=()):
+        """A loader.Image of the program, with [(addr, bytes)] of data"""
+        from tb import loader
+        return loader.from_words(self.words, self.base, data)
+
+
+def assemble(source, base=RESET_VECTOR):
+    if isinstance(source, str):
+        source = source.splitlines()
+
+    # First pass, where everything is
+    lines = []
+    labels = {}
+    pc = base
+    for number_, line in enumerate(source, 1):
+        try:
+            label, mnemonic, operands, words, encoded = parse_line(line)
+            if label is not None:
+                if label in labels:
+                    raise AsmError(f"{label} defined twice")
+                labels[label] = pc
+            if mnemonic is not None:
+                lines.append((number_, line, pc, mnemonic, operands, encoded))
+                pc += 4 * words
+        except AsmError as e:
+            raise AsmError(f"line {number_}: {e}: {line.strip()}") from None
+
+    def target(text, pc):
+        match = TARGET.match(text.strip())
+        if match is None or (match.group(1) != "." and match.group(1) not in labels):
+            if is_number(text):
+                return number(text)
+            raise AsmError(f"unknown label {text!r}")
+        name, sign, offset = match.groups()
+        value = pc if name == "." else labels[name]
+        if offset is not None:
+            value += number(offset) if sign == "+" else -number(offset)
+        return value
+
+    def branch_offset(text, pc):
+        offset = target(text, pc) - (pc + 4)
+        if offset & 3 or not -0x20000 <= offset < 0x20000:
+            raise AsmError(f"can't branch from {pc:#x} to {text}")
+        return (offset >> 2) & 0xffff
+
+    # Second pass, encoding
+    words = []
+    in_delay_slot = False
+    for number_, line, pc, mnemonic, operands, encoded in lines:
+        control = mnemonic in CONTROL
+        if encoded is not None and not in_delay_slot:
+            words.extend(encoded)
+            in_delay_slot = control
+            continue
+        ops = operands
+        try:
+            if in_delay_slot and control:
+                raise AsmError(f"{mnemonic} in a delay slot")
+            if encoded is not None:
+                out = encoded
+            elif mnemonic in BRANCH_TWO:
+                out = (itype(BRANCH_TWO[mnemonic], reg(ops[0]), reg(ops[1]), branch_offset(ops[2], pc)),)
+            elif mnemonic in BRANCH_ONE:
+                out = (itype(BRANCH_ONE[mnemonic], reg(ops[0]), 0, branch_offset(ops[1], pc)),)
+            elif mnemonic in REGIMM_BRANCH:
+                out = (itype(1, reg(ops[0]), REGIMM_BRANCH[mnemonic], branch_offset(ops[1], pc)),)
+            elif mnemonic in FLOAT_BRANCH:
+                out = (itype(COP1, 0b01000, FLOAT_BRANCH[mnemonic], branch_offset(ops[0], pc)),)
+            elif mnemonic == "b":
+                out = (itype(0b000100, 0, 0, branch_offset(ops[0], pc)),)
+            elif mnemonic in JUMP:
+                dest = target(ops[0], pc)
+                if dest & 3 or (dest ^ (pc + 4)) & ~0x0fff_ffff & 0xffff_ffff:
+                    raise AsmError(f"can't jump from {pc:#x} to {ops[0]}")
+                out = (jtype(JUMP[mnemonic], (dest >> 2) & 0x3ff_ffff),)
+            elif mnemonic == "la":
+                rt = reg(ops[0])
+                value = target(ops[1], pc) & 0xffff_ffff
+                out = (lui(rt, value >> 16), ori(rt, rt, value & 0xffff))
+            else:
+                out = tuple(target(op, pc) & 0xffff_ffff for op in ops)
+            # Only the first word would run in the slot
+            if in_delay_slot and len(out) > 1:
+                raise AsmError(f"{mnemonic} is {len(out)} words, in a delay slot")
+        except (AsmError, IndexError) as e:
+            raise AsmError(f"line {number_}: {e}: {line.strip()}") from None
+        words.extend(out)
+        in_delay_slot = control
+
+    if in_delay_slot:
+        raise AsmError("the last instruction needs a delay slot")
+
+    return Program(base, words, labels)
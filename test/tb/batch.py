@@ -0,0 +1,176 @@
+"""Driver for the batch top (src/batch.spade, generated by tools/gen_batch.py).
+
+Runs a list of programs on the cpus of one simulator. Whenever a cpu
+finishes its program it's reset and preloaded with the next one from the
+queue, while the others keep running, so the simulator never idles.
+
+    programs = [Program("add", icache, dcache, until=lambda writes: writes), ...]
+    results = await Batch(dut).run(programs)
+
+The preload and reset sequence is the same as Core.start in test/core.py.
+"""
+
+from collections import deque
+
+import cocotb
+from spade import SpadeExt
+from cocotb.triggers import RisingEdge
+
+from tb.clock import two_phase
+from tb.mmio import Host, external_data
+
+
+class Program:
+    def __init__(self, name, icache, dcache, cycles=1000, until=None):
+        """icache and dcache are lists of (addr, data) like Core.start takes.
+        The program runs for at most `cycles` cycles, until it writes the
+        exit register (see tb/mmio.py), or until `until(writes)` returns true
+        after an external write."""
+        self.name = name
+        self.icache = icache
+        self.dcache = dcache
+        self.cycles = cycles
+        self.until = until
+
+
+class ProgramResult:
+    def __init__(self, name, lane, writes, cycles, pc, status, host):
+        self.name = name
+        # which cpu it ran on
+        self.lane = lane
+        # (addr, data) of every external write, in order
+        self.writes = writes
+        self.cycles = cycles
+        self.pc = pc
+        self.status = status
+        # None if the program didn't exit by itself
+        self.exit_code = host.exit_code
+        self.console = host.console
+        self.reports = host.reports
+
+    def __repr__(self):
+        return (f"ProgramResult({self.name!r}, lane={self.lane}, cycles={self.cycles}, "
+                f"exit_code={self.exit_code}, writes={self.writes})")
+
+
+class Lane:
+    """One of the cpus in the batch top"""
+
+    def __init__(self, s, k):
+        self.k = k
+        self.i = s.i
+        self.o = getattr(s.o, f"cpu{k}")
+
+    def set(self, port, value):
+        setattr(self.i, f"{port}_{self.k}", value)
+
+    def pc(self):
+        try:
+            return int(self.o.pc.value(), 10)
+        except:
+            return 0xffffffff
+
+    def external_write(self):
+        if self.o.external.write == False:
+            return None
+        addr = int(self.o.external.addr.value())
+        size = 1 + int(self.o.external.size.value())
+        data = int(self.o.external.data.value())
+        return (addr, external_data(addr, size, data))
+
+    def idle(self):
+        self.set("rst", "true")
+        self.set("icache_write", "None")
+        self.set("dcache_write", "None")
+
+    def run(self, program):
+        """Generator doing one cycle of work per step, returning a ProgramResult"""
+        self.idle()
+        for _ in range(3):
+            yield
+
+        for addr, data in program.icache:
+            index = (addr >> 3) & 0x7ff
+            tag = (addr >> 12) & 0xfffff
+            self.set("icache_write", f"Some(({index}, {tag}, {data}))")
+            yield
+        self.set("icache_write", "None")
+
+        for addr, data in program.dcache:
+            index = (addr >> 4) & 0xff
+            tag = (addr >> 12) & 0xfffff
+            self.set("dcache_write", f"Some(({index}, {tag}, {data}))")
+            yield
+        self.set("dcache_write", "None")
+
+        for _ in range(5):
+            yield
+        self.set("rst", "false")
+
+        writes = []
+        cycles = 0
+        host = Host(self.o)
+        while cycles < program.cycles:
+            yield
+            cycles += 1
+            if host.sample():
+                break
+            write = self.external_write()
+            if write is not None:
+                writes.append(write)
+                if program.until is not None and program.until(writes):
+                    break
+
+        return ProgramResult(program.name, self.k, writes, cycles, self.pc(), self.o.status.value(), host)
+
+
+class Batch:
+    def __init__(self, dut):
+        self.dut = dut
+        self.s = SpadeExt(dut)
+
+        self.phase1 = dut.phase1_i
+        self.phase2 = dut.phase2_i
+
+        n = 0
+        while hasattr(dut, f"rst_{n}_i"):
+            n += 1
+        self.lanes = [Lane(self.s, k) for k in range(n)]
+
+    async def start(self):
+        await cocotb.start(two_phase(self.phase1, self.phase2))
+
+        for lane in self.lanes:
+            lane.idle()
+
+    async def clock(self):
+        await RisingEdge(self.phase2)
+
+    async def run(self, programs):
+        """Runs every program, returning their results in the same order"""
+        await self.start()
+
+        queue = deque(enumerate(programs))
+        results = [None] * len(programs)
+        # lane -> (program index, generator)
+        running = {}
+
+        while queue or running:
+            for lane in self.lanes:
+                if lane not in running and queue:
+                    index, program = queue.popleft()
+                    self.dut._log.info(f"starting {program.name} on cpu{lane.k}")
+                    running[lane] = (index, lane.run(program))
+
+            for lane, (index, steps) in list(running.items()):
+                try:
+                    next(steps)
+                except StopIteration as done:
+                    results[index] = done.value
+                    del running[lane]
+                    lane.idle()
+
+            if running:
+                await self.clock()
+
+        return results
@@ -0,0 +1,138 @@
+"""Simulation checkpoints.
+
+A checkpoint is the value of every signal and memory word in the design:
+the pc and the other pipeline registers, the register file, and the icache
+and dcache banks and tags. They are written as gzipped json, with values
+stored as hex where they have no x/z bits.
+
+Restoring deposits every value back into a freshly started simulator. As
+all values come from the same instant, wires and registers stay consistent
+with each other, so the design continues exactly where the checkpoint was
+taken. Both need to be done at the same point of the clock cycle, with the
+clocks themselves left alone.
+
+    await checkpoint.save(dut, "warm.ckpt.gz", skip={"phase1_i", "phase2_i"})
+    ...
+    await checkpoint.restore(dut, "warm.ckpt.gz", skip={"phase1_i", "phase2_i"})
+"""
+
+import glob
+import gzip
+import hashlib
+import json
+import os
+
+from cocotb.handle import (
+    ArrayObject,
+    HierarchyArrayObject,
+    HierarchyObject,
+    LogicArrayObject,
+    LogicObject,
+    PackedObject,
+)
+from cocotb.simtime import get_sim_time
+from cocotb.triggers import ReadWrite
+
+from tb import ROOT
+
+VERSION = 1
+
+DIR = os.environ.get("R4300_CHECKPOINT_DIR", os.path.join(ROOT, "build", "checkpoints"))
+ENABLED = os.environ.get("R4300_CHECKPOINTS", "1") != "0"
+
+
+class StaleCheckpoint(Exception):
+    pass
+
+
+def design_hash():
+    h = hashlib.sha1()
+    for path in sorted(glob.glob(os.path.join(ROOT, "src", "*.spade"))):
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def path_for(top, *content):
+    """A checkpoint path unique to this top, the current sources and whatever
+    else the state depends on, like the preloaded program"""
+    h = hashlib.sha1(design_hash().encode())
+    h.update(repr(content).encode())
+    return os.path.join(DIR, f"{top}-{h.hexdigest()[:16]}.ckpt.gz")
+
+
+def signals(handle, skip=()):
+    """Yields (path, handle) for every value holding object below handle"""
+    for child in handle:
+        name = child._name
+        if name in skip:
+            continue
+
+        if isinstance(child, (HierarchyObject, HierarchyArrayObject)):
+            yield from signals(child, skip)
+        elif isinstance(child, (LogicObject, LogicArrayObject, PackedObject)):
+            if not child.is_const:
+                yield child._path, child
+        elif isinstance(child, ArrayObject):
+            # Memories. Each word is its own handle
+            for word in child:
+                yield word._path, word
+
+
+def encode(value):
+    binstr = str(value)
+    if set(binstr) <= {"0", "1"}:
+        return f"{len(binstr)}'h{int(binstr, 2):x}"
+    return binstr
+
+
+def decode(text):
+    """The value as a binary string, which both single bit and vector handles take"""
+    if "'h" in text:
+        bits, value = text.split("'h")
+        return format(int(value, 16), f"0{bits}b")
+    return text
+
+
+def snapshot(dut, skip=()):
+    return {path: encode(h.value) for path, h in signals(dut, skip)}
+
+
+async def save(dut, path, meta=None, skip=()):
+    """Writes the state of the whole design to path, along with some json-able meta data"""
+    await ReadWrite()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    state = {
+        "version": VERSION,
+        "top": dut._name,
+        "sim_time_ps": get_sim_time("ps"),
+        "meta": meta,
+        "signals": snapshot(dut, skip),
+    }
+    with gzip.open(path, "wt") as f:
+        json.dump(state, f, separators=(",", ":"))
+
+
+async def restore(dut, path, skip=()):
+    """Loads a checkpoint written by save into the running simulation, returning its meta data"""
+    with gzip.open(path, "rt") as f:
+        state = json.load(f)
+
+    if state["version"] != VERSION:
+        raise StaleCheckpoint(f"{path}: checkpoint version {state['version']}, expected {VERSION}")
+    if state["top"] != dut._name:
+        raise StaleCheckpoint(f"{path}: checkpoint of {state['top']}, but this is {dut._name}")
+
+    # Check everything matches before touching the design, so a failed
+    # restore leaves the simulation as it was
+    values = state["signals"]
+    handles = dict(signals(dut, skip))
+    if handles.keys() != values.keys():
+        raise StaleCheckpoint(f"{path}: signals don't match this design")
+
+    await ReadWrite()
+    for name, h in handles.items():
+        h.value = decode(values[name])
+
+    await ReadWrite()
+    return state["meta"]
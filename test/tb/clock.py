@@ -0,0 +1,25 @@
+"""The two phase clock of the cpu tops.
+
+phase1 and phase2 are never high at the same time. The cpu, pipeline,
+register file, batch and selfcheck tops all take the same clock:
+
+    await cocotb.start(two_phase(dut.phase1_i, dut.phase2_i))
+"""
+
+from cocotb.triggers import Timer
+
+# clock signals, which testbench helpers like checkpoints leave alone
+CLOCKS = {"phase1_i", "phase2_i"}
+
+
+async def two_phase(phase1, phase2):
+    # pre-construct triggers for performance
+    time = Timer(10, units="ps")
+    await Timer(5, units="ps")
+    while True:
+        phase1.value = 1
+        phase2.value = 0
+        await time
+        phase1.value = 0
+        phase2.value = 1
+        await time
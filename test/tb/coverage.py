@@ -0,0 +1,165 @@
+"""Functional coverage collection.
+
+The counters live in hardware (src/coverage.spade), so the tests don't pay
+anything per cycle for them. Each test file reads them back once at the end
+of its run with `collect`, which writes one json file per simulator process.
+Running this file merges all of those into one report:
+
+    R4300_COVERAGE=1 swim test
+    python test/tb/coverage.py [build/coverage]
+
+The report directory defaults to build/coverage, set R4300_COVERAGE_DIR to
+put it somewhere else.
+"""
+
+import glob
+import json
+import os
+import sys
+import time
+
+ENABLED = os.environ.get("R4300_COVERAGE", "") not in ("", "0")
+DIR = os.environ.get(
+    "R4300_COVERAGE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "build", "coverage"),
+)
+
+BYPASS = ["Zero", "ExResult", "DcResult", "Normal"]
+
+INTERLOCK = [
+    "None",
+    "InstructionTlbMiss",
+    "InstructionCacheBusy",
+    "LoadInterlock",
+    "MultiCycleInterlock",
+    "Coprocessor2Interlock",
+    "DataCacheMiss",
+    "DataCacheBusy",
+    "CacheOp",
+    "Coprocessor0Bypass",
+]
+
+EXCEPTION = [
+    "None",
+    "Reset",
+    "Nmi",
+    "DataTLBMiss",
+    "DataTLBInvalid",
+    "DataTLBModification",
+    "ReservedInstruction",
+    "Unimplemented",
+    "Syscall",
+]
+
+
+def mem_bins():
+    bins = {}
+    for store, kind in ((0, "load"), (1, "store")):
+        for size in range(8):
+            for align in range(8 - size):
+                bins[(store << 6) | (size << 3) | align] = f"{kind} MemMask({size}, {align})"
+    return bins
+
+
+# name -> (bank, {bin: bin name}). Must match the bank layout in coverage_counters
+SPACES = {
+    "rs_bypass": (0, dict(enumerate(BYPASS))),
+    "rt_bypass": (1, dict(enumerate(BYPASS))),
+    "load_interlock": (2, {0: "none", 1: "rs", 2: "rt", 3: "rs+rt"}),
+    "interlock": (3, dict(enumerate(INTERLOCK))),
+    "exception": (4, dict(enumerate(EXCEPTION))),
+    "mem": (5, mem_bins()),
+}
+
+
+async def collect(s, clock, top, latency=1):
+    """Read every counter back and write them to the coverage directory.
+
+    `clock` advances the simulation by one cycle, and `latency` is the number
+    of cycles between setting coverage_bin and seeing the count on the output.
+    Counting is paused while the read is in progress.
+    """
+    reads = [
+        (space, b, (bank << 7) | b)
+        for space, (bank, bins) in SPACES.items()
+        for b in bins
+    ]
+
+    counts = {space: {} for space in SPACES}
+    for i in range(len(reads) + latency - 1):
+        if i < len(reads):
+            s.i.coverage_bin = f"Some({reads[i][2]})"
+        await clock()
+
+        j = i - (latency - 1)
+        if j >= 0:
+            space, b, _ = reads[j]
+            counts[space][SPACES[space][1][b]] = int(s.o.coverage.value())
+
+    s.i.coverage_bin = "None"
+
+    # The counters accumulate over every test in this process, so there is
+    # only ever one file per process
+    os.makedirs(DIR, exist_ok=True)
+    with open(os.path.join(DIR, f"{top}-{os.getpid()}.json"), "w") as f:
+        json.dump({
+            "top": top,
+            "cpu_seconds": time.process_time(),
+            "counts": counts,
+        }, f, indent=1)
+
+    return counts
+
+
+def merge(directory=DIR):
+    counts = {space: {name: 0 for name in bins.values()} for space, (_, bins) in SPACES.items()}
+    cpu_seconds = 0.0
+    runs = 0
+
+    for path in sorted(glob.glob(os.path.join(directory, "*-*.json"))):
+        with open(path) as f:
+            run = json.load(f)
+        runs += 1
+        cpu_seconds += run["cpu_seconds"]
+        for space, bins in run["counts"].items():
+            for name, count in bins.items():
+                counts[space][name] += count
+
+    return {"runs": runs, "cpu_seconds": cpu_seconds, "counts": counts}
+
+
+def report(merged):
+    lines = []
+    hit_total = 0
+    bin_total = 0
+    holes = []
+
+    for space, bins in merged["counts"].items():
+        hit = sum(1 for count in bins.values() if count)
+        hit_total += hit
+        bin_total += len(bins)
+        lines.append(f"{space:<16}{hit:>4}/{len(bins):<4} {100.0 * hit / len(bins):6.1f}%")
+        holes += [f"{space}: {name}" for name, count in bins.items() if not count]
+
+    lines.append("")
+    lines.append(f"{'total':<16}{hit_total:>4}/{bin_total:<4} {100.0 * hit_total / bin_total:6.1f}%")
+
+    seconds = merged["cpu_seconds"]
+    if seconds:
+        lines.append(f"{merged['runs']} runs, {seconds:.2f} cpu seconds, "
+                     f"{hit_total / seconds:.2f} bins per cpu second")
+
+    if holes:
+        lines.append("")
+        lines.append("holes:")
+        lines += [f"  {hole}" for hole in holes]
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else DIR
+    merged = merge(directory)
+    with open(os.path.join(directory, "report.json"), "w") as f:
+        json.dump(merged, f, indent=1)
+    print(report(merged))
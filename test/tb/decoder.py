@@ -0,0 +1,305 @@
+"""Reference instruction decoder, in numpy.
+
+Decodes arrays of instruction words into InstructionInfo packed the same way
+as pack_info in src/instructions.spade, written from the opcode tables in the
+VR4300 manual rather than from decode(). test/decoder.py checks decode()
+against it, and anything else that needs to know what an instruction is
+(predecoding, a golden model) can use it too:
+
+    packed = decoder.decode(np.array([0x24420001, 0x00000000], dtype=np.uint32))
+    decoder.describe(packed[0])  # "ReadInterger RsImmSigned Add32 ..."
+
+Each table entry is what decode() should give, and ZERO holds the fields that
+have to be zero, which give a reserved instruction exception otherwise.
+Instructions the cpu doesn't do yet decode as Unimplemented, and encodings
+the architecture doesn't define as Reserved.
+"""
+
+import numpy as np
+
+# Declaration order in src/instructions.spade
+REGFILE_MODES = ["Nop", "ReadInterger", "ReadFloat", "ReadFloatAndUnpack", "ReadIntegerAndFloat"]
+RF_MUXINGS = ["RsRt", "RsImmSigned", "RsImmUnsigned", "ImmUpper", "Shift", "Shift64", "Memory",
+              "MemoryNoWB", "Jump26", "Float", "FloatUnit", "MoveToFloat", "MoveFromFloat"]
+EX_MODES = ["Nop", "JumpReg", "JumpImm26", "Branch", "BranchLikely", "Compare", "Memory",
+            "MemoryLeft", "MemoryRight", "Add32", "Add64", "Sub32", "Sub64", "SetLess",
+            "SetLessUnsigned", "Shift", "And", "Or", "Xor", "Nor", "Mul", "Div", "Float"]
+COMPARES = ["Equal", "NotEqual", "GreaterThanZero", "GreaterEqualZero", "LessThanZero",
+            "LessEqualZero", "FloatTrue", "FloatFalse"]
+TRAPS = ["None", "Reserved", "Unimplemented", "Syscall", "Carry", "SignedCarry", "NotCarry",
+         "NotSignedCarry", "Compare"]
+MEM_MODES = ["Nop", "Load", "Store", "Cache", "LinkedLoad", "ConditionalStore"]
+SHIFTS = ["LeftLogic", "RightLogic", "RightArith"]
+SHIFT_SRCS = ["Imm", "Imm32", "Reg5", "Reg6", "Const16"]
+FORMATS = ["Single", "Double", "Word", "Long"]
+ROUND_MODES = [None, "Nearest", "Zero", "Up", "Down"]
+FLOAT_OPS = ["Add", "Sub", "Mul", "Convert", "Compare", "Abs", "Mov", "Neg", "MoveTo", "MoveTo64",
+             "MoveFrom", "MoveFrom64", "ControlTo", "ControlFrom"]
+
+
+def pack(regfile, muxing, ex, fields=0, trap="None", mem="Nop"):
+    return (REGFILE_MODES.index(regfile) | RF_MUXINGS.index(muxing) << 3 | EX_MODES.index(ex) << 7
+            | fields << 12 | TRAPS.index(trap) << 28 | MEM_MODES.index(mem) << 32)
+
+def unpack(packed):
+    """-> (regfile mode, rf muxing, ex mode, ex fields, trap, mem mode)"""
+    packed = int(packed)
+    return (REGFILE_MODES[packed & 7], RF_MUXINGS[packed >> 3 & 15], EX_MODES[packed >> 7 & 31],
+            packed >> 12 & 0xffff, TRAPS[packed >> 28 & 15], MEM_MODES[packed >> 32 & 7])
+
+def describe(packed):
+    regfile, muxing, ex, fields, trap, mem = unpack(packed)
+    if ex in ("Branch", "BranchLikely", "Compare"):
+        ex = f"{ex}({COMPARES[fields]})"
+    elif ex.startswith("Memory"):
+        ex = f"{ex}({fields})"
+    elif ex == "Shift":
+        ex = f"Shift({SHIFTS[fields & 3]}, {SHIFT_SRCS[fields >> 2]})"
+    elif ex in ("Mul", "Div"):
+        ex = f"{ex}({fields & 63}, {bool(fields >> 6)})"
+    elif ex == "Float":
+        op = FLOAT_OPS[fields & 15]
+        if op == "Convert":
+            op = f"Convert({FORMATS[fields >> 6 & 3]}, {ROUND_MODES[fields >> 8]})"
+        elif op == "Compare":
+            op = f"Compare({fields >> 6})"
+        ex = f"Float({op}, {FORMATS[fields >> 4 & 3]})"
+    elif fields:
+        ex = f"{ex}[{fields:#x}]"
+    return f"{regfile} {muxing} {ex} {trap} {mem}"
+
+
+# The helpers of instructions.spade
+
+RESERVED = pack("Nop", "RsRt", "Nop", trap="Reserved")
+UNIMPLEMENTED = pack("Nop", "RsRt", "Nop", trap="Unimplemented")
+
+def compare_fields(cmp):
+    return COMPARES.index(cmp)
+
+def alu(ex, muxing="RsRt", trap="None", fields=0):
+    return pack("ReadInterger", muxing, ex, fields, trap)
+
+def shift(direction, src):
+    return alu("Shift", fields=SHIFTS.index(direction) | SHIFT_SRCS.index(src) << 2)
+
+def branch(cmp, likely=False):
+    return pack("ReadInterger", "RsImmSigned", "BranchLikely" if likely else "Branch", compare_fields(cmp))
+
+def memory(size, mem, ex="Memory", regfile="ReadInterger"):
+    muxing = "MemoryNoWB" if mem == "Store" else "Memory"
+    return pack(regfile, muxing, ex, size, mem=mem)
+
+def float_fields(op, fmt, to=None, rm=None, cond=0):
+    args = FORMATS.index(to) | ROUND_MODES.index(rm) << 2 if op == "Convert" else cond
+    return FLOAT_OPS.index(op) | FORMATS.index(fmt) << 4 | args << 6
+
+def float_unit(op, fmt, **args):
+    # conversions don't read ft
+    regfile = "ReadFloat" if op == "Convert" else "ReadFloatAndUnpack"
+    return pack(regfile, "FloatUnit", "Float", float_fields(op, fmt, **args))
+
+
+# Fields, as masks of the instruction word
+RS = 0x1f << 21
+RT = 0x1f << 16
+RD = 0x1f << 11
+SA = 0x1f << 6
+LOW = 0x7ff
+
+PRIMARY = [RESERVED] * 64
+PRIMARY[0b000010] = pack("ReadInterger", "Jump26", "JumpImm26")  # J
+PRIMARY[0b000011] = pack("ReadInterger", "Jump26", "JumpImm26")  # JAL
+PRIMARY[0b000100] = branch("Equal")  # BEQ
+PRIMARY[0b000101] = branch("NotEqual")  # BNE
+PRIMARY[0b000110] = branch("LessEqualZero")  # BLEZ
+PRIMARY[0b000111] = branch("GreaterThanZero")  # BGTZ
+PRIMARY[0b001000] = alu("Add32", "RsImmSigned", "SignedCarry")  # ADDI
+PRIMARY[0b001001] = alu("Add32", "RsImmSigned")  # ADDIU
+PRIMARY[0b001010] = alu("SetLess", "RsImmSigned")  # SLTI
+PRIMARY[0b001011] = alu("SetLessUnsigned", "RsImmSigned")  # SLTIU
+PRIMARY[0b001100] = alu("And", "RsImmUnsigned")  # ANDI
+PRIMARY[0b001101] = alu("Or", "RsImmUnsigned")  # ORI
+PRIMARY[0b001110] = alu("Xor", "RsImmUnsigned")  # XORI
+PRIMARY[0b001111] = pack("Nop", "RsImmSigned", "Shift", SHIFT_SRCS.index("Const16") << 2)  # LUI
+PRIMARY[0b010000] = UNIMPLEMENTED  # COP0
+PRIMARY[0b010010] = UNIMPLEMENTED  # COP2
+PRIMARY[0b010100] = branch("Equal", likely=True)  # BEQL
+PRIMARY[0b010101] = branch("NotEqual", likely=True)  # BNEL
+PRIMARY[0b010110] = branch("LessEqualZero", likely=True)  # BLEZL
+PRIMARY[0b010111] = branch("GreaterThanZero", likely=True)  # BGTZL
+PRIMARY[0b011000] = alu("Add64", "RsImmSigned", "SignedCarry")  # DADDI
+PRIMARY[0b011001] = alu("Add64", "RsImmSigned")  # DADDIU
+PRIMARY[0b011010] = memory(8, "Load", "MemoryLeft")  # LDL
+PRIMARY[0b011011] = memory(8, "Load", "MemoryRight")  # LDR
+PRIMARY[0b100000] = memory(1, "Load")  # LB
+PRIMARY[0b100001] = memory(2, "Load")  # LH
+PRIMARY[0b100010] = memory(4, "Load", "MemoryLeft")  # LWL
+PRIMARY[0b100011] = memory(4, "Load")  # LW
+PRIMARY[0b100100] = memory(1, "Load")  # LBU
+PRIMARY[0b100101] = memory(2, "Load")  # LHU
+PRIMARY[0b100110] = memory(4, "Load", "MemoryRight")  # LWR
+PRIMARY[0b100111] = memory(4, "Load")  # LWU
+PRIMARY[0b101000] = memory(1, "Store")  # SB
+PRIMARY[0b101001] = memory(2, "Store")  # SH
+PRIMARY[0b101010] = memory(4, "Store", "MemoryLeft")  # SWL
+PRIMARY[0b101011] = memory(4, "Store")  # SW
+PRIMARY[0b101100] = memory(8, "Store", "MemoryLeft")  # SDL
+PRIMARY[0b101101] = memory(8, "Store", "MemoryRight")  # SDR
+PRIMARY[0b101110] = memory(4, "Store", "MemoryRight")  # SWR
+PRIMARY[0b101111] = UNIMPLEMENTED  # CACHE
+PRIMARY[0b110000] = memory(4, "LinkedLoad")  # LL
+PRIMARY[0b110001] = memory(4, "Load", regfile="ReadIntegerAndFloat")  # LWC1
+PRIMARY[0b110010] = UNIMPLEMENTED  # LWC2
+PRIMARY[0b110100] = memory(8, "LinkedLoad")  # LLD
+PRIMARY[0b110101] = memory(8, "Load", regfile="ReadIntegerAndFloat")  # LDC1
+PRIMARY[0b110110] = UNIMPLEMENTED  # LDC2
+PRIMARY[0b110111] = memory(8, "Load")  # LD
+PRIMARY[0b111000] = memory(4, "ConditionalStore")  # SC
+PRIMARY[0b111001] = memory(4, "Store", regfile="ReadIntegerAndFloat")  # SWC1
+PRIMARY[0b111010] = UNIMPLEMENTED  # SWC2
+PRIMARY[0b111100] = memory(8, "ConditionalStore")  # SCD
+PRIMARY[0b111101] = memory(8, "Store", regfile="ReadIntegerAndFloat")  # SDC1
+PRIMARY[0b111110] = UNIMPLEMENTED  # SDC2
+PRIMARY[0b111111] = memory(8, "Store")  # SD
+
+PRIMARY_ZERO = [0] * 64
+for op in [0b000110, 0b000111, 0b010110, 0b010111]:  # BLEZ, BGTZ and their likely versions
+    PRIMARY_ZERO[op] = RT
+PRIMARY_ZERO[0b001111] = RS  # LUI
+
+SPECIAL = [RESERVED] * 64
+SPECIAL[0b000000] = shift("LeftLogic", "Imm")  # SLL
+SPECIAL[0b000010] = shift("RightLogic", "Imm")  # SRL
+SPECIAL[0b000011] = shift("RightArith", "Imm")  # SRA
+SPECIAL[0b000100] = shift("LeftLogic", "Reg5")  # SLLV
+SPECIAL[0b000110] = shift("RightLogic", "Reg5")  # SRLV
+SPECIAL[0b000111] = shift("RightArith", "Reg5")  # SRAV
+SPECIAL[0b001000] = alu("JumpReg")  # JR
+SPECIAL[0b001001] = alu("JumpReg")  # JALR
+SPECIAL[0b001100] = pack("Nop", "RsRt", "Nop", trap="Syscall")  # SYSCALL
+SPECIAL[0b001101] = UNIMPLEMENTED  # BREAK
+SPECIAL[0b001111] = pack("Nop", "RsRt", "Nop")  # SYNC
+for funct in range(0b010000, 0b010100):  # MFHI, MTHI, MFLO, MTLO
+    SPECIAL[funct] = UNIMPLEMENTED
+SPECIAL[0b010100] = shift("LeftLogic", "Reg6")  # DSLLV
+SPECIAL[0b010110] = shift("RightLogic", "Reg6")  # DSRLV
+SPECIAL[0b010111] = shift("RightArith", "Reg6")  # DSRAV
+for funct in range(0b011000, 0b100000):  # the multiplies and divides
+    SPECIAL[funct] = UNIMPLEMENTED
+SPECIAL[0b100000] = alu("Add32", trap="SignedCarry")  # ADD
+SPECIAL[0b100001] = alu("Add32")  # ADDU
+SPECIAL[0b100010] = alu("Sub32", trap="SignedCarry")  # SUB
+SPECIAL[0b100011] = alu("Sub32")  # SUBU
+SPECIAL[0b100100] = alu("And")  # AND
+SPECIAL[0b100101] = alu("Or")  # OR
+SPECIAL[0b100110] = alu("Xor")  # XOR
+SPECIAL[0b100111] = alu("Nor")  # NOR
+SPECIAL[0b101010] = alu("SetLess")  # SLT
+SPECIAL[0b101011] = alu("SetLessUnsigned")  # SLTU
+SPECIAL[0b101100] = alu("Add64", trap="SignedCarry")  # DADD
+SPECIAL[0b101101] = alu("Add64")  # DADDU
+SPECIAL[0b101110] = alu("Sub64", trap="SignedCarry")  # DSUB
+SPECIAL[0b101111] = alu("Sub64")  # DSUBU
+# The trap conditions are the ones decode() has, the pipeline doesn't raise them yet
+SPECIAL[0b110000] = alu("Sub64", trap="SignedCarry")  # TGE
+SPECIAL[0b110001] = alu("Sub64", trap="Carry")  # TGEU
+SPECIAL[0b110010] = alu("Sub64", trap="NotSignedCarry")  # TLT
+SPECIAL[0b110011] = alu("Sub64", trap="NotCarry")  # TLTU
+SPECIAL[0b110100] = alu("Compare", fields=compare_fields("Equal"), trap="Compare")  # TEQ
+SPECIAL[0b110110] = alu("Compare", fields=compare_fields("NotEqual"), trap="Compare")  # TNE
+SPECIAL[0b111000] = shift("LeftLogic", "Imm")  # DSLL
+SPECIAL[0b111010] = shift("RightLogic", "Imm")  # DSRL
+SPECIAL[0b111011] = shift("RightArith", "Imm")  # DSRA
+SPECIAL[0b111100] = shift("LeftLogic", "Imm32")  # DSLL32
+SPECIAL[0b111110] = shift("RightLogic", "Imm32")  # DSRL32
+SPECIAL[0b111111] = shift("RightArith", "Imm32")  # DSRA32
+
+SPECIAL_ZERO = [0] * 64
+SPECIAL_ZERO[0b001000] = RT | RD | SA  # JR
+SPECIAL_ZERO[0b001001] = RT | SA  # JALR
+
+REGIMM = [RESERVED] * 32
+REGIMM[0b00000] = branch("LessThanZero")  # BLTZ
+REGIMM[0b00001] = branch("GreaterEqualZero")  # BGEZ
+REGIMM[0b00010] = branch("LessThanZero", likely=True)  # BLTZL
+REGIMM[0b00011] = branch("GreaterEqualZero", likely=True)  # BGEZL
+REGIMM[0b01000] = alu("Sub64", "RsImmSigned", "NotSignedCarry")  # TGEI
+REGIMM[0b01001] = alu("Sub64", "RsImmSigned", "NotCarry")  # TGEIU
+REGIMM[0b01010] = alu("Sub64", "RsImmSigned", "SignedCarry")  # TLTI
+REGIMM[0b01011] = alu("Sub64", "RsImmSigned", "Carry")  # TLTIU
+REGIMM[0b01100] = alu("Compare", "RsImmSigned", "Compare", compare_fields("Equal"))  # TEQI
+REGIMM[0b01110] = alu("Compare", "RsImmSigned", "Compare", compare_fields("NotEqual"))  # TNEI
+REGIMM[0b10000] = branch("LessThanZero")  # BLTZAL
+REGIMM[0b10001] = branch("GreaterEqualZero")  # BGEZAL
+REGIMM[0b10010] = branch("LessThanZero", likely=True)  # BLTZALL
+REGIMM[0b10011] = branch("GreaterEqualZero", likely=True)  # BGEZALL
+
+# COP1, by fmt (the rs field) and funct
+COP1 = np.full((32, 64), UNIMPLEMENTED, dtype=np.uint64)
+COP1_ZERO = [0] * 32
+for fmt, op, regfile, muxing in [
+    (0b00000, "MoveFrom", "ReadFloat", "MoveFromFloat"),  # MFC1
+    (0b00001, "MoveFrom64", "ReadFloat", "MoveFromFloat"),  # DMFC1
+    (0b00010, "ControlFrom", "Nop", "MoveFromFloat"),  # CFC1
+    (0b00100, "MoveTo", "ReadInterger", "MoveToFloat"),  # MTC1
+    (0b00101, "MoveTo64", "ReadInterger", "MoveToFloat"),  # DMTC1
+    (0b00110, "ControlTo", "ReadInterger", "MemoryNoWB"),  # CTC1
+]:
+    COP1[fmt, :] = pack(regfile, muxing, "Float", float_fields(op, "Long"))
+    COP1_ZERO[fmt] = LOW
+
+# BC1F, BC1T, BC1FL, BC1TL by rt, anything else in rt is reserved
+BC1 = [pack("Nop", "RsImmSigned", "BranchLikely" if likely else "Branch", compare_fields(cmp))
+       for likely in [False, True] for cmp in ["FloatFalse", "FloatTrue"]] + [RESERVED]
+
+for fmt, name in [(0b10000, "Single"), (0b10001, "Double")]:
+    for funct, op in [(0b000000, "Add"), (0b000001, "Sub"), (0b000010, "Mul")]:
+        COP1[fmt, funct] = float_unit(op, name)
+    for funct, op in [(0b000101, "Abs"), (0b000110, "Mov"), (0b000111, "Neg")]:
+        COP1[fmt, funct] = pack("ReadFloat", "Float", "Float", float_fields(op, name))
+    # ROUND, TRUNC, CEIL and FLOOR, to .L and then to .W
+    for funct in range(0b001000, 0b010000):
+        to = "Long" if funct < 0b001100 else "Word"
+        COP1[fmt, funct] = float_unit("Convert", name, to=to, rm=ROUND_MODES[1 + (funct & 3)])
+    for funct, to in [(0b100000, "Single"), (0b100001, "Double"), (0b100100, "Word"), (0b100101, "Long")]:
+        if to != name:
+            COP1[fmt, funct] = float_unit("Convert", name, to=to)
+    for cond in range(16):
+        COP1[fmt, 0b110000 | cond] = pack("ReadFloatAndUnpack", "MemoryNoWB", "Float",
+                                         float_fields("Compare", name, cond=cond))
+
+for fmt, name in [(0b10100, "Word"), (0b10101, "Long")]:
+    COP1[fmt, 0b100000] = float_unit("Convert", name, to="Single")
+    COP1[fmt, 0b100001] = float_unit("Convert", name, to="Double")
+
+PRIMARY = np.array(PRIMARY, dtype=np.uint64)
+PRIMARY_ZERO = np.array(PRIMARY_ZERO, dtype=np.uint32)
+SPECIAL = np.array(SPECIAL, dtype=np.uint64)
+SPECIAL_ZERO = np.array(SPECIAL_ZERO, dtype=np.uint32)
+REGIMM = np.array(REGIMM, dtype=np.uint64)
+COP1_ZERO = np.array(COP1_ZERO, dtype=np.uint32)
+BC1 = np.array(BC1, dtype=np.uint64)
+
+
+def decode(words):
+    """uint32 array of instruction words -> uint64 array of packed InstructionInfo"""
+    words = np.asarray(words, dtype=np.uint32)
+    op = words >> 26
+    rs = words >> 21 & 0x1f
+    rt = words >> 16 & 0x1f
+    funct = words & 0x3f
+
+    special = op == 0b000000
+    regimm = op == 0b000001
+    cop1 = op == 0b010001
+
+    result = PRIMARY[op]
+    result = np.where(special, SPECIAL[funct], result)
+    result = np.where(regimm, REGIMM[rt], result)
+    result = np.where(cop1, COP1[rs, funct], result)
+    result = np.where(cop1 & (rs == 0b01000), BC1[np.minimum(rt, 4)], result)
+
+    zero = np.where(special, SPECIAL_ZERO[funct], PRIMARY_ZERO[op])
+    zero = np.where(cop1, COP1_ZERO[rs], zero)
+    return np.where(words & zero != 0, np.uint64(RESERVED), result)
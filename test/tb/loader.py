@@ -0,0 +1,167 @@
+"""Program loader, turning flat binaries and ELF files into cache preloads.
+
+    image = loader.load("build/fw/boot.elf")
+    await c.start(image.icache, image.dcache)
+
+    image = loader.from_words([lui(2, 0xa000), ...], data=[(0x10000, bytes(256))])
+
+Executable PT_LOAD segments go into the icache as big endian 64-bit words,
+everything else into the dcache as 128-bit lines, with .bss zero filled.
+Flat binaries are all code, loaded at the reset vector. Both caches are
+padded out to whole lines (32 bytes for the icache, which only writes the
+tag with the last word of a line, 16 for the dcache).
+
+Packing is done with numpy over a memory mapped file, and the result is
+kept in build/loader keyed by a hash of the file, so reloading the same
+firmware costs a hash and an np.load.
+"""
+
+import hashlib
+import os
+import struct
+
+import numpy as np
+
+from tb import ROOT
+
+RESET_VECTOR = 0xbfc00000
+
+ICACHE_LINE = 32
+DCACHE_LINE = 16
+
+CACHE_DIR = os.path.join(ROOT, "build", "loader")
+
+PT_LOAD = 1
+PF_X = 1
+
+# Bump when the packing changes, so old cache files are ignored
+VERSION = 2
+
+
+class Image:
+    def __init__(self, entry, iaddr, iword, daddr, dhi, dlo):
+        self.entry = entry
+        self.iaddr = iaddr
+        self.iword = iword
+        self.daddr = daddr
+        self.dhi = dhi
+        self.dlo = dlo
+
+    @property
+    def icache(self):
+        """[(addr, 64-bit word)], as Core.start takes"""
+        return list(zip(self.iaddr.tolist(), self.iword.tolist()))
+
+    @property
+    def dcache(self):
+        """[(addr, 128-bit line)], as Core.start takes"""
+        return [(addr, hi << 64 | lo) for addr, hi, lo in zip(self.daddr.tolist(), self.dhi.tolist(), self.dlo.tolist())]
+
+    def arrays(self):
+        return dict(entry=np.uint64(self.entry), iaddr=self.iaddr, iword=self.iword, daddr=self.daddr, dhi=self.dhi, dlo=self.dlo)
+
+    def __repr__(self):
+        return f"Image(entry=0x{self.entry:x}, {len(self.iaddr)} icache words, {len(self.daddr)} dcache lines)"
+
+
+def pack(segments, line, words):
+    """segments is [(addr, uint8 array)]. Returns the line aligned addresses
+    of every 64-bit word, and the words, big endian, as uint64 columns.
+    Segments sharing a line end up in the same one, where they overlap the
+    later segment wins"""
+    spans = sorted(
+        (addr & ~(line - 1), -(-(addr + len(contents)) // line) * line, i)
+        for i, (addr, contents) in enumerate(segments) if len(contents) > 0
+    )
+    groups = []
+    for start, end, i in spans:
+        if groups and start < groups[-1][1]:
+            groups[-1][1] = max(groups[-1][1], end)
+            groups[-1][2].append(i)
+        else:
+            groups.append([start, end, [i]])
+
+    addrs = []
+    data = []
+    for start, end, members in groups:
+        buf = np.zeros(end - start, dtype=np.uint8)
+        for i in sorted(members):
+            addr, contents = segments[i]
+            buf[addr - start:addr - start + len(contents)] = contents
+        count = len(buf) // 8
+        addrs.append(np.uint64(start) + np.arange(0, count * 8, 8 * words, dtype=np.uint64))
+        data.append(buf.view(">u8").astype(np.uint64).reshape(-1, words))
+    if not addrs:
+        return np.zeros(0, dtype=np.uint64), np.zeros((0, words), dtype=np.uint64)
+    return np.concatenate(addrs), np.concatenate(data)
+
+
+def build(code, data, entry):
+    """code and data are [(addr, uint8 array)]"""
+    iaddr, iword = pack(code, ICACHE_LINE, 1)
+    daddr, dline = pack(data, DCACHE_LINE, 2)
+    return Image(entry, iaddr, iword[:, 0], daddr, dline[:, 0], dline[:, 1])
+
+
+def from_words(words, base=RESET_VECTOR, data=()):
+    """An image from a list of 32-bit instructions at base, and [(addr, bytes)] of data"""
+    code = np.array(words, dtype=">u4").view(np.uint8)
+    data = [(addr, np.frombuffer(bytes(contents), dtype=np.uint8)) for addr, contents in data]
+    return build([(base, code)], data, base)
+
+
+def elf_segments(buf):
+    """Returns (entry, code, data) from the PT_LOAD segments of a big endian ELF"""
+    ident = bytes(buf[:16])
+    if ident[5] != 2:
+        raise ValueError("only big endian ELF files can be loaded")
+    if ident[4] == 1:
+        entry, phoff = struct.unpack_from(">I I", buf, 24)
+        phentsize, phnum = struct.unpack_from(">H H", buf, 42)
+        phdr = ">I I I I I I I I"
+    elif ident[4] == 2:
+        entry, phoff = struct.unpack_from(">Q Q", buf, 24)
+        phentsize, phnum = struct.unpack_from(">H H", buf, 54)
+        phdr = ">I I Q Q Q Q Q Q"
+    else:
+        raise ValueError(f"unknown ELF class {ident[4]}")
+
+    code = []
+    data = []
+    for i in range(phnum):
+        fields = struct.unpack_from(phdr, buf, phoff + i * phentsize)
+        if ident[4] == 1:
+            p_type, offset, vaddr, _, filesz, memsz, flags, _ = fields
+        else:
+            p_type, flags, offset, vaddr, _, filesz, memsz, _ = fields
+        if p_type != PT_LOAD or memsz == 0:
+            continue
+        contents = np.asarray(buf[offset:offset + filesz])
+        if memsz > filesz:
+            contents = np.concatenate([contents, np.zeros(memsz - filesz, dtype=np.uint8)])
+        (code if flags & PF_X else data).append((vaddr, contents))
+    return entry, code, data
+
+
+def load(path, base=RESET_VECTOR):
+    """Loads an ELF file, or a flat binary at base"""
+    buf = np.memmap(path, dtype=np.uint8, mode="r")
+
+    key = hashlib.sha256(buf).hexdigest()[:32]
+    cached = os.path.join(CACHE_DIR, f"{key}-{base:x}-v{VERSION}.npz")
+    if os.path.exists(cached):
+        with np.load(cached) as f:
+            return Image(int(f["entry"]), f["iaddr"], f["iword"], f["daddr"], f["dhi"], f["dlo"])
+
+    if bytes(buf[:4]) == b"\x7fELF":
+        entry, code, data = elf_segments(buf)
+    else:
+        entry, code, data = base, [(base, buf)], []
+    image = build(code, data, entry)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # write then rename, so parallel test runs never see half a file
+    tmp = f"{cached}.{os.getpid()}.npz"
+    np.savez(tmp, **image.arrays())
+    os.replace(tmp, cached)
+    return image
@@ -0,0 +1,131 @@
+"""Lockstep comparison against an instruction trace from an emulator.
+
+A trace is a flat file of RECORDs, one per retired instruction: its pc and
+the register it wrote, 0 for none. Register numbers are RegId.index(), so
+0-31 are the integer registers and 32-63 the float registers. The file is
+memory mapped and read a chunk at a time, so it can be as big as it likes.
+
+    lockstep = Lockstep("build/trace/prog.bin")
+    for _ in range(cycles):
+        await c.clock()
+        lockstep.sample(c.o.probe)
+        if lockstep.done():
+            break
+
+On the first mismatch `sample` raises Mismatch with the last few records from
+both sides. Records are little endian:
+
+    u64 pc, u64 value, u8 reg, 7 bytes padding
+"""
+
+import re
+from collections import deque
+
+import numpy as np
+
+RECORD = np.dtype([
+    ("pc", "<u8"),
+    ("value", "<u8"),
+    ("reg", "u1"),
+    ("pad", "u1", 7),
+])
+
+CHUNK = 1 << 16
+
+MASK = (1 << 64) - 1
+
+
+def regid_index(regid):
+    """"Integer(5)" -> 5, "Float(5)" -> 37"""
+    match = re.match(r"\s*(Integer|Float)\((\d+)\)", regid)
+    if match is None:
+        raise ValueError(f"can't parse register {regid!r}")
+    return int(match.group(2)) + (32 if match.group(1) == "Float" else 0)
+
+
+def parse_regfile_write(write):
+    """"(Integer(5), 1234)" -> (5, 1234)"""
+    match = re.match(r"\s*\((\w+\(\d+\)),\s*(\d+)\)", write)
+    if match is None:
+        raise ValueError(f"can't parse register write {write!r}")
+    return regid_index(match.group(1)), int(match.group(2))
+
+
+def write_trace(path, records):
+    """Writes [(pc, reg, value)] as a trace file"""
+    trace = np.zeros(len(records), dtype=RECORD)
+    for i, (pc, reg, value) in enumerate(records):
+        trace[i]["pc"] = pc & MASK
+        trace[i]["reg"] = reg
+        trace[i]["value"] = value & MASK
+    trace.tofile(path)
+
+
+def format_record(record):
+    if record is None:
+        return "-"
+    pc, reg, value = record
+    if reg == 0:
+        return f"{pc:016x}"
+    return f"{pc:016x}  r{reg:<2} = {value:016x}"
+
+
+class Mismatch(AssertionError):
+    pass
+
+
+class Lockstep:
+    def __init__(self, path, context=8, skip=0):
+        """Compares against the trace at path, starting skip records in"""
+        self.trace = np.memmap(path, dtype=RECORD, mode="r")
+        self.index = skip
+        self.chunk = []
+        self.chunk_start = skip
+        # (expected, actual) of the last few retired instructions
+        self.history = deque(maxlen=context)
+
+    def __len__(self):
+        return len(self.trace)
+
+    def done(self):
+        return self.index >= len(self.trace)
+
+    def expected(self):
+        offset = self.index - self.chunk_start
+        if offset >= len(self.chunk):
+            # tolist() once per chunk is a lot cheaper than indexing the memmap per record
+            self.chunk_start = self.index
+            chunk = self.trace[self.index:self.index + CHUNK]
+            self.chunk = list(zip(chunk["pc"].tolist(), chunk["reg"].tolist(), chunk["value"].tolist()))
+            offset = 0
+        return self.chunk[offset]
+
+    def retire(self, pc, reg, value):
+        """Checks one retired instruction against the next record"""
+        actual = (pc & MASK, reg, value & MASK if reg != 0 else 0)
+        if self.done():
+            self.history.append((None, actual))
+            self.fail(f"retired an instruction after the end of the trace ({len(self.trace)} records)")
+
+        expected = self.expected()
+        if expected[1] == 0:
+            expected = (expected[0], 0, 0)
+        self.history.append((expected, actual))
+        if expected != actual:
+            self.fail(f"mismatch at record {self.index}")
+        self.index += 1
+
+    def sample(self, probe):
+        """Checks the instruction retiring this cycle, if any, from the cpu's probe output"""
+        if probe.retire.value() != "true":
+            return
+        pc = int(probe.retire_pc.value())
+        reg, value = parse_regfile_write(probe.regfile_write.value())
+        self.retire(pc, reg, value)
+
+    def fail(self, message):
+        lines = [message, f"{'':>4}{'trace':<44}cpu"]
+        for expected, actual in self.history:
+            marker = "  " if expected == actual else "!!"
+            lines.append(f"{marker}  {format_record(expected):<44}{format_record(actual)}")
+        raise Mismatch("\n".join(lines))
@@ -0,0 +1,94 @@
+"""NumPy reference model of MemMask (src/dcache.spade).
+
+MemMasks holds a whole batch of (size, align) pairs, and every method works
+on uint64 arrays of the same length, mirroring the methods of the same name
+on the spade side. As there, size is 0 indexed and align is the byte offset
+from the most significant end of the octbyte.
+"""
+
+import numpy as np
+
+
+def _table(f):
+    table = np.zeros((8, 8), dtype=np.uint64)
+    for size in range(8):
+        for align in range(8 - size):
+            table[size, align] = f(size, align)
+    return table
+
+
+BIT_MASK = _table(lambda size, align: ((1 << (size + 1) * 8) - 1) << ((7 - size - align) * 8))
+BYTE_MASK = _table(lambda size, align: ((1 << (size + 1)) - 1) << align)
+BYTE_ENABLES = _table(lambda size, align: ((1 << (size + 1)) - 1) << (7 - size - align))
+SHIFT = _table(lambda size, align: (7 - size - align) * 8)
+
+LOW_MASK = np.array([(1 << (size + 1) * 8) - 1 for size in range(8)], dtype=np.uint64)
+SIGN_BIT = np.array([1 << ((size + 1) * 8 - 1) for size in range(8)], dtype=np.uint64)
+
+# All 36 legal (size, align) pairs
+LEGAL = np.array([(size, align) for size in range(8) for align in range(8 - size)], dtype=np.uint8)
+
+
+class MemMasks:
+    def __init__(self, size, align):
+        self.size = np.asarray(size, dtype=np.uint8)
+        self.align = np.asarray(align, dtype=np.uint8)
+        assert np.all(self.size.astype(int) + self.align <= 7), "illegal MemMask"
+
+    @staticmethod
+    def random(rng, n):
+        pairs = LEGAL[rng.integers(0, len(LEGAL), n)]
+        return MemMasks(pairs[:, 0], pairs[:, 1])
+
+    @staticmethod
+    def legal():
+        return MemMasks(LEGAL[:, 0], LEGAL[:, 1])
+
+    def __len__(self):
+        return len(self.size)
+
+    def mask(self):
+        return BYTE_MASK[self.size, self.align]
+
+    def byte_enables(self):
+        return BYTE_ENABLES[self.size, self.align]
+
+    def bit_mask(self):
+        return BIT_MASK[self.size, self.align]
+
+    def size_bytes(self):
+        return self.size.astype(np.uint64) + np.uint64(1)
+
+    def clear(self, dest):
+        return dest & ~self.bit_mask()
+
+    def align_data(self, data):
+        return data << SHIFT[self.size, self.align]
+
+    def insert(self, dest, data):
+        mask = self.bit_mask()
+        return (dest & ~mask) | (self.align_data(data) & mask)
+
+    def insert_aligned(self, dest, data):
+        mask = self.bit_mask()
+        return (dest & ~mask) | (data & mask)
+
+    def extract(self, data, signed):
+        value = (data >> SHIFT[self.size, self.align]) & LOW_MASK[self.size]
+        if not signed:
+            return value
+        sign = SIGN_BIT[self.size]
+        # two's complement wrap around does the sign extension
+        return (value ^ sign) - sign
+
+    def byte_mux(self, a, b):
+        # takes bytes from a where the mask is set, like MemMask::byte_mux
+        mask = self.bit_mask()
+        return (b & ~mask) | (a & mask)
+
+    def __getitem__(self, i):
+        return int(self.size[i]), int(self.align[i])
+
+
+def random_u64(rng, n):
+    return rng.integers(0, np.iinfo(np.uint64).max, n, dtype=np.uint64, endpoint=True)
@@ -0,0 +1,83 @@
+"""Host side of the mmio devices (src/mmio.spade).
+
+Programs store to 0xafff0000 to exit, to 0xafff0008 to print a character
+and to 0xafff0010 to report a value. The cpu decodes those stores into its
+`mmio` output, and Host watches it every cycle:
+
+    host = Host(c.o)
+    code = await host.run(c.clock, cycles=10_000)
+    assert code == 0, host.console
+
+Instead of running for a fixed number of cycles, run() returns as soon as
+the program writes the exit register, so the program decides how long the
+test takes and `cycles` is only a timeout.
+"""
+
+BASE = 0xafff0000
+EXIT = BASE
+CONSOLE = BASE + 0x08
+REPORT = BASE + 0x10
+
+# Address of the device register page, for `lui` in programs
+BASE_HI = BASE >> 16
+
+
+class Timeout(Exception):
+    pass
+
+
+def external_data(addr, size, data):
+    """The stored bytes of an external write. Stores are aligned within the
+    octbyte like they are for the dcache, same as MemMask.extract. size is
+    in bytes."""
+    shift = (8 - size - (addr & 7)) * 8
+    return (data >> shift) & ((1 << size * 8) - 1)
+
+
+def parse(value):
+    """"Console(104)" -> ("Console", 104), "None()" -> (None, None)"""
+    name, _, arg = value.partition("(")
+    name = name.split("::")[-1]
+    arg = arg.rstrip(")")
+    if name == "None" or not arg:
+        return None, None
+    return name, int(arg)
+
+
+class Host:
+    def __init__(self, o):
+        """o is an output holding a cpu Result, like Core.o or a batch lane"""
+        self.o = o
+        self.chars = []
+        self.reports = []
+        self.exit_code = None
+        self.cycles = 0
+
+    @property
+    def console(self):
+        return "".join(self.chars)
+
+    @property
+    def exited(self):
+        return self.exit_code is not None
+
+    def sample(self):
+        """Call once per cycle, returns True once the program has exited"""
+        self.cycles += 1
+        device, value = parse(self.o.mmio.value())
+        if device == "Exit":
+            self.exit_code = value
+        elif device == "Console":
+            self.chars.append(chr(value))
+        elif device == "Report":
+            self.reports.append(value)
+        return self.exit_code is not None
+
+    async def run(self, clock, cycles=100_000):
+        """Runs until the program exits, returning its exit code. Raises
+        Timeout if it hasn't after `cycles` cycles."""
+        for _ in range(cycles):
+            await clock()
+            if self.sample():
+                return self.exit_code
+        raise Timeout(f"no exit after {cycles} cycles, console: {self.console!r}")
@@ -0,0 +1,232 @@
+"""Testbench overhead profiling.
+
+A lot of the time of a test goes to Python rather than the simulator:
+every awaited edge or timer is a callback from the simulator, and every
+SpadeExt access comes down to reading or writing a signal. With
+R4300_OVERHEAD=1, every test of a file importing tb records
+
+  wall_s        wall time of the test
+  sim_ns        simulated time
+  callbacks     simulator callbacks into python, one per trigger firing
+  reads         signal reads
+  writes        signal writes, not counting the clocks
+  clock_writes  writes to the clocks, by tb.clock
+  python_s      time spent in those callbacks, running the testbench
+  sim_s         the rest of wall_s, in the simulator
+
+and appends it to build/overhead/history.jsonl:
+
+    R4300_OVERHEAD=1 swim test
+    python test/tb/overhead.py [build/overhead]
+
+Each record is compared with the previous passing one of the same test.
+Taking SLOWER longer, or doing more callbacks or signal accesses than
+before, is logged as a warning and kept in the record's `regressions`.
+Running this file prints the latest record of every test along with the
+change from the one before. Set R4300_OVERHEAD_DIR to put the history
+somewhere else.
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+
+ENABLED = os.environ.get("R4300_OVERHEAD", "") not in ("", "0")
+DIR = os.environ.get(
+    "R4300_OVERHEAD_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "build", "overhead"),
+)
+
+# Wall time changes from run to run, so only report it past both of these
+SLOWER = 0.2
+MIN_SECONDS = 0.5
+# The counts don't, unless the test itself changed
+MORE = 0.01
+COUNTS = ["callbacks", "reads", "writes", "clock_writes"]
+
+_log = logging.getLogger("cocotb.overhead")
+
+
+class Counters:
+    def __init__(self):
+        self.callbacks = 0
+        self.reads = 0
+        self.writes = 0
+        self.clock_writes = 0
+        self.python_s = 0.0
+
+    def snapshot(self):
+        return dict(vars(self))
+
+
+counters = Counters()
+_installed = False
+
+
+def history_path(directory):
+    return os.path.join(directory, "history.jsonl")
+
+
+def load(path):
+    """Every record in the history, oldest first"""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def regressions(record, previous):
+    """What got worse since the previous record of the same test"""
+    if previous is None:
+        return []
+    found = []
+    slower = record["wall_s"] - previous["wall_s"]
+    if slower > MIN_SECONDS and record["wall_s"] > previous["wall_s"] * (1 + SLOWER):
+        found.append(f"wall_s {previous['wall_s']:.2f} -> {record['wall_s']:.2f}")
+    for name in COUNTS:
+        if record[name] > previous[name] * (1 + MORE):
+            found.append(f"{name} {previous[name]} -> {record[name]}")
+    return found
+
+
+def previous_of(history, key):
+    for record in reversed(history):
+        if (record["module"], record["test"]) == key and record["passed"]:
+            return record
+    return None
+
+
+def record(module, test, passed, wall_s, sim_ns, counts):
+    """Append one test to the history, returns the record"""
+    python_s = min(counts["python_s"], wall_s)
+    entry = {
+        "module": module,
+        "test": test,
+        "time": time.time(),
+        "passed": passed,
+        "wall_s": wall_s,
+        "sim_ns": sim_ns,
+        "python_s": python_s,
+        "sim_s": wall_s - python_s,
+        **{name: counts[name] for name in COUNTS},
+    }
+
+    path = history_path(DIR)
+    previous = previous_of(load(path), (module, test))
+    # A failing test stops early, it's no baseline and nothing to compare
+    entry["regressions"] = regressions(entry, previous) if passed else []
+    for regression in entry["regressions"]:
+        _log.warning(f"{module}.{test} overhead regressed: {regression}")
+
+    os.makedirs(DIR, exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+    return entry
+
+
+def install():
+    """Starts counting. The counts go to the history as every test ends"""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    # Only importable inside the simulator
+    from cocotb._gpi_triggers import GPITrigger
+    from cocotb.handle import ValueObjectBase
+    from cocotb.regression import RegressionManager
+
+    from tb.clock import CLOCKS
+
+    # Every callback from the simulator comes in through a trigger firing,
+    # which then runs the event loop until the testbench waits again
+    react = GPITrigger._react
+    def counting_react(self):
+        counters.callbacks += 1
+        start = time.perf_counter()
+        try:
+            return react(self)
+        finally:
+            counters.python_s += time.perf_counter() - start
+    GPITrigger._react = counting_react
+
+    value = ValueObjectBase.value
+    def read(self):
+        counters.reads += 1
+        return value.fget(self)
+    def write(self, new):
+        if self._name in CLOCKS:
+            counters.clock_writes += 1
+        else:
+            counters.writes += 1
+        value.fset(self, new)
+    ValueObjectBase.value = property(read, write, doc=value.__doc__)
+
+    score_test = RegressionManager._score_test
+    start = counters.snapshot()
+    def recording_score(self, exc, wall_time_s, sim_time_start, sim_time_stop):
+        nonlocal start
+        now = counters.snapshot()
+        counts = {name: now[name] - start[name] for name in now}
+        start = now
+        results = len(self._test_results)
+        score_test(self, exc, wall_time_s, sim_time_start, sim_time_stop)
+        if len(self._test_results) == results:
+            return
+        outcome = self._test_results[-1].outcome.name
+        if outcome == "SKIP":
+            return
+        try:
+            record(self._test.module, self._test.name, outcome in ("PASS", "XFAIL"),
+                   wall_time_s, sim_time_stop - sim_time_start, counts)
+        except OSError as e:
+            _log.warning(f"can't write overhead history: {e}")
+    RegressionManager._score_test = recording_score
+
+
+def report(history):
+    """The latest record of every test, with the change since the one before"""
+    latest = {}
+    before = {}
+    for entry in history:
+        key = (entry["module"], entry["test"])
+        if key in latest and latest[key]["passed"]:
+            before[key] = latest[key]
+        latest[key] = entry
+
+    lines = [f"{'test':<40} {'wall s':>8} {'change':>7} {'python':>7} {'sim ns':>12} {'callbacks':>10} {'reads':>10} {'writes':>9}"]
+    total_wall = total_python = 0.0
+    for key in sorted(latest):
+        entry = latest[key]
+        total_wall += entry["wall_s"]
+        total_python += entry["python_s"]
+        previous = before.get(key)
+        change = f"{100.0 * (entry['wall_s'] / previous['wall_s'] - 1):+6.1f}%" if previous and previous["wall_s"] else ""
+        python = f"{100.0 * entry['python_s'] / entry['wall_s']:6.1f}%" if entry["wall_s"] else ""
+        name = ".".join(key) + ("" if entry["passed"] else " (failed)")
+        lines.append(
+            f"{name:<40} {entry['wall_s']:8.2f} {change:>7} {python:>7} {entry['sim_ns']:12.0f}"
+            f" {entry['callbacks']:10} {entry['reads']:10} {entry['writes'] + entry['clock_writes']:9}"
+        )
+        for regression in entry["regressions"]:
+            lines.append(f"    regressed: {regression}")
+    if total_wall:
+        lines.append("")
+        lines.append(f"{total_wall:.2f} s in total, {100.0 * total_python / total_wall:.1f}% of it in python")
+    return "\n".join(lines)
+
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else DIR
+    history = load(history_path(directory))
+    if not history:
+        print(f"no overhead history in {directory}, run the tests with R4300_OVERHEAD=1")
+        return 1
+    print(report(history))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""Guest profiler, attributing every cycle to the instruction responsible for it.
+
+Call `sample(pc, status)` once per cycle with the cpu's pc output and status
+string. That's only two appends to flat arrays, everything else is done
+with numpy at the end, so it's cheap enough for million cycle runs.
+
+Which pc occupies which stage is rebuilt from the samples: the pc output
+is the instruction in IC, and every cycle that isn't a stall moves all
+instructions one stage down. A cycle is then charged to:
+
+  * the instruction in WB, when the pipeline advances normally
+  * the instruction in the stage that raised the interlock, when stalled
+    (RF for icache misses, EX for load interlocks, DC for dcache misses, ...)
+
+Cycles in reset aren't charged to anything.
+
+    profile = Profiler(symbols="prog.sym")
+    for _ in range(cycles):
+        await c.clock()
+        profile.sample(c.next_pc(), c.status())
+    print(profile.report())
+    profile.write("build/profile/prog")
+
+Symbol maps are `nm` style lines, "<hex address> [type] <name>".
+"""
+
+import os
+from array import array
+
+import numpy as np
+
+STAGES = ["IC", "RF", "EX", "DC", "WB"]
+IC, RF, EX, DC, WB = range(5)
+
+# Stall reason -> the stage which raised it
+INTERLOCK_STAGE = {
+    "InstructionTlbMiss": RF,
+    "InstructionCacheBusy": RF,
+    "LoadInterlock": EX,
+    "MultiCycleInterlock": EX,
+    "Coprocessor2Interlock": EX,
+    "DataCacheMiss": DC,
+    "DataCacheBusy": DC,
+    "CacheOp": DC,
+    "Coprocessor0Bypass": WB,
+}
+
+NOT_CHARGED = -1
+
+
+def parse_status(status):
+    """"Stall(LoadInterlock())" -> (reason, stage charged, advances)"""
+    if status == "Ok()":
+        return "run", WB, True
+    if status.startswith("Stall("):
+        reason = status[len("Stall("):].split("(")[0]
+        return reason, INTERLOCK_STAGE.get(reason, WB), False
+    if status == "ExceptionWB(Reset())" or status == "Reset()":
+        return "reset", NOT_CHARGED, True
+    if status.startswith("ExceptionWB("):
+        reason = status[len("ExceptionWB("):].split("(")[0]
+        return reason, WB, True
+    # x's and such, usually straight out of reset
+    return "unknown", NOT_CHARGED, True
+
+
+def load_symbols(path):
+    symbols = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            try:
+                addr = int(fields[0], 16)
+            except ValueError:
+                continue
+            symbols[addr] = fields[-1]
+    return symbols
+
+
+class Profiler:
+    def __init__(self, symbols=None):
+        """symbols is either a {addr: name} dict or the path of a symbol map"""
+        self.pcs = array("Q")
+        self.codes = array("B")
+
+        # status string -> code, and the parsed status for each code
+        self.code_of = {}
+        self.statuses = []
+
+        if isinstance(symbols, str):
+            symbols = load_symbols(symbols)
+        symbols = symbols or {}
+        self.symbol_addrs = np.array(sorted(symbols), dtype=np.uint64)
+        self.symbol_names = [symbols[a] for a in sorted(symbols)]
+
+    def sample(self, pc, status):
+        code = self.code_of.get(status)
+        if code is None:
+            code = len(self.statuses)
+            self.code_of[status] = code
+            self.statuses.append(parse_status(status))
+        self.pcs.append(pc & 0xffffffff_ffffffff)
+        self.codes.append(code)
+
+    def __len__(self):
+        return len(self.pcs)
+
+    def attribute(self):
+        """Returns (pc, reason code) of every charged cycle"""
+        pcs = np.frombuffer(self.pcs, dtype=np.uint64)
+        codes = np.frombuffer(self.codes, dtype=np.uint8)
+        if len(pcs) == 0:
+            return pcs, codes
+
+        stage_of = np.array([stage for _, stage, _ in self.statuses], dtype=np.int8)
+        advances = np.array([adv for _, _, adv in self.statuses], dtype=bool)
+
+        stage = stage_of[codes]
+        advance = advances[codes]
+
+        # Nothing fetched during reset is a real instruction
+        invalid = np.iinfo(np.uint64).max
+        pcs = np.where(stage == NOT_CHARGED, np.uint64(invalid), pcs)
+
+        # The instruction in stage s (> IC) was in IC during the s-th most
+        # recent advancing cycle before this one
+        advanced_pcs = pcs[advance]
+        before = np.cumsum(advance) - advance
+
+        charged = np.full(len(pcs), invalid, dtype=np.uint64)
+        charged[stage == IC] = pcs[stage == IC]
+        for s in range(RF, WB + 1):
+            j = before - s
+            hit = (stage == s) & (j >= 0)
+            charged[hit] = advanced_pcs[j[hit]]
+
+        keep = (stage != NOT_CHARGED) & (charged != invalid)
+        return charged[keep], codes[keep]
+
+    def histogram(self):
+        """[(pc, cycles, {reason: cycles})] sorted by cycles, most first"""
+        pcs, codes = self.attribute()
+        if len(pcs) == 0:
+            return []
+
+        # one count per (pc, code) pair
+        pairs = np.stack([pcs, codes.astype(np.uint64)], axis=1)
+        unique, counts = np.unique(pairs, axis=0, return_counts=True)
+
+        by_pc = {}
+        for (pc, code), count in zip(unique.tolist(), counts.tolist()):
+            reasons = by_pc.setdefault(pc, {})
+            reason = self.statuses[code][0]
+            reasons[reason] = reasons.get(reason, 0) + count
+
+        rows = [(pc, sum(reasons.values()), reasons) for pc, reasons in by_pc.items()]
+        rows.sort(key=lambda row: (-row[1], row[0]))
+        return rows
+
+    def symbol(self, pc):
+        if len(self.symbol_addrs) == 0:
+            return None
+        i = np.searchsorted(self.symbol_addrs, np.uint64(pc), side="right") - 1
+        if i < 0:
+            return None
+        offset = pc - int(self.symbol_addrs[i])
+        name = self.symbol_names[i]
+        return f"{name}+0x{offset:x}" if offset else name
+
+    def report(self, top=40):
+        rows = self.histogram()
+        total = sum(cycles for _, cycles, _ in rows)
+        lines = [f"{total} cycles over {len(rows)} pcs ({len(self)} sampled)", ""]
+        lines.append(f"{'pc':>18} {'cycles':>10} {'%':>6}  stalls")
+        for pc, cycles, reasons in rows[:top]:
+            stalls = ", ".join(f"{r}: {n}" for r, n in sorted(reasons.items(), key=lambda x: -x[1]) if r != "run")
+            symbol = self.symbol(pc)
+            name = f" {symbol}" if symbol else ""
+            lines.append(f"{pc:>18x} {cycles:>10} {100.0 * cycles / total:6.2f}{name}  {stalls}")
+        if len(rows) > top:
+            lines.append(f"... {len(rows) - top} more")
+        return "\n".join(lines)
+
+    def collapsed(self):
+        """Collapsed stacks, as taken by flamegraph.pl and speedscope"""
+        lines = []
+        for pc, _, reasons in self.histogram():
+            frame = self.symbol(pc) or "?"
+            for reason, count in sorted(reasons.items()):
+                lines.append(f"{frame.split('+')[0]};{pc:x};{reason} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, prefix):
+        """Writes <prefix>.txt and <prefix>.folded"""
+        os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+        with open(f"{prefix}.txt", "w") as f:
+            f.write(self.report(top=len(self.histogram())) + "\n")
+        with open(f"{prefix}.folded", "w") as f:
+            f.write(self.collapsed())
@@ -0,0 +1,74 @@
+"""Ring buffer logging for testbench loops.
+
+Logging every cycle with dut._log.info(f"...") formats strings that nobody
+reads when the test passes. Instead, `log` keeps the format string and the
+raw values of the last few hundred calls, and they're only turned into
+text when the test fails:
+
+    @cocotb.test()
+    @logged
+    async def loop(dut):
+        for cycle in range(25):
+            ...
+            log("pc: {:x} index: {:04x}, inst: {:08x}", p.next_pc(), p.index(), inst)
+
+With R4300_VERBOSE=1 every call is formatted and logged straight away, the
+way it used to be. R4300_RINGLOG sets how many entries are kept (512).
+"""
+
+import functools
+import logging
+import os
+from collections import deque
+
+VERBOSE = os.environ.get("R4300_VERBOSE", "") not in ("", "0")
+SIZE = int(os.environ.get("R4300_RINGLOG", "512"))
+
+_log = logging.getLogger("cocotb.ringlog")
+
+
+class RingLog:
+    def __init__(self, size=SIZE):
+        self.entries = deque(maxlen=size)
+        # calls in total, including the ones that fell out of the buffer
+        self.count = 0
+
+    def __call__(self, fmt, *args):
+        self.count += 1
+        if VERBOSE:
+            _log.info(fmt.format(*args))
+        else:
+            self.entries.append((fmt, args))
+
+    def render(self):
+        dropped = self.count - len(self.entries)
+        lines = [f"... {dropped} earlier entries dropped"] if dropped else []
+        for fmt, args in self.entries:
+            try:
+                lines.append(fmt.format(*args))
+            except Exception as e:
+                lines.append(f"{fmt!r} {args!r} (can't format: {e})")
+        return "\n".join(lines)
+
+
+# The buffer of the test that is running. cocotb runs one test at a time
+current = RingLog()
+
+
+def log(fmt, *args):
+    current(fmt, *args)
+
+
+def logged(test):
+    """Gives the test its own buffer, and logs the buffer if the test fails"""
+    @functools.wraps(test)
+    async def wrapper(dut, *args, **kwargs):
+        global current
+        current = RingLog()
+        try:
+            return await test(dut, *args, **kwargs)
+        except Exception:
+            if current.entries:
+                dut._log.error(f"last {len(current.entries)} log entries:\n{current.render()}")
+            raise
+    return wrapper
@@ -0,0 +1,20 @@
+"""Reference model of the selfcheck signature register (src/selfcheck.spade)"""
+
+POLY = 0x42f0e1eba9ea3693
+MASK = (1 << 64) - 1
+
+
+def misr(sig, data):
+    feedback = POLY if sig >> 63 else 0
+    return ((sig << 1) & MASK) ^ feedback ^ data
+
+
+def signature(writes):
+    """The signature after the (register index, value) writes. Writes to
+    $zero are never part of it"""
+    sig = 0
+    for reg, value in writes:
+        if reg == 0:
+            continue
+        sig = misr(misr(sig, value & MASK), reg)
+    return sig
@@ -0,0 +1,167 @@
+"""Pipeline occupancy timeline.
+
+Records the pc, status and probe output of every cycle, and afterwards works
+out which instruction sat in each of IC, RF, EX, DC and WB, whether it was
+stalled or flushed and where EX got its operands from. Sampling only stores
+the raw values, all the parsing happens when writing the log.
+
+    timeline = Timeline()
+    for _ in range(cycles):
+        await p.clock()
+        timeline.sample(p.next_pc(), p.status(), p.o.probe.value())
+    timeline.write_text("build/timeline/test.txt")
+    timeline.write_kanata("build/timeline/test.kanata")
+
+The kanata files open in Konata (https://github.com/shioyadan/Konata).
+"""
+
+import os
+import re
+
+from tb.profiler import STAGES, WB, parse_status
+
+
+def probe_field(probe, name):
+    match = re.search(rf"\b{name}: (\w+)", probe)
+    return match.group(1) if match else None
+
+
+class Instruction:
+    def __init__(self, seq, pc, cycle):
+        self.seq = seq
+        self.pc = pc
+        self.fetched = cycle
+        self.rs_bypass = None
+        self.rt_bypass = None
+        self.flushed = False
+        # (cycle, reason) of every stalled cycle
+        self.stalls = []
+
+    def label(self):
+        return f"#{self.seq} {self.pc:x}"
+
+
+class Timeline:
+    def __init__(self):
+        self.samples = []
+
+    def sample(self, pc, status, probe):
+        self.samples.append((pc, status, probe))
+
+    def __len__(self):
+        return len(self.samples)
+
+    def replay(self):
+        """Yields (cycle, [instruction or None for each stage], advance, reason)
+        for every cycle, updating the instructions as it goes"""
+        seq = 0
+        stages = [None] * len(STAGES)
+        advanced = True
+
+        for cycle, (pc, status, probe) in enumerate(self.samples):
+            reason, _, _ = parse_status(status)
+            if reason == "reset":
+                stages = [None] * len(STAGES)
+                advanced = True
+                continue
+
+            # a new instruction enters IC after every cycle the pipeline moved
+            if advanced:
+                stages[0] = Instruction(seq, pc, cycle)
+                seq += 1
+
+            advance = probe_field(probe, "advance") != "false"
+
+            ex = stages[2]
+            if ex is not None:
+                ex.rs_bypass = probe_field(probe, "rs_bypass")
+                ex.rt_bypass = probe_field(probe, "rt_bypass")
+
+            wb = stages[WB]
+            if wb is not None and probe_field(probe, "flush") == "true":
+                wb.flushed = True
+
+            if not advance:
+                for ins in stages:
+                    if ins is not None:
+                        ins.stalls.append((cycle, reason))
+
+            yield cycle, list(stages), advance, reason
+
+            if advance:
+                stages = [None] + stages[:-1]
+            advanced = advance
+
+    def occupancy(self):
+        """One line per cycle: the instruction in each stage, * when stalled, ~ when flushed"""
+        lines = [f"{'cycle':>8}  " + "".join(f"{s:<22}" for s in STAGES) + "status"]
+        for cycle, stages, advance, reason in self.replay():
+            cells = []
+            for stage, ins in zip(STAGES, stages):
+                if ins is None:
+                    cells.append("-")
+                    continue
+                cell = ins.label()
+                if stage == "EX" and ins.rs_bypass is not None:
+                    cell += f" {ins.rs_bypass[:2]}/{ins.rt_bypass[:2]}"
+                if ins.flushed:
+                    cell += "~"
+                if not advance:
+                    cell += "*"
+                cells.append(cell)
+            lines.append(f"{cycle:>8}  " + "".join(f"{c:<22}" for c in cells) + reason)
+        return "\n".join(lines) + "\n"
+
+    def kanata(self):
+        lines = ["Kanata\t0004"]
+        started = False
+        last_cycle = 0
+        seen = set()
+        # the stage each instruction was last reported in
+        current = {}
+
+        for cycle, stages, advance, reason in self.replay():
+            if not started:
+                lines.append(f"C=\t{cycle}")
+                started = True
+            elif cycle != last_cycle:
+                lines.append(f"C\t{cycle - last_cycle}")
+            last_cycle = cycle
+
+            for stage, ins in zip(STAGES, stages):
+                if ins is None:
+                    continue
+                if ins.seq not in seen:
+                    seen.add(ins.seq)
+                    lines.append(f"I\t{ins.seq}\t{ins.seq}\t0")
+                    lines.append(f"L\t{ins.seq}\t0\t{ins.pc:x}")
+                if current.get(ins.seq) != stage:
+                    if ins.seq in current:
+                        lines.append(f"E\t{ins.seq}\t0\t{current[ins.seq]}")
+                    lines.append(f"S\t{ins.seq}\t0\t{stage}")
+                    current[ins.seq] = stage
+
+            if advance and stages[WB] is not None:
+                ins = stages[WB]
+                details = []
+                if ins.rs_bypass is not None:
+                    details.append(f"rs: {ins.rs_bypass}, rt: {ins.rt_bypass}")
+                if ins.stalls:
+                    details.append("stalls: " + ", ".join(f"{c} {r}" for c, r in ins.stalls))
+                if details:
+                    lines.append(f"L\t{ins.seq}\t1\t{'; '.join(details)}")
+                lines.append(f"E\t{ins.seq}\t0\tWB")
+                lines.append(f"R\t{ins.seq}\t{ins.seq}\t{1 if ins.flushed else 0}")
+                del current[ins.seq]
+
+        return "\n".join(lines) + "\n"
+
+    def write_text(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.occupancy())
+
+    def write_kanata(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.kanata())
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""Trace driven model of the icache and dcache, for trying other geometries
+without touching the RTL.
+
+The defaults mirror the design:
+
+  icache  16KB direct mapped, 32 byte lines, tag is addr >> 12, and a 64-bit
+          fetch buffer in front, so the second instruction of a doubleword
+          never reads the array
+  dcache  8KB direct mapped, 16 byte (128-bit) lines, tag is addr >> 12,
+          writes mark the line dirty, and evicting a dirty line writes it back
+
+Traces are .npy files of TRACE records, one per access. They are read with
+mmap and simulated a batch at a time with numpy: in a direct mapped cache an
+access hits exactly when the previous access to the same set had the same
+tag, so sorting a batch by set turns the whole thing into array compares.
+
+  tools/cachesim.py trace.npy
+  tools/cachesim.py trace.npy --dcache-size 16K --dcache-line 32
+  tools/cachesim.py trace.npy --sweep            # every size/line, for each cache
+  tools/cachesim.py --synthetic 10000000 --sweep # no trace, just the speed
+
+Stall cycles are an estimate from fixed miss and writeback penalties, as the
+design doesn't refill from memory yet.
+"""
+
+import argparse
+import itertools
+import sys
+import time
+
+import numpy as np
+
+FETCH, LOAD, STORE = 0, 1, 2
+
+TRACE = np.dtype([
+    ("addr", np.uint64),
+    ("kind", np.uint8),
+])
+
+BATCH = 1 << 20
+
+NO_TAG = np.iinfo(np.int64).max
+
+
+def parse_size(text):
+    text = text.upper()
+    for suffix, scale in (("K", 1 << 10), ("M", 1 << 20)):
+        if text.endswith(suffix):
+            return int(text[:-1]) * scale
+    return int(text)
+
+
+class Cache:
+    """A direct mapped cache, simulated one batch of addresses at a time"""
+
+    def __init__(self, name, size, line, tag_shift=12, fetch_buffer=0, miss_penalty=10, writeback_penalty=8):
+        assert size % line == 0 and line & (line - 1) == 0, "line size must be a power of two dividing the size"
+        self.name = name
+        self.size = size
+        self.line = line
+        self.sets = size // line
+        self.line_shift = line.bit_length() - 1
+        # The design keeps a fixed 20 bit tag of addr >> 12, whatever the size.
+        # Anything that would overlap the index just makes tags redundant, but
+        # with a bigger cache the tag has to start above the index
+        self.tag_shift = max(tag_shift, (size - 1).bit_length())
+        self.fetch_buffer = fetch_buffer
+        self.miss_penalty = miss_penalty
+        self.writeback_penalty = writeback_penalty
+
+        self.tags = np.full(self.sets, NO_TAG, dtype=np.int64)
+        self.dirty = np.zeros(self.sets, dtype=bool)
+        self.last_buffer = -1
+
+        self.accesses = 0
+        self.buffer_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.writebacks = 0
+
+    def access(self, addr, write=None):
+        """Simulates a batch of accesses, in order. write is a bool array, or
+        None for a read only cache"""
+        addr = np.asarray(addr, dtype=np.uint64)
+        n = len(addr)
+        if n == 0:
+            return
+        self.accesses += n
+
+        if self.fetch_buffer:
+            # Reads from the same buffer sized block as the last read are
+            # served by the buffer and never get to the cache
+            block = (addr >> np.uint64(self.fetch_buffer.bit_length() - 1)).astype(np.int64)
+            prev = np.empty_like(block)
+            prev[0] = self.last_buffer
+            prev[1:] = block[:-1]
+            self.last_buffer = int(block[-1])
+            new = block != prev
+            self.buffer_hits += int(n - np.count_nonzero(new))
+            addr = addr[new]
+            if write is not None:
+                write = write[new]
+            n = len(addr)
+            if n == 0:
+                return
+
+        sets = ((addr >> np.uint64(self.line_shift)) % np.uint64(self.sets)).astype(np.int64)
+        tags = (addr >> np.uint64(self.tag_shift)).astype(np.int64)
+
+        # Group by set, keeping the program order within each set
+        order = np.argsort(sets, kind="stable")
+        s = sets[order]
+        t = tags[order]
+
+        first = np.empty(n, dtype=bool)
+        first[0] = True
+        first[1:] = s[1:] != s[:-1]
+
+        prev_tag = np.empty(n, dtype=np.int64)
+        prev_tag[1:] = t[:-1]
+        prev_tag[first] = self.tags[s[first]]
+
+        miss = t != prev_tag
+        misses = int(np.count_nonzero(miss))
+        self.misses += misses
+        self.hits += n - misses
+
+        last = np.empty(n, dtype=bool)
+        last[-1] = True
+        last[:-1] = s[1:] != s[:-1]
+
+        # Every miss starts a new residency of a line in its set. The line
+        # that was there before is written back if anything wrote to it.
+        if write is not None:
+            w = write[order]
+            # Residencies are numbered from 1 in sorted order. The first
+            # access to each set starts one too, which is the line carried
+            # in from the last batch when that access hits
+            residency = np.cumsum(miss | first)
+            carried = first & ~miss
+            dirty = np.bincount(residency, weights=w, minlength=residency[-1] + 1) > 0
+            # lines that were dirty coming into the batch stay dirty
+            start_dirty = self.dirty[s[first]]
+            dirty[residency[first]] |= start_dirty & carried[first]
+
+            # a miss evicts the residency before it in the same set
+            evicting = miss & ~first
+            evicted = dirty[residency[evicting] - 1]
+            writebacks = int(np.count_nonzero(evicted))
+            # and the first miss in a set evicts what the set held coming in
+            first_miss = first & miss
+            writebacks += int(np.count_nonzero(
+                self.dirty[s[first_miss]] & (self.tags[s[first_miss]] != NO_TAG)))
+            self.writebacks += writebacks
+
+            self.dirty[s[last]] = dirty[residency[last]]
+
+        self.tags[s[last]] = t[last]
+
+    def stall_cycles(self):
+        return self.misses * self.miss_penalty + self.writebacks * self.writeback_penalty
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "cache": self.name,
+            "size": self.size,
+            "line": self.line,
+            "accesses": self.accesses,
+            "buffer_hits": self.buffer_hits,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 1.0,
+            "writebacks": self.writebacks,
+            "stall_cycles": self.stall_cycles(),
+        }
+
+
+def icache(size=16 << 10, line=32, **kwargs):
+    return Cache("icache", size, line, fetch_buffer=8, **kwargs)
+
+
+def dcache(size=8 << 10, line=16, **kwargs):
+    return Cache("dcache", size, line, **kwargs)
+
+
+def simulate(trace, icaches, dcaches, batch=BATCH):
+    """Runs a TRACE array (or memmap) through every icache and dcache. The
+    two don't affect each other, so they can be swept separately"""
+    for start in range(0, len(trace), batch):
+        chunk = np.asarray(trace[start:start + batch])
+        fetch = chunk["kind"] == FETCH
+        fetches = chunk["addr"][fetch]
+        data = chunk[~fetch]
+        data_addr = data["addr"]
+        data_write = data["kind"] == STORE
+        for ic in icaches:
+            ic.access(fetches)
+        for dc in dcaches:
+            dc.access(data_addr, data_write)
+
+
+def synthetic_trace(n, seed=1):
+    """Loops over a few kB of code, with a mix of strided and random data accesses"""
+    rng = np.random.default_rng(seed)
+    trace = np.zeros(n, dtype=TRACE)
+    pc = 0xffffffffbfc00000 + (np.arange(n, dtype=np.uint64) % np.uint64(1500)) * np.uint64(4)
+    kind = rng.choice([FETCH, LOAD, STORE], size=n, p=[0.7, 0.2, 0.1]).astype(np.uint8)
+    stride = (np.arange(n, dtype=np.uint64) * np.uint64(8)) % np.uint64(32 << 10)
+    scattered = rng.integers(0, 64 << 10, size=n, dtype=np.uint64) & ~np.uint64(7)
+    data = np.where(rng.random(n) < 0.5, stride, scattered) + np.uint64(0x10000)
+    trace["addr"] = np.where(kind == FETCH, pc, data)
+    trace["kind"] = kind
+    return trace
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", nargs="?", help=".npy file of TRACE records")
+    parser.add_argument("--synthetic", type=int, metavar="N", help="use N synthetic accesses instead of a trace")
+    parser.add_argument("--icache-size", default="16K")
+    parser.add_argument("--icache-line", type=int, default=32)
+    parser.add_argument("--dcache-size", default="8K")
+    parser.add_argument("--dcache-line", type=int, default=16)
+    parser.add_argument("--miss-penalty", type=int, default=10)
+    parser.add_argument("--writeback-penalty", type=int, default=8)
+    parser.add_argument("--sweep", action="store_true",
+                        help="sizes from 2K to 64K and lines from 16 to 64 bytes, for each cache on its own")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        trace = synthetic_trace(args.synthetic)
+    elif args.trace:
+        trace = np.load(args.trace, mmap_mode="r")
+        if trace.dtype != TRACE:
+            parser.error(f"{args.trace} has dtype {trace.dtype}, expected {TRACE}")
+    else:
+        parser.error("need a trace or --synthetic")
+
+    penalties = dict(miss_penalty=args.miss_penalty, writeback_penalty=args.writeback_penalty)
+    if args.sweep:
+        geometries = list(itertools.product([2 << 10, 4 << 10, 8 << 10, 16 << 10, 32 << 10, 64 << 10], [16, 32, 64]))
+        icaches = [icache(size, line, **penalties) for size, line in geometries]
+        dcaches = [dcache(size, line, **penalties) for size, line in geometries]
+    else:
+        icaches = [icache(parse_size(args.icache_size), args.icache_line, **penalties)]
+        dcaches = [dcache(parse_size(args.dcache_size), args.dcache_line, **penalties)]
+
+    start = time.time()
+    simulate(trace, icaches, dcaches)
+    seconds = time.time() - start
+
+    print(f"{'cache':<8}{'size':>8}{'line':>6}{'lookups':>12}{'hit rate':>10}{'misses':>10}{'writebacks':>12}{'stalls':>12}")
+    for c in icaches + dcaches:
+        s = c.stats()
+        print(f"{s['cache']:<8}{s['size'] >> 10:>7}K{s['line']:>6}{s['hits'] + s['misses']:>12}"
+              f"{100.0 * s['hit_rate']:>9.2f}%{s['misses']:>10}{s['writebacks']:>12}{s['stall_cycles']:>12}")
+
+    # every access goes to one cache of each configuration
+    configurations = max(len(icaches), len(dcaches))
+    total = len(trace) * configurations
+    print(f"\n{len(trace)} accesses, {configurations} configurations in {seconds:.2f}s "
+          f"({total / seconds / 1e6:.1f}M accesses/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
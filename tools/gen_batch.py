@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Generates src/batch.spade, a top with N independent cpus sharing one clock.
+
+Spade can't instantiate a variable number of units, so the top is generated
+instead. Each cpu gets its own reset and preload ports (rst_<k>,
+icache_write_<k>, dcache_write_<k>) and its own cpu<k> field in the output.
+test/tb/batch.py drives it.
+
+  tools/gen_batch.py          # 4 cpus
+  tools/gen_batch.py -n 16
+"""
+
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT = os.path.join(ROOT, "src", "batch.spade")
+
+
+def generate(n):
+    lines = [
+        f"// Generated by tools/gen_batch.py -n {n}, don't edit by hand.",
+        "",
+        "use lib::cpu;",
+        "use lib::Result;",
+        "",
+        "struct BatchResult {",
+    ]
+    lines += [f"    cpu{k}: Result," for k in range(n)]
+    lines += [
+        "}",
+        "",
+        "entity batch(",
+        "    phase2: clock,",
+        "    phase1: clock,",
+    ]
+    for k in range(n):
+        lines += [
+            f"    rst_{k}: bool,",
+            f"    icache_write_{k}: Option<(uint<11>, uint<20>, uint<64>)>,",
+            f"    dcache_write_{k}: Option<(uint<9>, uint<20>, uint<128>)>,",
+        ]
+    # no trailing comma after the last port
+    lines[-1] = lines[-1].rstrip(",")
+    lines += [
+        ") -> BatchResult",
+        "{",
+    ]
+    lines += [
+        f"    let cpu{k} = inst cpu(phase2, phase1, rst_{k}, icache_write_{k}, dcache_write_{k});"
+        for k in range(n)
+    ]
+    lines += [
+        "",
+        f"    BatchResult$({', '.join(f'cpu{k}' for k in range(n))})",
+        "}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=4, help="number of cpus (default: 4)")
+    parser.add_argument("-o", "--output", default=OUTPUT)
+    args = parser.parse_args()
+
+    if args.n < 1:
+        parser.error("need at least one cpu")
+
+    with open(args.output, "w") as f:
+        f.write(generate(args.n))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
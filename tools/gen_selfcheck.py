@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Generates src/selfcheck_image.spade, the program the selfcheck top boots.
+
+The image is a pair of ROMs holding the icache and dcache preload writes,
+in the same format Core.start in test/core.py takes. The program is a flat
+big endian binary loaded at the reset vector, and data is loaded in 16 byte
+dcache lines.
+
+  tools/gen_selfcheck.py                                   # the built-in test program
+  tools/gen_selfcheck.py --bin prog.bin --data 0x10000 data.bin
+
+The program ends by storing its exit code to 0xafff0000, 0 meaning pass.
+"""
+
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT = os.path.join(ROOT, "src", "selfcheck_image.spade")
+
+RESET_VECTOR = 0xbfc00000
+
+# The built-in program. test/selfcheck.py knows which register writes it does
+DEFAULT_PROGRAM = [
+    0x3c011234, # lui $1, 0x1234
+    0x34215678, # ori $1, $1, 0x5678
+    0x24220001, # addiu $2, $1, 1
+    0x3c050001, # lui $5, 0x0001
+    0x8ca40010, # lw $4, 0x10($5)
+    0x3c03afff, # lui $3, 0xafff
+    0xac600000, # sw $zero, 0($3)
+    0x24000000, # nop
+    0x1000ffff, # b .
+    0x24000000, # nop
+]
+DEFAULT_DATA = [
+    (0x00010000, bytes(16)),
+    (0x00010010, bytes([0xa5]) * 16),
+]
+
+
+def icache_writes(words, base=RESET_VECTOR):
+    # The icache only writes the tag with the last word of a 32 byte line, so
+    # pad to whole lines. 0 is sll $zero, $zero, 0, a nop
+    words = words + [0] * (-len(words) % 8)
+    writes = []
+    for i in range(0, len(words), 2):
+        addr = base + i * 4
+        index = (addr >> 3) & 0x7ff
+        tag = (addr >> 12) & 0xfffff
+        writes.append((index, tag, words[i] << 32 | words[i + 1]))
+    return writes
+
+
+def dcache_writes(data):
+    writes = []
+    for base, contents in data:
+        contents = contents + bytes(-len(contents) % 16)
+        for i in range(0, len(contents), 16):
+            addr = base + i
+            index = (addr >> 4) & 0xff
+            tag = (addr >> 12) & 0xfffff
+            writes.append((index, tag, int.from_bytes(contents[i:i + 16], "big")))
+    return writes
+
+
+def rom(name, index_bits, types, writes):
+    lines = [
+        f"fn {name}_last() -> uint<{index_bits}> {{",
+        f"    {len(writes) - 1}",
+        "}",
+        "",
+        f"fn {name}(i: uint<{index_bits}>) -> ({types}) {{",
+        "    match i {",
+    ]
+    lines += [
+        f"        {i} => ({index}, 0x{tag:x}, 0x{data:x}),"
+        for i, (index, tag, data) in enumerate(writes)
+    ]
+    lines += [
+        "        _ => (0, 0, 0),",
+        "    }",
+        "}",
+    ]
+    return lines
+
+
+def generate(icache, dcache, source):
+    lines = [f"// Generated by tools/gen_selfcheck.py from {source}, don't edit by hand.", ""]
+    lines += rom("icache_image", 11, "uint<11>, uint<20>, uint<64>", icache)
+    lines += [""]
+    lines += rom("dcache_image", 9, "uint<9>, uint<20>, uint<128>", dcache)
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bin", help="flat big endian program, loaded at the reset vector")
+    parser.add_argument("--data", nargs=2, action="append", metavar=("ADDR", "FILE"), default=[],
+                        help="load FILE into the dcache at ADDR")
+    parser.add_argument("-o", "--output", default=OUTPUT)
+    args = parser.parse_args()
+
+    if args.bin:
+        with open(args.bin, "rb") as f:
+            program = f.read()
+        program += bytes(-len(program) % 4)
+        words = [int.from_bytes(program[i:i + 4], "big") for i in range(0, len(program), 4)]
+        data = []
+        for addr, path in args.data:
+            with open(path, "rb") as f:
+                data.append((int(addr, 0), f.read()))
+        source = os.path.basename(args.bin)
+    else:
+        words = DEFAULT_PROGRAM
+        data = DEFAULT_DATA
+        source = "the built-in test program"
+
+    icache = icache_writes(words)
+    # The boot loader always writes at least one dcache line
+    dcache = dcache_writes(data) or [(0, 0, 0)]
+
+    if len(icache) > 2048:
+        parser.error("program doesn't fit in the icache")
+    if len(dcache) > 256:
+        parser.error("data doesn't fit in the dcache")
+
+    with open(args.output, "w") as f:
+        f.write(generate(icache, dcache, source))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""Reduces a failing program to a small one that fails the same way.
+
+Takes a program for the testbench assembler (test/tb/asm.py) that makes the
+cpu fail, and keeps making it smaller for as long as it fails with the same
+signature: the same non-zero exit code, the same exception, or a hang with
+the cpu stuck at the same pc. A program that runs on without exiting isn't
+reduced, as every candidate that loses the exit would look the same; make it
+exit with a code when it goes wrong instead. The passes are repeated until
+none of them finds anything:
+
+  drop       remove instructions, in halving chunks (delta debugging)
+  nop        replace instructions with nops, which keeps the addresses
+  immediate  shrink numbers towards 0
+  register   use fewer distinct registers
+
+Candidates run on --jobs simulators at once (test/reduce.py). Each of them
+stays up for the whole reduction and starts every candidate from a
+checkpoint of the preloaded original, so an attempt costs little more than
+the cycles of the program itself. The reduced program is run once more from
+a full reset before it's written out.
+
+  tools/reduce.py build/gen/prog42.s
+  tools/reduce.py prog.s --cycles 20000 --jobs 8 --data 0x10000 data.bin
+  tools/reduce.py prog.s --signature "exception Overflow"
+
+The output goes to build/reduce/<name>/: reduced.s, and test.py, a
+@cocotb.test() to paste into test/core.py which fails until the bug is
+fixed. The workers' logs are next to them.
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT = os.path.join(ROOT, "build", "reduce")
+
+sys.path.insert(0, os.path.join(ROOT, "test"))
+from tb import asm  # noqa: E402
+
+# Candidates per worker in every job. Bigger wastes runs after the first
+# success, smaller waits on the slowest worker more often
+PER_WORKER = 4
+
+REGISTER = re.compile(r"\$\w+")
+NUMBER = re.compile(r"^(-?)(0x[0-9a-fA-F]+|\d+)(.*)$")
+
+
+class WorkerError(Exception):
+    pass
+
+
+def normalize(source):
+    """The program as one label or instruction per line, without comments"""
+    lines = []
+    for line in source.splitlines():
+        label, mnemonic, operands = asm.parse(line)
+        if label is not None:
+            lines.append(f"{label}:")
+        if mnemonic is not None:
+            lines.append(f"{mnemonic} {', '.join(operands)}".strip())
+    return lines
+
+
+def is_label(line):
+    return line.endswith(":")
+
+
+def assemble(lines, base):
+    try:
+        return tuple(asm.assemble(lines, base).words)
+    except asm.AsmError:
+        return None
+
+
+def instructions(lines):
+    return [i for i, line in enumerate(lines) if not is_label(line)]
+
+
+def chunks(lines, n, replace):
+    """ddmin's candidates at granularity n: every chunk of instructions
+    removed, or replaced with nops"""
+    indices = [i for i in instructions(lines) if not replace or lines[i] != "nop"]
+    if not indices:
+        return
+    size = math.ceil(len(indices) / n)
+    for start in range(0, len(indices), size):
+        chunk = set(indices[start:start + size])
+        if replace:
+            yield [("nop" if i in chunk else line) for i, line in enumerate(lines)]
+        else:
+            yield [line for i, line in enumerate(lines) if i not in chunk]
+
+
+def shrink(value):
+    """Smaller values to try instead of value, smallest first"""
+    return [v for v in dict.fromkeys([0, int(value / 2)]) if v != value]
+
+
+def immediates(lines):
+    """Every instruction with one of its numbers made smaller"""
+    for i in instructions(lines):
+        _, mnemonic, operands = asm.parse(lines[i])
+        if mnemonic in (".space", ".word"):
+            continue
+        for k, operand in enumerate(operands):
+            match = NUMBER.match(operand)
+            if match is None:
+                continue
+            sign, digits, rest = match.groups()
+            value = int(sign + digits, 0)
+            for smaller in shrink(value):
+                text = hex(smaller) if digits.startswith("0x") and smaller >= 0 else str(smaller)
+                ops = list(operands)
+                ops[k] = text + rest
+                yield lines[:i] + [f"{mnemonic} {', '.join(ops)}"] + lines[i + 1:]
+
+
+def registers(lines):
+    """{register: number} of the integer and of the float registers used"""
+    used = ({}, {})
+    for i in instructions(lines):
+        for token in REGISTER.findall(lines[i]):
+            if token in asm.REGISTERS:
+                used[0][token] = asm.REGISTERS[token]
+            elif token in asm.FLOAT_REGISTERS:
+                used[1][token] = asm.FLOAT_REGISTERS[token]
+    return used
+
+
+def rename(lines, names, to):
+    def replace(match):
+        return to if match.group(0) in names else match.group(0)
+    return [line if is_label(line) else REGISTER.sub(replace, line) for line in lines]
+
+
+def collapses(lines):
+    """Every register replaced by a lower numbered one that is already used,
+    or $zero, highest first"""
+    ints, floats = registers(lines)
+    for used, prefix, lowest in ((ints, "$", [0]), (floats, "$f", [])):
+        numbers = sorted(set(used.values()) | set(lowest))
+        for old in reversed(numbers):
+            names = {name for name, number in used.items() if number == old}
+            if not names:
+                continue
+            for new in numbers:
+                if new >= old:
+                    break
+                yield rename(lines, names, f"{prefix}{new}")
+
+
+def unreferenced_labels(lines):
+    text = "\n".join(line for line in lines if not is_label(line))
+    return [
+        i for i, line in enumerate(lines)
+        if is_label(line) and re.search(rf"(?<![\w.$]){re.escape(line[:-1])}(?![\w.$])", text) is None
+    ]
+
+
+class Pool:
+    """Simulators running test/reduce.py, each with its own directory to
+    exchange jobs through"""
+
+    def __init__(self, directory, jobs, setup):
+        self.dirs = [os.path.join(directory, f"worker{k}") for k in range(jobs)]
+        self.setup = setup
+        self.procs = []
+        self.jobs = [0] * jobs
+
+    def start(self):
+        for k, directory in enumerate(self.dirs):
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+            with open(os.path.join(directory, "setup.json"), "w") as f:
+                json.dump(self.setup, f)
+            log = open(os.path.join(directory, "log.txt"), "w")
+            env = dict(os.environ, R4300_REDUCE_WORKER=directory)
+            self.procs.append(subprocess.Popen(
+                ["swim", "test", "reduce.py"], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT))
+            # The first one builds and makes the checkpoint, the rest only
+            # start after it so they don't build at the same time
+            if k == 0:
+                self.wait(0, "ready")
+        for k in range(1, len(self.dirs)):
+            self.wait(k, "ready")
+
+    def wait(self, k, name):
+        path = os.path.join(self.dirs[k], name)
+        while not os.path.exists(path):
+            if self.procs[k].poll() is not None:
+                with open(os.path.join(self.dirs[k], "log.txt")) as f:
+                    tail = "".join(f.readlines()[-20:])
+                raise WorkerError(f"worker {k} exited with {self.procs[k].returncode}:\n{tail}")
+            time.sleep(0.05)
+        with open(path) as f:
+            return json.load(f)
+
+    def run(self, programs, cycles, cold=False):
+        """The signature of every program"""
+        size = math.ceil(len(programs) / len(self.dirs))
+        slices = [programs[i:i + size] for i in range(0, len(programs), size)]
+        for k, part in enumerate(slices):
+            path = os.path.join(self.dirs[k], f"job-{self.jobs[k]}.json")
+            with open(f"{path}.tmp", "w") as f:
+                json.dump({"cycles": cycles, "cold": cold, "programs": [list(p) for p in part]}, f)
+            os.replace(f"{path}.tmp", path)
+
+        signatures = []
+        for k in range(len(slices)):
+            signatures += self.wait(k, f"result-{self.jobs[k]}.json")["signatures"]
+            self.jobs[k] += 1
+        return signatures
+
+    def close(self):
+        for directory in self.dirs:
+            if os.path.isdir(directory):
+                open(os.path.join(directory, "stop"), "w").close()
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+class Reducer:
+    def __init__(self, pool, base, cycles, signature):
+        self.pool = pool
+        self.base = base
+        self.cycles = cycles
+        self.signature = signature
+        # words -> signature, so nothing runs twice
+        self.seen = {}
+        self.attempts = 0
+
+    def first(self, lines, candidates):
+        """The first candidate, in order, which still fails the same way.
+        Every pass makes the program strictly smaller by its own measure, so
+        anything that assembles to the same words is no progress"""
+        current = assemble(lines, self.base)
+        batch = []
+        for candidate in candidates:
+            words = assemble(candidate, self.base)
+            if words is None or words == current:
+                continue
+            if words in self.seen:
+                if self.seen[words] == self.signature:
+                    return candidate
+                continue
+            batch.append((candidate, words))
+            if len(batch) == PER_WORKER * len(self.pool.dirs):
+                found = self.try_batch(batch)
+                if found is not None:
+                    return found
+                batch = []
+        return self.try_batch(batch) if batch else None
+
+    def try_batch(self, batch):
+        unique = list({words: lines for lines, words in batch}.items())
+        signatures = self.pool.run([words for words, _ in unique], self.cycles)
+        self.attempts += len(unique)
+        for (words, _), signature in zip(unique, signatures):
+            self.seen[words] = signature
+        for lines, words in batch:
+            if self.seen[words] == self.signature:
+                return lines
+        return None
+
+    def ddmin(self, lines, replace):
+        n = 2
+        while True:
+            count = len([i for i in instructions(lines) if not replace or lines[i] != "nop"])
+            if count == 0:
+                return lines
+            n = min(n, count)
+            found = self.first(lines, chunks(lines, n, replace))
+            if found is not None:
+                lines = found
+                n = max(n - 1, 2)
+            elif n == count:
+                return lines
+            else:
+                n = min(2 * n, count)
+
+    def greedy(self, lines, candidates):
+        while (found := self.first(lines, candidates(lines))) is not None:
+            lines = found
+        return lines
+
+    def reduce(self, lines):
+        passes = [
+            ("drop", lambda lines: self.ddmin(lines, replace=False)),
+            ("nop", lambda lines: self.ddmin(lines, replace=True)),
+            ("immediate", lambda lines: self.greedy(lines, immediates)),
+            ("register", lambda lines: self.greedy(lines, collapses)),
+        ]
+        changed = True
+        while changed:
+            changed = False
+            for name, run in passes:
+                before = lines
+                lines = run(lines)
+                if lines != before:
+                    changed = True
+                print(f"{name}: {len(instructions(lines))} instructions, {self.attempts} attempts", file=sys.stderr)
+        unused = set(unreferenced_labels(lines))
+        return [line for i, line in enumerate(lines) if i not in unused]
+
+
+def indent(lines):
+    return "\n".join(f"        {line}" if is_label(line) else f"            {line}" for line in lines)
+
+
+def regression(name, source, signature, lines, data, cycles):
+    """A test for test/core.py, which passes once the program does"""
+    data_arg = ""
+    if data:
+        items = ", ".join(f"({addr:#x}, open({path!r}, 'rb').read())" for addr, path in data)
+        data_arg = f"data=[{items}]"
+    return f'''@cocotb.test()
+@logged
+async def reduced_{name}(dut):
+    """Reduced by tools/reduce.py from {source}, which ended with {signature}"""
+    c = Core(dut)
+
+    image = assemble(\'\'\'
+{indent(lines)}
+    \'\'\').image({data_arg})
+
+    await c.start(image.icache, image.dcache)
+
+    host = Host(c.o)
+    for _ in range({cycles}):
+        await c.clock()
+        assert not c.status().startswith("ExceptionWB("), c.status()
+        if host.sample():
+            break
+    assert host.exit_code == 0, f"exit code: {{host.exit_code}}, console: {{host.console!r}}"
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("program", help="assembly for test/tb/asm.py")
+    parser.add_argument("--data", nargs=2, action="append", metavar=("ADDR", "FILE"), default=[],
+                        help="preload FILE into the dcache at ADDR, can be repeated")
+    parser.add_argument("--base", type=lambda text: int(text, 0), default=asm.RESET_VECTOR,
+                        help="load address of the program (default: the reset vector)")
+    parser.add_argument("--cycles", type=int, default=10_000, help="cycles before a run counts as a timeout, or a hang")
+    parser.add_argument("--signature", help="the failure to keep, like 'exit 3' (default: what the program does)")
+    parser.add_argument("-j", "--jobs", type=int, default=min(4, os.cpu_count() or 1), help="simulators to run at once")
+    parser.add_argument("--name", help="name of the output directory and the test (default: from the program)")
+    args = parser.parse_args()
+
+    with open(args.program) as f:
+        lines = normalize(f.read())
+    data = [(int(addr, 0), os.path.abspath(path)) for addr, path in args.data]
+    contents = []
+    for addr, path in data:
+        with open(path, "rb") as f:
+            contents.append([addr, f.read().hex()])
+
+    words = assemble(lines, args.base)
+    if words is None:
+        asm.assemble(lines, args.base)  # for the error
+
+    name = args.name or re.sub(r"\W", "_", os.path.splitext(os.path.basename(args.program))[0])
+    directory = os.path.join(OUTPUT, name)
+    os.makedirs(directory, exist_ok=True)
+
+    pool = Pool(directory, args.jobs, {"base": args.base, "data": contents, "program": list(words)})
+    try:
+        pool.start()
+        [signature] = pool.run([words], args.cycles, cold=True)
+        print(f"{args.program}: {len(instructions(lines))} instructions, {signature}", file=sys.stderr)
+        if signature == "pass":
+            print("the program passes, nothing to reduce", file=sys.stderr)
+            return 1
+        if signature == "timeout":
+            print("the program runs on without exiting or getting stuck at one pc, and so would any "
+                  "candidate that loses its exit; make it exit with a code when it goes wrong", file=sys.stderr)
+            return 1
+        if args.signature is not None and signature != args.signature:
+            print(f"the program ends with {signature}, not {args.signature}", file=sys.stderr)
+            return 1
+
+        reducer = Reducer(pool, args.base, args.cycles, signature)
+        reduced = reducer.reduce(lines)
+
+        [check] = pool.run([assemble(reduced, args.base)], args.cycles, cold=True)
+        if check != signature:
+            print(f"the reduced program ends with {check} after a full reset, not {signature}", file=sys.stderr)
+            return 1
+    except WorkerError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        pool.close()
+
+    with open(os.path.join(directory, "reduced.s"), "w") as f:
+        f.write(f"# {args.program} reduced from {len(instructions(lines))} instructions, ends with {signature}\n")
+        f.write("\n".join(reduced) + "\n")
+    test = regression(name, args.program, signature, reduced, data, args.cycles)
+    with open(os.path.join(directory, "test.py"), "w") as f:
+        f.write(test)
+
+    print(f"{len(instructions(reduced))} instructions after {reducer.attempts} attempts, "
+          f"written to {os.path.relpath(directory, ROOT)}", file=sys.stderr)
+    print(test)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
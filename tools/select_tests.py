@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Runs only the test files a change can affect.
+
+Every test file names its top with a `#top=` header, and every Spade module
+names what it needs with `use lib::...`, so the modules behind each test are
+known without building anything. A changed file selects:
+
+  src/<mod>.spade   the tests whose top depends on <mod>, directly or not
+  test/<file>.py    that test file
+  test/tb/<x>.py    the test files importing tb.<x>, directly or not, and
+                    for tb/__init__.py every test file using tb
+  tools/, *.md      nothing
+
+Anything else (swim.toml, swim.lock, a tb module no test file imports, ...)
+runs everything, as does --all.
+
+  tools/select_tests.py                   # changes against HEAD, and new files in src/ and test/
+  tools/select_tests.py --base main       # changes since main
+  tools/select_tests.py --list --explain  # what would run and why, without running it
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+TEST = os.path.join(ROOT, "test")
+
+# Spade's root module, where lib::cpu and friends live
+ROOT_MODULE = "main"
+
+IGNORED_DIRS = ("tools/", "build/")
+IGNORED_SUFFIXES = (".md", ".jsonl")
+
+USE = re.compile(r"^\s*use\s+lib::(\w+)", re.MULTILINE)
+TOP = re.compile(r"^#top=(\S+)", re.MULTILINE)
+TB_IMPORT = re.compile(r"^\s*(?:from\s+tb\.(\w+)\s+import|from\s+tb\s+import\s+([\w, ]+)|import\s+tb\.(\w+))", re.MULTILINE)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def module_graph():
+    """{module: modules it uses}"""
+    modules = {name[:-len(".spade")] for name in os.listdir(SRC) if name.endswith(".spade")}
+    graph = {}
+    for module in modules:
+        deps = set()
+        for name in USE.findall(read(os.path.join(SRC, f"{module}.spade"))):
+            # lib::<item> without a module is something in main.spade
+            deps.add(name if name in modules else ROOT_MODULE)
+        deps.discard(module)
+        graph[module] = deps
+    return graph
+
+
+def closure(graph, start):
+    seen = set()
+    todo = [start]
+    while todo:
+        node = todo.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        todo.extend(graph.get(node, ()))
+    return seen
+
+
+def tb_imports(path):
+    imports = set()
+    for module, names, plain in TB_IMPORT.findall(read(path)):
+        if module or plain:
+            imports.add(module or plain)
+        else:
+            imports.update(name.strip() for name in names.split(",") if name.strip())
+    return imports
+
+
+def tests():
+    """{test file: (top module, tb modules it uses)}"""
+    tb_dir = os.path.join(TEST, "tb")
+    tb_graph = {
+        name[:-3]: tb_imports(os.path.join(tb_dir, name))
+        for name in os.listdir(tb_dir) if name.endswith(".py")
+    }
+    found = {}
+    for name in sorted(os.listdir(TEST)):
+        path = os.path.join(TEST, name)
+        if not name.endswith(".py") or not os.path.isfile(path):
+            continue
+        match = TOP.search(read(path))
+        if match is None:
+            continue
+        top = match.group(1)
+        module = top.split("::")[0] if "::" in top else ROOT_MODULE
+        tb = set()
+        for imported in tb_imports(path):
+            tb |= closure(tb_graph, imported)
+        # Importing anything from tb runs tb/__init__.py, and whatever it imports
+        if tb:
+            tb |= closure(tb_graph, "__init__")
+        found[name] = (module, tb)
+    return found
+
+
+def changed_files(base):
+    def git(*args):
+        out = subprocess.run(["git", *args], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+        return [line for line in out.splitlines() if line]
+    # new files only matter once they're somewhere the tests can see them
+    untracked = git("ls-files", "--others", "--exclude-standard", "--", "src", "test")
+    return sorted(set(git("diff", "--name-only", base)) | set(untracked))
+
+
+def select(changed):
+    """Returns ({test file: [reasons]}, full run reason or None)"""
+    graph = module_graph()
+    found = tests()
+    deps = {name: closure(graph, module) for name, (module, _) in found.items()}
+
+    selected = {}
+    def add(test, reason):
+        selected.setdefault(test, []).append(reason)
+
+    for path in changed:
+        if path.startswith(IGNORED_DIRS) or path.endswith(IGNORED_SUFFIXES):
+            continue
+        directory, name = os.path.split(path)
+        stem = os.path.splitext(name)[0]
+        if directory == "src" and name.endswith(".spade"):
+            for test, modules in deps.items():
+                if stem in modules:
+                    add(test, path)
+        elif directory == "test" and name.endswith(".py"):
+            if name in found:
+                add(name, path)
+        elif directory == "test/tb" and name.endswith(".py"):
+            users = [test for test, (_, tb) in found.items() if stem in tb]
+            # Not imported in a way we can see, so it could be anywhere
+            if not users:
+                return {}, path
+            for test in users:
+                add(test, path)
+        else:
+            return {}, path
+    return selected, None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base", default="HEAD", help="git revision to diff against")
+    parser.add_argument("--all", action="store_true", help="run everything")
+    parser.add_argument("--list", action="store_true", help="only print the selected test files")
+    parser.add_argument("--explain", action="store_true", help="print the changed files selecting each test")
+    parser.add_argument("swim_args", nargs="*", help="passed on to swim test")
+    args = parser.parse_args()
+
+    everything = sorted(tests())
+    if args.all:
+        selected, full = {}, "--all"
+    else:
+        selected, full = select(changed_files(args.base))
+
+    if full is not None:
+        names = everything
+        print(f"running everything because of {full}", file=sys.stderr)
+    else:
+        names = sorted(selected)
+        skipped = sorted(set(everything) - set(names))
+        print(f"running {len(names)} of {len(everything)} test files, skipping {', '.join(skipped) or 'none'}", file=sys.stderr)
+
+    for name in names:
+        reasons = selected.get(name)
+        if args.explain and reasons:
+            print(f"{name}: {', '.join(reasons)}")
+        else:
+            print(name)
+
+    if args.list or not names:
+        return 0
+    # swim takes test files by name
+    return subprocess.run(["swim", "test", *args.swim_args, *names], cwd=ROOT).returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
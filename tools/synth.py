@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""Synthesis and timing benchmark for the test tops.
+
+Builds the design with swim, then pushes every top through yosys (synth_ecp5)
+and nextpnr-ecp5 in out-of-context mode. Area (LUTs, FFs, BRAMs) and the
+estimated fmax of each clock domain end up in a json report, which can be
+compared against a stored baseline.
+
+  tools/synth.py                       # synthesise everything
+  tools/synth.py mask_test byte_mux    # just these tops
+  tools/synth.py adder_inferred adder_carry_select adder_prefix
+  tools/synth.py --save-baseline       # accept the current numbers
+
+Note that tops with unregistered inputs (test_adder, mask_test, ...) will
+report the input-to-register paths as well. The *_bench tops register their
+inputs and outputs, so their fmax is a pure reg-to-reg number.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUILD_DIR = os.path.join(ROOT, "build")
+VERILOG = os.path.join(BUILD_DIR, "spade.sv")
+OUT_DIR = os.path.join(BUILD_DIR, "synth")
+BASELINE = os.path.join(ROOT, "tools", "synth_baseline.json")
+
+PROJECT = "r4300"
+
+# name -> (spade path, mangled)
+# Tops marked #[no_mangle] keep their plain name in the generated verilog,
+# everything else is emitted as an escaped identifier with the full path.
+TOPS = {
+    "test_adder": ("pipe::test_adder", True),
+    "test_shifter": ("pipe::test_shifter", True),
+    "mask_test": ("dcache::mask_test", False),
+    "byte_mux": ("dcache::byte_mux_bench", False),
+    "byte_mux2": ("dcache::byte_mux2_bench", False),
+    "adder_inferred": ("pipe::adder_inferred_bench", False),
+    "adder_carry_select": ("pipe::adder_carry_select_bench", False),
+    "adder_prefix": ("pipe::adder_prefix_bench", False),
+    "shifter_inferred": ("pipe::shifter_inferred_bench", False),
+    "shifter_barrel": ("pipe::shifter_barrel_bench", False),
+    "icache_test_harness": ("icache::icache_test_harness", False),
+    "test_harness": ("dcache::test_harness", False),
+    "cpu": ("cpu", True),
+    "selfcheck": ("selfcheck::selfcheck", True),
+}
+
+# nextpnr cell types we care about
+CELLS = {
+    "lut": "TRELLIS_COMB",
+    "ff": "TRELLIS_FF",
+    "bram": "DP16KD",
+    "mult": "MULT18X18D",
+}
+
+
+def verilog_name(path, mangled):
+    name = path.split("::")[-1]
+    if mangled:
+        return f"\\{PROJECT}::{path} "
+    return name
+
+
+def run(cmd, log):
+    with open(log, "w") as f:
+        result = subprocess.run(cmd, stdout=f, stderr=subprocess.STDOUT, cwd=ROOT)
+    if result.returncode != 0:
+        raise RuntimeError(f"{cmd[0]} failed, see {log}")
+
+
+def synth(name, args):
+    path, mangled = TOPS[name]
+    top = verilog_name(path, mangled)
+    prefix = os.path.join(OUT_DIR, name)
+
+    script = "\n".join([
+        f"read_verilog -sv {VERILOG}",
+        f"synth_ecp5 -top {top} -json {prefix}.json",
+        f"tee -q -o {prefix}.stat.json stat -json",
+    ])
+    with open(f"{prefix}.ys", "w") as f:
+        f.write(script + "\n")
+
+    start = time.time()
+    run(["yosys", "-q", "-s", f"{prefix}.ys"], f"{prefix}.yosys.log")
+    synth_time = time.time() - start
+
+    result = {
+        "top": path,
+        "synth_seconds": round(synth_time, 2),
+    }
+
+    if args.no_pnr:
+        with open(f"{prefix}.stat.json") as f:
+            stat = json.load(f)
+        cells = stat["design"]["num_cells_by_type"]
+        result["lut"] = sum(n for c, n in cells.items() if c.startswith("LUT"))
+        result["ff"] = sum(n for c, n in cells.items() if c.startswith("TRELLIS_FF"))
+        result["bram"] = cells.get("DP16KD", 0)
+        result["mult"] = cells.get("MULT18X18D", 0)
+        return result
+
+    start = time.time()
+    run([
+        "nextpnr-ecp5",
+        f"--{args.device}",
+        "--out-of-context",
+        "--json", f"{prefix}.json",
+        "--report", f"{prefix}.pnr.json",
+        "--freq", str(args.freq),
+        "--seed", str(args.seed),
+    ], f"{prefix}.nextpnr.log")
+    result["pnr_seconds"] = round(time.time() - start, 2)
+
+    with open(f"{prefix}.pnr.json") as f:
+        report = json.load(f)
+
+    for key, cell in CELLS.items():
+        result[key] = report["utilization"].get(cell, {}).get("used", 0)
+
+    # One entry per clock domain. cpu has both phase1 and phase2
+    result["fmax_mhz"] = {
+        clk: round(v["achieved"], 2) for clk, v in report.get("fmax", {}).items()
+    }
+
+    return result
+
+
+def fmax(result):
+    clocks = result.get("fmax_mhz", {})
+    return min(clocks.values()) if clocks else None
+
+
+def compare(results, baseline):
+    print(f"{'top':<22}{'lut':>16}{'ff':>16}{'bram':>10}{'fmax':>20}")
+    for name, r in results.items():
+        if "error" in r:
+            print(f"{name:<22}  {r['error']}")
+            continue
+        b = baseline.get(name, {})
+
+        def delta(key):
+            now = r.get(key)
+            old = b.get(key)
+            if now is None:
+                return "-"
+            if old is None or old == 0:
+                return f"{now}"
+            return f"{now} ({100.0 * (now - old) / old:+.1f}%)"
+
+        now_f = fmax(r)
+        old_f = fmax(b)
+        if now_f is None:
+            f = "-"
+        elif old_f is None:
+            f = f"{now_f:.1f}"
+        else:
+            f = f"{now_f:.1f} ({100.0 * (now_f - old_f) / old_f:+.1f}%)"
+
+        print(f"{name:<22}{delta('lut'):>16}{delta('ff'):>16}{delta('bram'):>10}{f:>20}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tops", nargs="*", help=f"tops to synthesise (default: all of {', '.join(TOPS)})")
+    parser.add_argument("-o", "--output", default=os.path.join(OUT_DIR, "report.json"))
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with these results")
+    parser.add_argument("--no-build", action="store_true", help="don't run swim build first")
+    parser.add_argument("--no-pnr", action="store_true", help="yosys only, no place and route or timing")
+    parser.add_argument("--device", default="85k", help="ecp5 device size passed to nextpnr (default: 85k)")
+    parser.add_argument("--freq", type=float, default=50.0, help="target frequency in MHz")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    tops = args.tops or list(TOPS)
+    for name in tops:
+        if name not in TOPS:
+            parser.error(f"unknown top {name}")
+
+    needed = ["yosys"] + ([] if args.no_pnr else ["nextpnr-ecp5"]) + ([] if args.no_build else ["swim"])
+    missing = [tool for tool in needed if shutil.which(tool) is None]
+    if missing:
+        print(f"missing tools: {', '.join(missing)}", file=sys.stderr)
+        return 1
+
+    if not args.no_build:
+        subprocess.run(["swim", "build"], cwd=ROOT, check=True)
+
+    os.makedirs(OUT_DIR, exist_ok=True)
+
+    results = {}
+    for name in tops:
+        print(f"synthesising {name}...", file=sys.stderr)
+        try:
+            results[name] = synth(name, args)
+        except RuntimeError as e:
+            results[name] = {"top": TOPS[name][0], "error": str(e)}
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    compare(results, baseline)
+
+    if args.save_baseline:
+        baseline.update({k: v for k, v in results.items() if "error" not in v})
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+
+    return 1 if any("error" in r for r in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
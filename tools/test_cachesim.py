@@ -0,0 +1,81 @@
+"""tools/cachesim.py against a plain one access at a time model.
+
+    python -m pytest tools
+"""
+
+import numpy as np
+import pytest
+
+import cachesim
+
+
+def reference(cache, addrs, writes=None):
+    """(buffer hits, hits, misses, writebacks) of a fresh cache like cache"""
+    tags = {}
+    dirty = {}
+    last_buffer = None
+    buffer_hits = hits = misses = writebacks = 0
+    for i, addr in enumerate(int(a) for a in addrs):
+        write = writes is not None and bool(writes[i])
+        if cache.fetch_buffer:
+            block = addr // cache.fetch_buffer
+            if block == last_buffer:
+                buffer_hits += 1
+                continue
+            last_buffer = block
+        index = (addr // cache.line) % cache.sets
+        tag = addr >> cache.tag_shift
+        if tags.get(index) == tag:
+            hits += 1
+        else:
+            misses += 1
+            if dirty.get(index):
+                writebacks += 1
+            tags[index] = tag
+            dirty[index] = False
+        if write:
+            dirty[index] = True
+    return buffer_hits, hits, misses, writebacks
+
+
+def counts(cache):
+    return cache.buffer_hits, cache.hits, cache.misses, cache.writebacks
+
+
+@pytest.mark.parametrize("batch", [7, 64, 5000])
+@pytest.mark.parametrize("size,line", [(256, 16), (512, 32), (8 << 10, 16)])
+def test_dcache_matches_reference(size, line, batch):
+    rng = np.random.default_rng(size + line + batch)
+    addrs = rng.integers(0, 16 << 10, size=3000, dtype=np.uint64) & ~np.uint64(7)
+    # and some runs over the same lines, so there are hits
+    addrs[::3] = np.uint64(0x100) + (np.arange(1000, dtype=np.uint64) % np.uint64(40)) * np.uint64(8)
+    writes = rng.random(len(addrs)) < 0.3
+
+    cache = cachesim.dcache(size, line)
+    for start in range(0, len(addrs), batch):
+        cache.access(addrs[start:start + batch], writes[start:start + batch])
+    assert counts(cache) == reference(cache, addrs, writes)
+
+
+@pytest.mark.parametrize("batch", [5, 1000])
+def test_icache_matches_reference(batch):
+    trace = cachesim.synthetic_trace(4000)
+    fetches = trace["addr"][trace["kind"] == cachesim.FETCH]
+
+    cache = cachesim.icache(1 << 10, 32)
+    for start in range(0, len(fetches), batch):
+        cache.access(fetches[start:start + batch])
+    assert counts(cache) == reference(cache, fetches)
+
+
+def test_simulate_sweeps_each_cache():
+    trace = cachesim.synthetic_trace(2000)
+    icaches = [cachesim.icache(size, 32) for size in (1 << 10, 4 << 10)]
+    dcaches = [cachesim.dcache(2 << 10, 16)]
+    cachesim.simulate(trace, icaches, dcaches, batch=300)
+
+    fetch = trace["kind"] == cachesim.FETCH
+    for c in icaches:
+        assert counts(c) == reference(c, trace["addr"][fetch])
+    data = trace[~fetch]
+    assert counts(dcaches[0]) == reference(dcaches[0], data["addr"], data["kind"] == cachesim.STORE)
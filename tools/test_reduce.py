@@ -0,0 +1,93 @@
+"""The passes of tools/reduce.py, on a pool that fails by looking at the words.
+
+    python -m pytest tools
+"""
+
+import reduce
+from reduce import asm
+
+
+class FakePool:
+    """Fails every program that has all the instructions in needed"""
+
+    def __init__(self, *needed):
+        self.dirs = ["worker0", "worker1"]
+        self.needed = [asm.ins(line) for line in needed]
+        self.runs = 0
+
+    def run(self, programs, cycles, cold=False):
+        self.runs += len(programs)
+        return ["exit 1" if all(word in words for word in self.needed) else "pass" for words in programs]
+
+
+def reducer(*needed):
+    return reduce.Reducer(FakePool(*needed), asm.RESET_VECTOR, 100, "exit 1")
+
+
+def test_chunks_drop():
+    lines = ["start:", "ori $1, $0, 1", "ori $2, $0, 2", "ori $3, $0, 3", "ori $4, $0, 4"]
+    assert list(reduce.chunks(lines, 2, replace=False)) == [
+        ["start:", "ori $3, $0, 3", "ori $4, $0, 4"],
+        ["start:", "ori $1, $0, 1", "ori $2, $0, 2"],
+    ]
+
+
+def test_chunks_replace_skips_nops():
+    lines = ["nop", "ori $1, $0, 1", "nop", "ori $2, $0, 2"]
+    assert list(reduce.chunks(lines, 2, replace=True)) == [
+        ["nop", "nop", "nop", "ori $2, $0, 2"],
+        ["nop", "ori $1, $0, 1", "nop", "nop"],
+    ]
+    assert list(reduce.chunks(["nop", "nop"], 2, replace=True)) == []
+
+
+def test_immediates():
+    assert list(reduce.immediates(["ori $1, $0, 0x40"])) == [["ori $1, $0, 0x0"], ["ori $1, $0, 0x20"]]
+    assert list(reduce.immediates(["addiu $1, $0, -8"])) == [["addiu $1, $0, 0"], ["addiu $1, $0, -4"]]
+    assert list(reduce.immediates(["lw $1, 8($2)"])) == [["lw $1, 0($2)"], ["lw $1, 4($2)"]]
+    assert list(reduce.immediates(["ori $1, $0, 0", ".word 5"])) == []
+
+
+def test_collapses():
+    assert list(reduce.collapses(["addu $3, $5, $3"])) == [
+        ["addu $3, $0, $3"],
+        ["addu $3, $3, $3"],
+        ["addu $0, $5, $0"],
+    ]
+    assert list(reduce.collapses(["add.d $f2, $f1, $f1"])) == [["add.d $f1, $f1, $f1"]]
+
+
+def test_unreferenced_labels():
+    lines = ["start:", "b loop", "nop", "loop:", "nop", "unused:", "nop"]
+    assert reduce.unreferenced_labels(lines) == [0, 5]
+
+
+def test_ddmin_keeps_what_fails():
+    lines = [f"ori ${n}, $0, {n}" for n in range(1, 9)]
+    r = reducer("ori $3, $0, 3", "ori $6, $0, 6")
+    assert r.ddmin(lines, replace=False) == ["ori $3, $0, 3", "ori $6, $0, 6"]
+    assert r.ddmin(lines, replace=True) == [
+        "nop", "nop", "ori $3, $0, 3", "nop", "nop", "ori $6, $0, 6", "nop", "nop",
+    ]
+
+
+def test_ddmin_of_nothing_needed():
+    r = reducer()
+    assert r.ddmin(["ori $1, $0, 1", "ori $2, $0, 2"], replace=False) == []
+
+
+def test_first_runs_nothing_twice():
+    r = reducer("ori $2, $0, 2")
+    lines = ["ori $1, $0, 1", "ori $2, $0, 2"]
+    # the second candidate is no change, and the third was already tried
+    candidates = [["ori $2, $0, 2"], list(lines), ["ori $2, $0, 2"]]
+    assert r.first(lines, iter(candidates)) == ["ori $2, $0, 2"]
+    assert r.pool.runs == 1
+    assert r.first(lines, iter(candidates)) == ["ori $2, $0, 2"]
+    assert r.pool.runs == 1
+
+
+def test_reduce():
+    lines = ["start:", "ori $1, $0, 1", "ori $2, $0, 0x30", "ori $3, $0, 3", "b start", "nop"]
+    r = reducer("ori $2, $0, 0x30")
+    assert r.reduce(lines) == ["ori $2, $0, 0x30"]
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Toggle counts per module from a simulation waveform.
+
+Counts how many bits flipped on every signal of a VCD file, and adds them up
+per module instance. Together with the sram counters of test/tb/activity.py
+this gives a rough idea of where the dynamic power goes. Transitions to or
+from x and z aren't counted.
+
+  tools/toggles.py build/cpu.vcd                  # the 20 busiest modules
+  tools/toggles.py build/cpu.vcd --depth 2        # fold everything below two levels
+  tools/toggles.py build/cpu.vcd --since 100000   # skip reset and preloading
+  tools/toggles.py build/cpu.vcd --workload loop  # also write build/activity/loop.toggles.json
+
+`python test/tb/activity.py` prints the toggles along with the sram counts of
+the workload of the same name.
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ACTIVITY_DIR = os.path.join(ROOT, "build", "activity")
+
+
+def parse(path, since=0):
+    """Returns ({signal id: (bit flips, width)}, {signal id: [scope, ...]}, end time)"""
+    scopes = defaultdict(list)
+    widths = {}
+    stack = []
+    values = {}
+    flips = defaultdict(int)
+    time = 0
+
+    with open(path) as f:
+        # Header: scopes and vars, up to $enddefinitions
+        for line in f:
+            words = line.split()
+            if not words:
+                continue
+            if words[0] == "$scope":
+                stack.append(words[2])
+            elif words[0] == "$upscope":
+                stack.pop()
+            elif words[0] == "$var":
+                # $var wire 8 ! name [7:0] $end. The same id can show up in several scopes
+                ident = words[3]
+                widths[ident] = int(words[2])
+                scopes[ident].append(".".join(stack))
+            elif words[0] == "$enddefinitions":
+                break
+
+        for line in f:
+            c = line[0] if line else ""
+            if c == "#":
+                time = int(line[1:])
+                continue
+            if c in "01xzXZ":
+                value, ident = line[0], line[1:].strip()
+            elif c in "bB":
+                value, ident = line[1:].split()
+            else:
+                # $dumpvars and friends, and reals which we don't count
+                continue
+
+            old = values.get(ident)
+            values[ident] = value
+            if old is None or time < since:
+                continue
+            try:
+                flips[ident] += bin(int(old, 2) ^ int(value, 2)).count("1")
+            except ValueError:
+                # x or z somewhere
+                pass
+
+    return {ident: (flips[ident], widths[ident]) for ident in widths}, scopes, time
+
+
+def per_module(signals, scopes, depth=None):
+    modules = defaultdict(int)
+    for ident, (count, _) in signals.items():
+        # ports show up as the same id in both the parent and the child,
+        # only count them once per folded module
+        if depth is not None:
+            folded = {".".join(scope.split(".")[:depth]) for scope in scopes[ident]}
+        else:
+            folded = set(scopes[ident])
+        for scope in folded:
+            modules[scope] += count
+    return dict(modules)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("vcd")
+    parser.add_argument("--depth", type=int, help="add up everything below this many levels")
+    parser.add_argument("--since", type=int, default=0, help="only count changes from this simulation time on")
+    parser.add_argument("--top", type=int, default=20, help="modules to print (default: 20)")
+    parser.add_argument("--workload", help="write the counts to build/activity/<workload>.toggles.json")
+    args = parser.parse_args()
+
+    signals, scopes, end = parse(args.vcd, args.since)
+    modules = per_module(signals, scopes, args.depth)
+
+    total = sum(modules.values())
+    print(f"{len(signals)} signals, {total} toggles from {args.since} to {end}")
+    for module, count in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{module:<60}{count:>12}{100.0 * count / max(total, 1):7.1f}%")
+
+    if args.workload:
+        os.makedirs(ACTIVITY_DIR, exist_ok=True)
+        with open(os.path.join(ACTIVITY_DIR, f"{args.workload}.toggles.json"), "w") as f:
+            json.dump({"vcd": args.vcd, "since": args.since, "end": end, "modules": modules}, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())